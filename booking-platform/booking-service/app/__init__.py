@@ -1,3 +1,10 @@
+from app.const import GEVENT_ENABLED
+
+# Must come before anything that imports socket, ssl or threading
+if GEVENT_ENABLED:
+    from app.green import patch_for_gevent
+    patch_for_gevent()
+
 from flask import Flask, jsonify
 from flask_jwt_extended import JWTManager
 from flask_limiter import Limiter
@@ -27,6 +34,10 @@ def health_check():
         'instance': service_instance
     }), 200
 
+# Requests check out one CockroachDB connection and return it here
+from app.db import release_request_connection
+app.teardown_request(release_request_connection)
+
 from app.user_routes import user_blueprint
 app.register_blueprint(user_blueprint, url_prefix='/user')
 
@@ -38,3 +49,20 @@ app.register_blueprint(admin_blueprint)
 
 from app.booking_routes import booking_blueprint
 app.register_blueprint(booking_blueprint, url_prefix='/booking')
+
+
+# Background jobs shared by all instances
+from app.background import register_periodic_task, register_startup_task, start_background_tasks
+from app.slots import ensure_slot_schema, materialize_booking_horizon
+from app.booking_summary import upgrade_booking_summaries
+from app.holds import sweep_expired_holds
+from app.licenses import ensure_license_indexes, sweep_orphan_license_images
+from app.const import SLOT_MATERIALIZER_INTERVAL_SECONDS, HOLD_SWEEP_INTERVAL_SECONDS, LICENSE_SWEEP_INTERVAL_SECONDS
+register_startup_task("slot-schema", ensure_slot_schema)
+register_startup_task("booking-summary-schema", upgrade_booking_summaries)
+register_startup_task("license-indexes", ensure_license_indexes)
+register_periodic_task("slot-materializer", SLOT_MATERIALIZER_INTERVAL_SECONDS, materialize_booking_horizon)
+register_periodic_task("hold-sweeper", HOLD_SWEEP_INTERVAL_SECONDS, sweep_expired_holds)
+register_periodic_task("license-orphan-sweeper", LICENSE_SWEEP_INTERVAL_SECONDS, sweep_orphan_license_images)
+
+start_background_tasks()
@@ -0,0 +1,158 @@
+import logging
+import threading
+
+import redis
+
+from app.db import cockroach_connection, redis_client
+from app.const import ADMISSION_CONTROL_ENABLED, ADMISSION_COUNTER_TTL_SECONDS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ADMISSION_COUNTER_KEY = "slot_capacity:{slot_id}"
+
+# Take quantity from every counter or from none of them.
+# Returns 1 when admitted, 0 when a slot is short and -1 when a counter
+# has not been seeded yet.
+_RESERVE_SCRIPT = redis_client.register_script("""
+local missing = false
+for i, key in ipairs(KEYS) do
+    local remaining = redis.call('GET', key)
+    if not remaining then
+        missing = true
+    elseif tonumber(remaining) < tonumber(ARGV[i]) then
+        return 0
+    end
+end
+if missing then
+    return -1
+end
+for i, key in ipairs(KEYS) do
+    redis.call('DECRBY', key, ARGV[i])
+end
+return 1
+""")
+
+# Give quantity back to the counters that still exist; expired ones are
+# seeded again from the database on next use.
+_RELEASE_SCRIPT = redis_client.register_script("""
+for i, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('INCRBY', key, ARGV[i])
+    end
+end
+return 1
+""")
+
+# per-process admission counters
+_admission_stats = {"admitted": 0, "rejected": 0, "bypassed": 0, "released": 0}
+_admission_stats_lock = threading.Lock()
+
+
+def _count(field):
+    with _admission_stats_lock:
+        _admission_stats[field] += 1
+
+
+def get_admission_stats():
+    with _admission_stats_lock:
+        stats = dict(_admission_stats)
+    stats["enabled"] = ADMISSION_CONTROL_ENABLED
+    return stats
+
+
+def _counter_key(slot_id):
+    return ADMISSION_COUNTER_KEY.format(slot_id=slot_id)
+
+
+def _seed_counters(slot_ids):
+    """Load available_capacity for the slots into counters that do not exist yet"""
+    with cockroach_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT road_booking_slot_id, available_capacity
+                FROM road_booking_slots
+                WHERE road_booking_slot_id = ANY(%s::UUID[])
+            """, (list(slot_ids),))
+            rows = cursor.fetchall()
+        conn.commit()
+
+    pipe = redis_client.pipeline(transaction=False)
+    for slot_id, available in rows:
+        pipe.set(_counter_key(slot_id), available, nx=True, ex=ADMISSION_COUNTER_TTL_SECONDS)
+    pipe.execute()
+
+
+def slot_quantities(booking_lines):
+    """Sum booking line quantities per slot from (line_id, slot_id, quantity, ...) rows"""
+    slot_demand = {}
+    for line in booking_lines:
+        slot_demand[str(line[1])] = slot_demand.get(str(line[1]), 0) + line[2]
+    return slot_demand
+
+
+def reserve_slot_capacity(slot_demand):
+    """
+    Admit a booking against the Redis slot counters before it reaches the
+    database.
+
+    slot_demand maps slot id -> quantity. Returns the demand that was taken
+    from the counters (pass it to release_slot_capacity if the database step
+    fails), an empty dict when admission is off or Redis is unavailable, or
+    None when the booking should be rejected because a slot is full.
+    """
+    if not ADMISSION_CONTROL_ENABLED or not slot_demand:
+        return {}
+
+    slot_ids = list(slot_demand.keys())
+    keys = [_counter_key(slot_id) for slot_id in slot_ids]
+    quantities = [slot_demand[slot_id] for slot_id in slot_ids]
+
+    try:
+        admitted = _RESERVE_SCRIPT(keys=keys, args=quantities)
+        if admitted == -1:
+            _seed_counters(slot_ids)
+            admitted = _RESERVE_SCRIPT(keys=keys, args=quantities)
+    except Exception as e:
+        # The database still enforces capacity, so fail open
+        logger.warning(f"Admission check skipped: {str(e)}")
+        _count("bypassed")
+        return {}
+
+    if admitted == 1:
+        _count("admitted")
+        return dict(slot_demand)
+
+    if admitted == 0:
+        _count("rejected")
+        return None
+
+    # Unknown slot ids - let the database transaction report the error
+    _count("bypassed")
+    return {}
+
+
+def release_slot_capacity(slot_demand):
+    """Return capacity to the counters after a failed booking or a cancellation"""
+    if not ADMISSION_CONTROL_ENABLED or not slot_demand:
+        return
+
+    slot_ids = list(slot_demand.keys())
+    try:
+        _RELEASE_SCRIPT(keys=[_counter_key(slot_id) for slot_id in slot_ids],
+                        args=[slot_demand[slot_id] for slot_id in slot_ids])
+        _count("released")
+    except redis.RedisError as e:
+        logger.warning(f"Could not release admission counters: {str(e)}")
+
+
+def forget_slot_capacity(slot_ids):
+    """Drop counters after capacity was changed directly in the database"""
+    if not ADMISSION_CONTROL_ENABLED or not slot_ids:
+        return
+
+    try:
+        redis_client.delete(*[_counter_key(slot_id) for slot_id in slot_ids])
+    except redis.RedisError as e:
+        logger.warning(f"Could not drop admission counters: {str(e)}")
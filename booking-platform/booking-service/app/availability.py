@@ -0,0 +1,461 @@
+import json
+import logging
+import math
+import uuid
+from array import array
+from datetime import datetime, timedelta
+
+import redis
+
+from app.db import cockroach_connection, redis_client
+from app.const import AVAILABILITY_CACHE_TTL_SECONDS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of days shown in the booking window
+AVAILABILITY_HORIZON_DAYS = 7
+
+# Capacity used when a road has no hourly_capacity set
+DEFAULT_ROAD_CAPACITY = 100
+
+# Upper bound on the number of windows a route search can return
+MAX_ROUTE_WINDOWS = 48
+
+# Redis keys for the per-road, per-day availability cache
+AVAILABILITY_CACHE_KEY = "availability:{road_id}:{day}"
+AVAILABILITY_GENERATION_KEY = "availability:gen:{road_id}:{day}"
+AVAILABILITY_CACHE_HITS_KEY = "availability:stats:hits"
+AVAILABILITY_CACHE_MISSES_KEY = "availability:stats:misses"
+
+# A generation outlives any read that could still be writing back
+AVAILABILITY_GENERATION_TTL_SECONDS = 86400
+
+# Write road-day entries back only if their generation has not moved since
+# the read began, i.e. no invalidation ran in between. KEYS are cache and
+# generation key pairs; ARGV is the TTL, then the generation seen and the
+# entry for every pair. Returns the number of entries written.
+_STORE_SCRIPT = redis_client.register_script("""
+local stored = 0
+for i = 1, #KEYS / 2 do
+    local generation = redis.call('GET', KEYS[2 * i]) or ''
+    if generation == ARGV[2 * i] then
+        redis.call('SET', KEYS[2 * i - 1], ARGV[2 * i + 1], 'EX', ARGV[1])
+        stored = stored + 1
+    end
+end
+return stored
+""")
+
+
+def get_booking_horizon(now=None):
+    """
+    Return (now, window_start, window_end) for the bookable hourly grid.
+    Slot times are naive UTC, so the horizon is measured in UTC too.
+    """
+    now = now or datetime.utcnow()
+    window_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    window_end = window_start + timedelta(days=AVAILABILITY_HORIZON_DAYS)
+    return now, window_start, window_end
+
+
+def get_horizon_hours(now=None):
+    """List the start time of every future hourly slot in the booking window"""
+    now, window_start, window_end = get_booking_horizon(now)
+    hours = []
+    slot_start = window_start
+    while slot_start < window_end:
+        if slot_start > now:
+            hours.append(slot_start)
+        slot_start += timedelta(hours=1)
+    return hours
+
+
+def _valid_road_ids(road_ids):
+    """Keep the road ids that are valid UUIDs, logging the ones that are not"""
+    valid = []
+    for road_id in road_ids:
+        try:
+            uuid.UUID(str(road_id))
+            valid.append(str(road_id))
+        except ValueError:
+            logger.warning(f"Road {road_id} is not a valid id")
+    return valid
+
+
+def _cache_key(road_id, day):
+    return AVAILABILITY_CACHE_KEY.format(road_id=road_id, day=day.isoformat())
+
+
+def _generation_key(road_id, day):
+    return AVAILABILITY_GENERATION_KEY.format(road_id=road_id, day=day.isoformat())
+
+
+def _encode_day(state, day):
+    """Serialise the part of a road state that falls on the given day"""
+    return json.dumps({
+        'road_name': state['road_name'],
+        'capacity': state['capacity'],
+        'slots': {
+            slot_time.isoformat(): [slot_id, available]
+            for slot_time, (slot_id, available) in state['slots'].items()
+            if slot_time.date() == day
+        }
+    })
+
+
+def _decode_days(entries):
+    """Merge cached day entries of one road back into a single road state"""
+    state = None
+    for entry in entries:
+        entry = json.loads(entry)
+        if state is None:
+            state = {
+                'road_name': entry['road_name'],
+                'capacity': entry['capacity'],
+                'slots': {}
+            }
+        for slot_time, (slot_id, available) in entry['slots'].items():
+            state['slots'][datetime.fromisoformat(slot_time)] = (slot_id, available)
+    return state
+
+
+def _load_road_states_from_db(road_ids, hours):
+    """Read road metadata and existing slots for the given roads from CockroachDB"""
+    with cockroach_connection() as conn:
+        cursor = conn.cursor()
+
+        # Get the road info for every road in a single query
+        cursor.execute("""
+            SELECT id, name, hourly_capacity
+            FROM roads
+            WHERE id = ANY(%s::UUID[])
+        """, (road_ids,))
+
+        states = {}
+        for road_id, road_name, capacity in cursor.fetchall():
+            if not capacity:
+                logger.warning(f"Road {road_id} has no capacity, set it to {DEFAULT_ROAD_CAPACITY}")
+                capacity = DEFAULT_ROAD_CAPACITY
+            states[str(road_id)] = {
+                'road_name': road_name,
+                'capacity': capacity,
+                'slots': {}
+            }
+
+        if not states:
+            return {}
+
+        # Get every existing slot for these roads across the whole window
+        cursor.execute("""
+            SELECT rbs.road_id, rbs.slot_time, rbs.road_booking_slot_id, rbs.available_capacity
+            FROM road_booking_slots rbs
+            WHERE rbs.road_id = ANY(%s::UUID[])
+            AND rbs.slot_time >= %s
+            AND rbs.slot_time <= %s
+        """, (list(states.keys()), hours[0], hours[-1]))
+
+        for road_id, slot_time, slot_id, available in cursor.fetchall():
+            states[str(road_id)]['slots'][slot_time] = (str(slot_id), available)
+
+        conn.commit()
+        return states
+
+
+def load_road_states(road_ids, hours):
+    """
+    Load road metadata and existing booking slots for many roads at once.
+
+    Returns a dict keyed by road id holding the road name, its hourly capacity
+    and a map of slot_time -> (slot_id, available_capacity) for the slots that
+    already exist inside the requested hours. Roads that do not exist are
+    left out of the result.
+
+    Each road-day is served from the Redis cache when present; roads with any
+    missing day are read from CockroachDB in one batch and written back,
+    unless an invalidation ran while they were being read.
+    """
+    road_ids = list(dict.fromkeys(_valid_road_ids(road_ids)))
+    if not road_ids or not hours:
+        return {}
+
+    days = sorted({slot_start.date() for slot_start in hours})
+    keys = [_cache_key(road_id, day) for road_id in road_ids for day in days]
+    generation_keys = [_generation_key(road_id, day) for road_id in road_ids for day in days]
+
+    try:
+        # Generations are read before the database so a later invalidation shows
+        values = redis_client.mget(keys + generation_keys)
+        cached, generations = values[:len(keys)], values[len(keys):]
+    except redis.RedisError as e:
+        logger.warning(f"Availability cache read failed: {str(e)}")
+        cached = [None] * len(keys)
+        generations = None
+
+    states = {}
+    missing_roads = []
+    for index, road_id in enumerate(road_ids):
+        entries = cached[index * len(days):(index + 1) * len(days)]
+        if all(entries):
+            states[road_id] = _decode_days(entries)
+        else:
+            missing_roads.append(road_id)
+
+    hits = len(states) * len(days)
+    misses = len(missing_roads) * len(days)
+
+    if missing_roads:
+        loaded = _load_road_states_from_db(missing_roads, hours)
+        states.update(loaded)
+
+    try:
+        # Without the generations seen before the read nothing is written back
+        store_keys = []
+        store_args = [AVAILABILITY_CACHE_TTL_SECONDS]
+        if generations is not None:
+            loaded_roads = set(missing_roads) & set(states)
+            for index, road_id in enumerate(road_ids):
+                if road_id in loaded_roads:
+                    for offset, day in enumerate(days):
+                        store_keys += [_cache_key(road_id, day), _generation_key(road_id, day)]
+                        store_args += [generations[index * len(days) + offset] or "",
+                                       _encode_day(states[road_id], day)]
+        if store_keys:
+            _STORE_SCRIPT(keys=store_keys, args=store_args)
+
+        pipe = redis_client.pipeline(transaction=False)
+        if hits:
+            pipe.incrby(AVAILABILITY_CACHE_HITS_KEY, hits)
+        if misses:
+            pipe.incrby(AVAILABILITY_CACHE_MISSES_KEY, misses)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Availability cache write failed: {str(e)}")
+
+    return states
+
+
+def invalidate_availability(slots):
+    """
+    Drop cached availability for the road-days touched by a write.
+
+    slots is an iterable of (road_id, slot_time) pairs. Call it after the
+    transaction that changed those slots has committed.
+    """
+    road_days = {(road_id, slot_time.date()) for road_id, slot_time in slots}
+    if not road_days:
+        return
+    try:
+        # Bumping the generation stops reads already in flight from writing
+        # their older rows back after the delete
+        pipe = redis_client.pipeline()
+        for road_id, day in road_days:
+            pipe.incr(_generation_key(road_id, day))
+            pipe.expire(_generation_key(road_id, day), AVAILABILITY_GENERATION_TTL_SECONDS)
+        pipe.delete(*[_cache_key(road_id, day) for road_id, day in road_days])
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Availability cache invalidation failed: {str(e)}")
+
+
+def invalidate_road_availability(road_ids):
+    """Drop cached availability for every day of the window on the given roads"""
+    _, window_start, _ = get_booking_horizon()
+    days = [(window_start + timedelta(days=offset)).date() for offset in range(AVAILABILITY_HORIZON_DAYS)]
+    invalidate_availability(
+        (road_id, datetime.combine(day, datetime.min.time()))
+        for road_id in road_ids for day in days
+    )
+
+
+def get_availability_cache_stats():
+    """Return the shared hit/miss counters of the availability cache"""
+    hits, misses = redis_client.mget(AVAILABILITY_CACHE_HITS_KEY, AVAILABILITY_CACHE_MISSES_KEY)
+    hits = int(hits or 0)
+    misses = int(misses or 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+        'ttl_seconds': AVAILABILITY_CACHE_TTL_SECONDS
+    }
+
+
+def build_slot_list(road_id, state, hours):
+    """Fill the hourly grid for a road in memory from its loaded state"""
+    slots = []
+    capacity = state['capacity']
+
+    for slot_start in hours:
+        slot_end = slot_start + timedelta(hours=1)
+        existing = state['slots'].get(slot_start)
+
+        if existing:
+            # Slot exists, check availability
+            slot_id, available = existing
+        else:
+            # Slot doesn't exist yet - fully available
+            slot_id, available = None, capacity
+
+        slots.append({
+            'road_id': road_id,
+            'road_name': state['road_name'],
+            'start_time': slot_start.isoformat(),
+            'end_time': slot_end.isoformat(),
+            'available': available > 0,
+            'capacity': capacity,
+            'available_capacity': available,
+            'slot_id': slot_id  # None until created when booked
+        })
+
+    return slots
+
+
+def get_roads_available_slots(road_ids):
+    """
+    Get available time slots for every road in road_ids.
+
+    Uses one query for road metadata and one range query for all existing
+    slots, so the cost does not grow with the number of hours or roads.
+    """
+    hours = get_horizon_hours()
+    states = load_road_states(road_ids, hours)
+
+    available_slots = {}
+    for road_id in road_ids:
+        state = states.get(str(road_id))
+        if not state:
+            logger.warning(f"Road {road_id} not found")
+            available_slots[road_id] = []
+            continue
+        available_slots[road_id] = build_slot_list(road_id, state, hours)
+
+    return available_slots
+
+
+def build_capacity_array(state, hours):
+    """Compact per-hour available capacity of a road, aligned with hours"""
+    capacity = state['capacity']
+    slots = state['slots']
+    return array('i', (
+        slots[slot_start][1] if slot_start in slots else capacity
+        for slot_start in hours
+    ))
+
+
+def _load_road_lengths(road_ids):
+    """Total segment length in meters of each road, in one query"""
+    with cockroach_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT road_id, SUM(length_meters)
+            FROM road_segments
+            WHERE road_id = ANY(%s::UUID[])
+            GROUP BY road_id
+        """, (road_ids,))
+        lengths = {str(road_id): length or 0 for road_id, length in cursor.fetchall()}
+        conn.commit()
+        return lengths
+
+
+def estimate_road_timings(road_ids, duration_minutes, distance_meters, road_lengths):
+    """
+    Estimate when the vehicle enters and leaves each road of the route.
+
+    Returns a list of (enter_minute, leave_minute) offsets from departure.
+    The travel time on a road comes from its length at the average route
+    speed (distance_meters / duration_minutes), capped at the route distance,
+    and the result is scaled so the route ends after duration_minutes. Roads
+    are split evenly when no usable lengths or distance are known.
+    """
+    if not road_ids:
+        return []
+
+    weights = None
+    if distance_meters and distance_meters > 0:
+        known = [road_lengths.get(str(road_id), 0) for road_id in road_ids]
+        if any(known):
+            average = sum(known) / len([length for length in known if length])
+            weights = [min(length or average, distance_meters) for length in known]
+
+    if not weights:
+        weights = [1] * len(road_ids)
+
+    total = sum(weights)
+    timings = []
+    elapsed = 0.0
+    for weight in weights:
+        travel = duration_minutes * weight / total
+        timings.append((elapsed, elapsed + travel))
+        elapsed += travel
+    return timings
+
+
+def _hour_span(enter_minute, leave_minute):
+    """First and last hour index (relative to departure) a road is occupied in"""
+    first = int(enter_minute // 60)
+    last = max(first, int(math.ceil(leave_minute / 60)) - 1)
+    return first, last
+
+
+def find_route_windows(road_ids, duration_minutes, distance_meters, quantity=1, limit=5):
+    """
+    Find the earliest hourly departures for which every road on the route has
+    at least quantity capacity in each hour the vehicle is expected to be on it.
+
+    Returns (windows, missing_road_ids). Each window holds the departure and
+    arrival time and the per-road slots, in the shape accepted by
+    /booking/create-booking.
+    """
+    hours = get_horizon_hours()
+    states = load_road_states(road_ids, hours)
+
+    missing = [road_id for road_id in road_ids if str(road_id) not in states]
+    if missing or not hours:
+        return [], missing
+
+    road_lengths = _load_road_lengths(list(states.keys())) if distance_meters else {}
+    timings = estimate_road_timings(road_ids, duration_minutes, distance_meters, road_lengths)
+
+    capacities = {road_id: build_capacity_array(state, hours) for road_id, state in states.items()}
+    spans = [_hour_span(enter, leave) for enter, leave in timings]
+    last_offset = max(last for _, last in spans)
+
+    windows = []
+    for departure in range(len(hours) - last_offset):
+        feasible = True
+        for road_id, (first, last) in zip(road_ids, spans):
+            road_capacity = capacities[str(road_id)]
+            if any(road_capacity[departure + offset] < quantity for offset in range(first, last + 1)):
+                feasible = False
+                break
+
+        if not feasible:
+            continue
+
+        departure_time = hours[departure]
+        bookings = []
+        for road_id, (first, last) in zip(road_ids, spans):
+            road_slots = states[str(road_id)]['slots']
+            slots = []
+            for offset in range(first, last + 1):
+                slot_start = hours[departure + offset]
+                existing = road_slots.get(slot_start)
+                slots.append({
+                    'start_time': slot_start.isoformat(),
+                    'end_time': (slot_start + timedelta(hours=1)).isoformat(),
+                    'slot_id': existing[0] if existing else None
+                })
+            bookings.append({'road_id': road_id, 'slots': slots, 'quantity': quantity})
+
+        windows.append({
+            'departure_time': departure_time.isoformat(),
+            'arrival_time': (departure_time + timedelta(minutes=duration_minutes)).isoformat(),
+            'bookings': bookings
+        })
+        if len(windows) >= limit:
+            break
+
+    return windows, missing
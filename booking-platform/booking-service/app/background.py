@@ -0,0 +1,109 @@
+import logging
+import os
+import threading
+import time
+
+import redis
+
+from app.db import redis_client
+from app.const import STARTUP_TASK_RETRY_SECONDS, STARTUP_TASK_LOCK_SECONDS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Background work is switched off for test runs
+BACKGROUND_TASKS_ENABLED = (
+    os.getenv("BACKGROUND_TASKS_ENABLED", "True") == "True"
+    and os.getenv("TESTING", "False") != "True"
+)
+
+# Set by gunicorn.conf.py when the app is preloaded: threads do not survive
+# a fork, so the tasks are started in every worker from post_fork instead
+BACKGROUND_TASKS_DEFERRED = os.getenv("BACKGROUND_TASKS_DEFERRED", "False") == "True"
+
+_periodic_tasks = []
+_startup_tasks = []
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def register_periodic_task(name, interval_seconds, fn):
+    """
+    Run fn every interval_seconds in a daemon thread.
+
+    Every booking-service instance registers the same tasks; a Redis lock
+    named after the task makes sure only one of them runs it per interval.
+    """
+    _periodic_tasks.append((name, interval_seconds, fn))
+
+
+def register_startup_task(name, fn):
+    """
+    Run fn once in a daemon thread when the background tasks start, again
+    every STARTUP_TASK_RETRY_SECONDS until it succeeds.
+
+    Every instance runs it, one at a time under a Redis lock named after
+    the task, so fn must be idempotent.
+    """
+    _startup_tasks.append((name, fn))
+
+
+def _run_once(name, fn):
+    lock = redis_client.lock(f"lock:{name}", timeout=STARTUP_TASK_LOCK_SECONDS)
+
+    while True:
+        try:
+            if lock.acquire(blocking=False):
+                try:
+                    fn()
+                finally:
+                    lock.release()
+                logger.info(f"Startup task {name} finished")
+                return
+        except redis.RedisError as e:
+            logger.warning(f"Startup task {name} could not take its lock: {str(e)}")
+        except Exception as e:
+            logger.error(f"Startup task {name} failed: {str(e)}")
+        time.sleep(STARTUP_TASK_RETRY_SECONDS)
+
+
+def _run_periodic(name, interval_seconds, fn):
+    lock_key = f"lock:{name}"
+    owner = f"{os.getenv('SERVICE_INSTANCE', 'unknown')}:{os.getpid()}"
+
+    while True:
+        try:
+            if redis_client.set(lock_key, owner, nx=True, ex=interval_seconds):
+                fn()
+        except redis.RedisError as e:
+            logger.warning(f"Background task {name} could not take its lock: {str(e)}")
+        except Exception as e:
+            logger.error(f"Background task {name} failed: {str(e)}")
+        time.sleep(interval_seconds)
+
+
+def start_background_tasks(after_fork=False):
+    """Start a thread for every registered task, once per process"""
+    global _started_pid
+
+    if not BACKGROUND_TASKS_ENABLED or (BACKGROUND_TASKS_DEFERRED and not after_fork):
+        return
+
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+
+        for name, fn in _startup_tasks:
+            threading.Thread(target=_run_once, args=(name, fn), name=name, daemon=True).start()
+
+        for name, interval_seconds, fn in _periodic_tasks:
+            thread = threading.Thread(
+                target=_run_periodic,
+                args=(name, interval_seconds, fn),
+                name=name,
+                daemon=True
+            )
+            thread.start()
+            logger.info(f"Started background task {name} every {interval_seconds}s")
@@ -0,0 +1,89 @@
+import json
+import logging
+import uuid
+from datetime import datetime
+
+import redis
+
+from app.db import redis_client
+from app.const import (
+    BOOKING_STREAM,
+    BOOKING_STREAM_GROUP,
+    BOOKING_STREAM_MAXLEN,
+    BOOKING_TICKET_TTL_SECONDS,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BOOKING_TICKET_KEY = "booking:ticket:{ticket_id}"
+
+# Ticket states
+TICKET_QUEUED = "queued"
+TICKET_PROCESSING = "processing"
+TICKET_CONFIRMED = "confirmed"
+TICKET_FAILED = "failed"
+
+
+def _ticket_key(ticket_id):
+    return BOOKING_TICKET_KEY.format(ticket_id=ticket_id)
+
+
+def ensure_booking_stream():
+    """Create the stream and its consumer group if they do not exist yet"""
+    try:
+        redis_client.xgroup_create(BOOKING_STREAM, BOOKING_STREAM_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def enqueue_booking(username, bookings, origin, destination, user_id=None):
+    """Queue a validated booking request and return its ticket id"""
+    ticket_id = str(uuid.uuid4())
+    ticket_key = _ticket_key(ticket_id)
+
+    pipe = redis_client.pipeline()
+    pipe.hset(ticket_key, mapping={
+        "status": TICKET_QUEUED,
+        "username": username,
+        "created_at": datetime.now().isoformat()
+    })
+    pipe.expire(ticket_key, BOOKING_TICKET_TTL_SECONDS)
+    pipe.xadd(BOOKING_STREAM, {
+        "ticket_id": ticket_id,
+        "username": username,
+        "user_id": user_id or "",
+        "payload": json.dumps({
+            "bookings": bookings,
+            "origin": origin,
+            "destination": destination
+        })
+    }, maxlen=BOOKING_STREAM_MAXLEN, approximate=True)
+    pipe.execute()
+
+    return ticket_id
+
+
+def get_ticket(ticket_id):
+    """Return the stored state of a ticket, or None if it is unknown or expired"""
+    ticket = redis_client.hgetall(_ticket_key(ticket_id))
+    if not ticket:
+        return None
+    if "result" in ticket:
+        ticket["result"] = json.loads(ticket["result"])
+    return ticket
+
+
+def set_ticket_status(ticket_id, status, result=None):
+    """Record progress or the final outcome of a ticket"""
+    mapping = {"status": status, "updated_at": datetime.now().isoformat()}
+    if result is not None:
+        mapping["result"] = json.dumps(result)
+
+    ticket_key = _ticket_key(ticket_id)
+    pipe = redis_client.pipeline()
+    pipe.hset(ticket_key, mapping=mapping)
+    pipe.expire(ticket_key, BOOKING_TICKET_TTL_SECONDS)
+    pipe.execute()
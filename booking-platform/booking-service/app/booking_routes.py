@@ -2,12 +2,49 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import logging
 import psycopg2
+import psycopg2.errors
 from datetime import datetime, timedelta
+import time
 import uuid
-
-from app.db import get_cockroach_connection, release_cockroach_connection
-from app.user_routes import session_required
-from app.const import ERROR_UNEXPECTED, ERROR_DATABASE, ERROR_UNAUTHORIZED_ACCESS
+import base64
+import redis
+
+from app.db import cockroach_connection, run_transaction, TransactionAborted, PoolTimeout
+from app.availability import (
+    get_roads_available_slots,
+    find_route_windows,
+    invalidate_availability,
+    get_booking_horizon,
+    MAX_ROUTE_WINDOWS,
+)
+from app.slots import parse_slot_time, resolve_slot_ids
+from app.admission import reserve_slot_capacity, release_slot_capacity, forget_slot_capacity
+from app.booking_queue import enqueue_booking, get_ticket, TICKET_QUEUED
+from app.booking_summary import summarize_lines, summarize_bookings
+from app.cancellation import cancel_bookings, release_cancelled_lines
+from app.holds import save_hold, get_hold, claim_hold, drop_hold, release_claimed_holds, give_back_capacity
+from app.idempotency import (
+    request_fingerprint,
+    begin_idempotent_request,
+    complete_idempotent_request,
+    release_idempotent_request,
+    IdempotencyConflict,
+    IdempotencyInProgress,
+)
+from app.user_routes import get_current_user_id
+from app.const import (
+    ERROR_UNEXPECTED,
+    ERROR_SESSION_EXPIRED,
+    ERROR_SERVICE_BUSY,
+    IDEMPOTENCY_KEY_MAX_LENGTH,
+    ASYNC_BOOKING_ENABLED,
+    BULK_BOOKING_MAX_ITEMS,
+    BULK_BOOKING_CHUNK_SIZE,
+    HOLD_TTL_SECONDS,
+    HOLD_MAX_TTL_SECONDS,
+    USER_BOOKINGS_PAGE_SIZE,
+    USER_BOOKINGS_MAX_PAGE_SIZE,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,23 +58,15 @@ def get_available_slots():
     """
     Get available time slots for each road in the route
     """
-    current_user = get_jwt_identity()
-
     try:
         data = request.json
         road_ids = data.get('road_ids', [])
-        duration_minutes = data.get('duration_minutes', 60)
-        distance_meters = data.get('distance_meters', 0)
 
         if not road_ids:
             return jsonify({'error': 'No road IDs provided'}), 400
 
-        # Get available time slots for each road
-        available_slots = {}
-
-        for road_id in road_ids:
-            road_slots = get_road_available_slots(road_id)
-            available_slots[road_id] = road_slots
+        # Get available time slots for every road in one pass
+        available_slots = get_roads_available_slots(road_ids)
 
         return jsonify({
             'available_slots': available_slots
@@ -47,105 +76,60 @@ def get_available_slots():
         logger.error(f"Error getting available time slots: {str(e)}")
         return jsonify({'error': ERROR_UNEXPECTED}), 500
 
-def get_road_available_slots(road_id):
-    """Get available time slots for a specific road"""
-    conn = None
-    available_slots = []
-
+@booking_blueprint.route('/route-windows', methods=['POST'])
+@jwt_required()
+def get_route_windows():
+    """
+    Find the earliest departure times at which the whole route can be booked
+    """
     try:
-        conn = get_cockroach_connection()
-        cursor = conn.cursor()
+        data = request.json or {}
+        road_ids = data.get('road_ids', [])
+        duration_minutes = float(data.get('duration_minutes', 60))
+        distance_meters = float(data.get('distance_meters', 0))
+        quantity = int(data.get('quantity', 1))
+        limit = min(int(data.get('limit', 5)), MAX_ROUTE_WINDOWS)
 
-        # Get the road info
-        cursor.execute("""
-            SELECT id, name, hourly_capacity
-            FROM roads
-            WHERE id = %s
-        """, (road_id,))
-
-        road = cursor.fetchone()
-        if not road:
-            logger.warning(f"Road {road_id} not found")
-            return []
-
-        road_name = road[1]
-        capacity = road[2]
-
-        if not capacity:
-            logger.warning(f"Road {road_id} has no capacity, set it to 10")
-            capacity = 100
-
-        # Get the current date
-        now = datetime.now()
-
-        # For each of the next 7 days
-        for day_offset in range(0, 7):
-            day_date = now + timedelta(days=day_offset)
-            day_start = day_date.replace(hour=0, minute=0, second=0, microsecond=0)
-
-            # Create time slots for each hour of the day
-            for hour in range(0, 24):  # 0-23 hours
-                slot_start = day_start + timedelta(hours=hour)
-                slot_end = slot_start + timedelta(hours=1)
-
-                # Skip slots in the past
-                if slot_start <= now:
-                    continue
+        if not road_ids:
+            return jsonify({'error': 'No road IDs provided'}), 400
 
-                # Check existing bookings for this road in this time slot
-                cursor.execute("""
-                    SELECT rbs.road_booking_slot_id, rbs.available_capacity
-                    FROM road_booking_slots rbs
-                    WHERE rbs.road_id = %s
-                    AND rbs.slot_time = %s
-                """, (road_id, slot_start))
-
-                slot_result = cursor.fetchone()
-
-                if slot_result:
-                    # Slot exists, check availability
-                    slot_id = slot_result[0]
-                    available = slot_result[1]
-
-                    available_slots.append({
-                        'road_id': road_id,
-                        'road_name': road_name,
-                        'start_time': slot_start.isoformat(),
-                        'end_time': slot_end.isoformat(),
-                        'available': available > 0,
-                        'capacity': capacity,
-                        'available_capacity': available,
-                        'slot_id': slot_id
-                    })
-                else:
-                    # Slot doesn't exist yet - fully available
-                    available_slots.append({
-                        'road_id': road_id,
-                        'road_name': road_name,
-                        'start_time': slot_start.isoformat(),
-                        'end_time': slot_end.isoformat(),
-                        'available': True,
-                        'capacity': capacity,
-                        'available_capacity': capacity,
-                        'slot_id': None  # Will be created when booked
-                    })
+        if duration_minutes <= 0 or quantity < 1 or limit < 1:
+            return jsonify({'error': 'duration_minutes, quantity and limit must be positive'}), 400
+
+        windows, missing = find_route_windows(road_ids, duration_minutes, distance_meters, quantity, limit)
 
-        return available_slots
+        if missing:
+            return jsonify({'error': 'Roads not found', 'road_ids': missing}), 404
+
+        return jsonify({
+            'windows': windows,
+            'count': len(windows)
+        }), 200
 
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid search parameters'}), 400
     except Exception as e:
-        logger.error(f"Database error in get_road_available_slots: {str(e)}")
-        return []
-    finally:
-        if conn:
-            release_cockroach_connection(conn)
+        logger.error(f"Error searching route windows: {str(e)}")
+        return jsonify({'error': ERROR_UNEXPECTED}), 500
 
 @booking_blueprint.route('/create-booking', methods=['POST'])
 @jwt_required()
 def create_booking_route():
     """
     Create bookings for multiple roads with selected time slots
+
+    An optional Idempotency-Key header makes retries safe: a replay with the
+    same key and body returns the stored result without booking again.
+    With ASYNC_BOOKING_ENABLED, a Prefer: respond-async header queues the
+    booking and returns 202 with a ticket to poll.
     """
     current_user = get_jwt_identity()
+    user_id = get_current_user_id()
+    idempotency_key = request.headers.get('Idempotency-Key')
+    fingerprint = None
+
+    if not user_id:
+        return jsonify({'error': ERROR_SESSION_EXPIRED}), 401
 
     try:
         data = request.json
@@ -156,340 +140,973 @@ def create_booking_route():
         if not bookings:
             return jsonify({'error': 'No bookings provided'}), 400
 
-        # Create the booking with multiple booking lines
-        result = create_route_booking(current_user, bookings, origin, destination)
+        if idempotency_key:
+            if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                return jsonify({'error': 'Idempotency-Key is too long'}), 400
+
+            fingerprint = request_fingerprint(data)
+            try:
+                replay = begin_idempotent_request(current_user, idempotency_key, fingerprint)
+            except IdempotencyConflict:
+                return jsonify({'error': 'Idempotency-Key was already used with a different request'}), 422
+            except IdempotencyInProgress:
+                return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+            except redis.RedisError as e:
+                # Without Redis the booking still goes ahead, just without replay protection
+                logger.warning(f"Idempotency check skipped: {str(e)}")
+                idempotency_key = None
+                replay = None
+
+            if replay:
+                body, status = replay
+                response = jsonify(body)
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response, status
+
+        if ASYNC_BOOKING_ENABLED and 'respond-async' in request.headers.get('Prefer', ''):
+            # Reject malformed lines now, the same way the synchronous path does,
+            # instead of handing them to the worker
+            try:
+                parse_booking_lines(bookings)
+            except BookingRequestError as e:
+                result = {'success': False, 'error': str(e)}
+                status = 400
+            else:
+                # Queue the booking for the worker and answer with a ticket to poll
+                ticket_id = enqueue_booking(current_user, bookings, origin, destination, user_id)
+                result = {
+                    'success': True,
+                    'ticket_id': ticket_id,
+                    'status': TICKET_QUEUED,
+                    'status_url': f"/booking/tickets/{ticket_id}"
+                }
+                status = 202
+        else:
+            # Create the booking with multiple booking lines
+            result = create_route_booking(current_user, bookings, origin, destination, user_id=user_id)
+            if result.get('success', False):
+                status = 200
+            elif result.get('retryable', False):
+                status = 503
+            else:
+                status = 500 if result.get('error') == ERROR_UNEXPECTED else 400
+
+        if idempotency_key:
+            # Failed bookings write nothing, so only successes are kept for replay
+            try:
+                if result.get('success', False):
+                    complete_idempotent_request(current_user, idempotency_key, fingerprint, result, status)
+                else:
+                    release_idempotent_request(current_user, idempotency_key)
+            except redis.RedisError as e:
+                logger.warning(f"Could not store idempotent result: {str(e)}")
 
-        return jsonify(result), 200 if result.get('success', False) else 400
+        response = jsonify(result)
+        if status == 202:
+            response.headers['Location'] = result['status_url']
+        elif status == 503:
+            response.headers['Retry-After'] = '1'
+        return response, status
 
     except Exception as e:
         logger.error(f"Error creating booking: {str(e)}")
+        if idempotency_key and fingerprint:
+            try:
+                release_idempotent_request(current_user, idempotency_key)
+            except redis.RedisError:
+                pass
         return jsonify({'error': ERROR_UNEXPECTED}), 500
 
-def create_route_booking(username, bookings_data, origin, destination):
-    """Create bookings for multiple roads as part of a route with capacity check"""
-    conn = None
+@booking_blueprint.route('/tickets/<ticket_id>', methods=['GET'])
+@jwt_required()
+def get_booking_ticket(ticket_id):
+    """Report the state of a booking queued with Prefer: respond-async"""
+    current_user = get_jwt_identity()
 
     try:
-        conn = get_cockroach_connection()
-        cursor = conn.cursor()
+        ticket = get_ticket(ticket_id)
 
-        # Start a transaction
-        conn.autocommit = False
+        # Tickets of other users are reported as missing
+        if not ticket or ticket.get('username') != current_user:
+            return jsonify({'error': 'Ticket not found'}), 404
 
-        # Generate a booking ID
-        booking_id = str(uuid.uuid4())
+        return jsonify({
+            'ticket_id': ticket_id,
+            'status': ticket['status'],
+            'created_at': ticket.get('created_at'),
+            'updated_at': ticket.get('updated_at'),
+            'result': ticket.get('result')
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error getting booking ticket: {str(e)}")
+        return jsonify({'error': ERROR_UNEXPECTED}), 500
+
+class BookingRequestError(Exception):
+    """A booking request that cannot be booked as sent"""
+
+
+def parse_booking_lines(bookings_data):
+    """Flatten the per-road booking payload into booking lines, returns (lines, road_count)"""
+    total_count = 0
+    booking_lines_data = []
+    now, _, window_end = get_booking_horizon()
+
+    for booking_data in bookings_data:
+        road_id = booking_data.get('road_id')
+        slots = booking_data.get('slots', [])
+        quantity = booking_data.get('quantity', 1)
+
+        if not road_id or not slots:
+            continue
+
+        total_count += 1
+
+        for slot in slots:
+            try:
+                slot_start = parse_slot_time(slot.get('start_time'))
+            except (AttributeError, TypeError, ValueError):
+                raise BookingRequestError("Booking failed: Invalid slot start time")
+            if slot_start < now:
+                raise BookingRequestError("Booking failed: Cannot book a past time slot")
+            # Only whole hours inside the window exist as slots
+            if slot_start != slot_start.replace(minute=0, second=0, microsecond=0):
+                raise BookingRequestError("Booking failed: Slots start on the hour")
+            if slot_start >= window_end:
+                raise BookingRequestError("Booking failed: Slot is beyond the booking window")
+            slot_id = slot.get('slot_id')
+            if slot_id:
+                try:
+                    slot_id = str(uuid.UUID(slot_id))
+                except (AttributeError, TypeError, ValueError):
+                    raise BookingRequestError("Booking failed: Invalid slot id")
+            booking_lines_data.append({'slot_id': slot_id, 'quantity': quantity, 'road_id': road_id, 'slot_start': slot_start})
+
+    return booking_lines_data, total_count
+
+
+def resolve_line_slot_ids(cursor, booking_lines_data):
+    """Slot id of every line, looked up by (road_id, slot_time) where the client sent none"""
+    slot_ids = [line['slot_id'] for line in booking_lines_data]
+    unresolved = [(line['road_id'], line['slot_start']) for line in booking_lines_data if not line['slot_id']]
+    if unresolved:
+        resolved = resolve_slot_ids(cursor, unresolved)
+        for index, line in enumerate(booking_lines_data):
+            if not slot_ids[index]:
+                slot_ids[index] = resolved.get((str(line['road_id']), line['slot_start']))
+    return slot_ids
+
+
+def mismatched_slot_line(booking_lines_data, slot_ids, slot_rows):
+    """
+    First line whose slot id is not the slot of its road and start time,
+    given {slot_id: (road_id, slot_time)}; None if every line matches.
+    Summaries and cache invalidation go by the line's road and time, so a
+    slot id sent by the client has to belong to them.
+    """
+    for slot_id, line in zip(slot_ids, booking_lines_data):
+        road_id, slot_time = slot_rows.get(str(slot_id), (None, None))
+        if str(road_id) != str(line['road_id']) or slot_time != line['slot_start']:
+            return line
+    return None
+
+
+def create_route_booking(username, bookings_data, origin, destination, booking_id=None, user_id=None):
+    """
+    Create bookings for multiple roads as part of a route with capacity check
+
+    user_id normally comes from the token claims; without it the user is
+    looked up by username.
+    """
+    try:
+        # Pre-check and prepare booking data
+        try:
+            booking_lines_data, total_count = parse_booking_lines(bookings_data)
+        except BookingRequestError as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+        # Nothing to book, so nothing is written either
+        if not booking_lines_data:
+            return {'success': False, 'booking_id': None, 'success_count': 0, 'total_count': total_count}
+
+        # Generate a booking ID unless the caller picked one
+        booking_id = booking_id or str(uuid.uuid4())
+
+        def book(cursor):
+            booking_user_id = user_id
+            if not booking_user_id:
+                cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
+                user_result = cursor.fetchone()
+
+                if not user_result:
+                    raise TransactionAborted({'success': False, 'error': "User not found"})
+
+                booking_user_id = user_result[0]
+
+            # Create a booking record, summarised so listings need no joins
+            booking_timestamp = datetime.now()
+            summary = summarize_lines(booking_lines_data)
+            cursor.execute("""
+                INSERT INTO bookings
+                (booking_id, user_id, origin, destination, booking_timestamp,
+                 start_time, end_time, line_count, road_count, quantity)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (booking_id, booking_user_id, origin, destination, booking_timestamp,
+                  summary['start_time'], summary['end_time'], summary['line_count'],
+                  summary['road_count'], summary['quantity']))
+
+            # Slots are pre-materialised, so lines without an id only need a lookup
+            slot_ids = resolve_line_slot_ids(cursor, booking_lines_data)
+            resolved_slot_ids[:] = [slot_id for slot_id in slot_ids if slot_id and slot_id not in known_demand]
+            for slot_id, line in zip(slot_ids, booking_lines_data):
+                if not slot_id:
+                    raise TransactionAborted({
+                        'success': False,
+                        'error': f"Road with id {line['road_id']} not found" # Keep specific error for road not found
+                    })
+
+            # Merge demand per slot so every row is decremented exactly once
+            slot_demand = {}
+            for slot_id, line in zip(slot_ids, booking_lines_data):
+                slot_demand[slot_id] = slot_demand.get(slot_id, 0) + line['quantity']
+
+            # Conditional decrement of every slot in a single statement -
+            # a slot without enough room is simply not updated. Rows go in
+            # slot id order, the order bulk chunks lock them in
+            cursor.execute("""
+                UPDATE road_booking_slots AS rbs
+                SET available_capacity = rbs.available_capacity - d.quantity
+                FROM (SELECT unnest(%s::UUID[]) AS slot_id, unnest(%s::INT[]) AS quantity) AS d
+                WHERE rbs.road_booking_slot_id = d.slot_id
+                AND rbs.available_capacity >= d.quantity
+                RETURNING rbs.road_booking_slot_id, rbs.road_id, rbs.slot_time
+            """, (sorted(slot_demand), [slot_demand[slot_id] for slot_id in sorted(slot_demand)]))
+            slot_rows = {str(slot_id): (road_id, slot_time) for slot_id, road_id, slot_time in cursor.fetchall()}
+
+            # The whole booking fails if any slot did not qualify
+            if len(slot_rows) != len(slot_demand):
+                raise TransactionAborted({
+                    'success': False,
+                    'error': "Booking failed: Road already booked" # Changed error message
+                })
+
+            mismatched = mismatched_slot_line(booking_lines_data, slot_ids, slot_rows)
+            if mismatched:
+                raise TransactionAborted({
+                    'success': False,
+                    'error': f"Booking failed: Slot {mismatched['slot_id']} is not on road {mismatched['road_id']} at that time"
+                })
+
+            # Create all booking lines in one statement
+            cursor.execute("""
+                INSERT INTO booking_lines
+                (booking_line_id, booking_id, road_booking_slot_id, quantity)
+                SELECT unnest(%s::UUID[]), %s, unnest(%s::UUID[]), unnest(%s::INT[])
+            """, (
+                [str(uuid.uuid4()) for _ in booking_lines_data],
+                booking_id,
+                slot_ids,
+                [line['quantity'] for line in booking_lines_data]
+            ))
+
+            return {
+                'success': True,
+                'booking_id': booking_id,
+                'success_count': len(booking_lines_data),
+                'total_count': total_count
+            }
+
+        # Slots looked up or created inside the transaction, outside the counters
+        resolved_slot_ids = []
+
+        # Admit lines with known slot ids against the Redis counters first,
+        # so a full hot slot is turned away without a database transaction
+        known_demand = {}
+        for line in booking_lines_data:
+            if line['slot_id']:
+                known_demand[line['slot_id']] = known_demand.get(line['slot_id'], 0) + line['quantity']
+
+        reserved = reserve_slot_capacity(known_demand)
+        if reserved is None:
+            return {
+                'success': False,
+                'error': "Booking failed: Road already booked"
+            }
+
+        try:
+            with cockroach_connection() as conn:
+                result = run_transaction(conn, book)
+        except Exception:
+            # Compensate the counters, the database did not take the booking
+            release_slot_capacity(reserved)
+            raise
+
+        if result.get('success'):
+            # Cached availability for the booked road-days is now stale
+            invalidate_availability(
+                (line['road_id'], line['slot_start']) for line in booking_lines_data
+            )
+            # Their counters, if any, missed this booking; they are seeded
+            # again from the database on next use
+            forget_slot_capacity(sorted(set(resolved_slot_ids)))
+        else:
+            # The database turned down what the counters admitted, so they
+            # disagree with it; reseed them rather than trusting a release
+            forget_slot_capacity(sorted(reserved))
+
+        return result
+
+    except Exception as e:
+        return booking_failure(e, "create_route_booking")
+
+# Errors that say nothing about the booking itself: the database or the pool
+# was unavailable for a moment and the same request may well succeed later
+TRANSIENT_BOOKING_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, PoolTimeout)
+
+
+def booking_failure(e, context):
+    """
+    Result for a booking that raised e. Only transient errors are marked
+    retryable; anything else would fail the same way again.
+    """
+    if isinstance(e, psycopg2.errors.SerializationFailure):
+        logger.error(f"Booking transaction in {context} gave up after retries: {str(e)}")
+        return {
+            'success': False,
+            'retryable': True,
+            'error': "Booking failed: Road is busy, please try again"
+        }
+    if isinstance(e, TRANSIENT_BOOKING_ERRORS):
+        logger.error(f"Database unavailable in {context}: {str(e)}")
+        return {
+            'success': False,
+            'retryable': True,
+            'error': ERROR_SERVICE_BUSY
+        }
+    if isinstance(e, psycopg2.DataError):
+        logger.error(f"Invalid booking data in {context}: {str(e)}")
+        return {
+            'success': False,
+            'error': 'Invalid booking data'
+        }
+    logger.error(f"Unexpected error in {context}: {str(e)}")
+    return {
+        'success': False,
+        'error': ERROR_UNEXPECTED
+    }
+
+@booking_blueprint.route('/bulk-create', methods=['POST'])
+@jwt_required()
+def bulk_create_booking_route():
+    """
+    Create many route bookings in one request, e.g. for a fleet of vehicles
+
+    Each item has the same shape as a create-booking body. Items are booked
+    independently and reported one by one in request order.
+    """
+    user_id = get_current_user_id()
+
+    if not user_id:
+        return jsonify({'error': ERROR_SESSION_EXPIRED}), 401
+
+    try:
+        data = request.json or {}
+        items = data.get('bookings', [])
 
-        # Get user ID
-        cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
-        user_result = cursor.fetchone()
+        if not items:
+            return jsonify({'error': 'No bookings provided'}), 400
+
+        if len(items) > BULK_BOOKING_MAX_ITEMS:
+            return jsonify({'error': f"At most {BULK_BOOKING_MAX_ITEMS} bookings per request"}), 400
+
+        results = create_bulk_bookings(user_id, items)
+        success_count = sum(1 for result in results if result.get('success'))
+
+        return jsonify({
+            'success': success_count > 0,
+            'results': results,
+            'success_count': success_count,
+            'total_count': len(results)
+        }), 200 if success_count else 400
+
+    except Exception as e:
+        logger.error(f"Error creating bulk booking: {str(e)}")
+        return jsonify({'error': ERROR_UNEXPECTED}), 500
+
+def create_bulk_bookings(user_id, items):
+    """
+    Book a list of route bookings in chunks of BULK_BOOKING_CHUNK_SIZE,
+    one transaction per chunk, and return one result per item
+    """
+    results = [None] * len(items)
+    chunk = []
+
+    for index, item in enumerate(items):
+        bookings_data = item.get('bookings', []) if isinstance(item, dict) else []
+        if not bookings_data:
+            results[index] = {'success': False, 'error': 'No bookings provided'}
+            continue
+
+        try:
+            lines, total_count = parse_booking_lines(bookings_data)
+        except BookingRequestError as e:
+            results[index] = {'success': False, 'error': str(e)}
+            continue
+        except (AttributeError, TypeError, ValueError):
+            results[index] = {'success': False, 'error': 'Invalid booking data'}
+            continue
+
+        chunk.append({
+            'index': index,
+            'origin': item.get('origin', ''),
+            'destination': item.get('destination', ''),
+            'lines': lines,
+            'total_count': total_count
+        })
+
+    for start in range(0, len(chunk), BULK_BOOKING_CHUNK_SIZE):
+        part = chunk[start:start + BULK_BOOKING_CHUNK_SIZE]
+        for entry, result in zip(part, _book_bulk_chunk(user_id, part)):
+            results[entry['index']] = result
+
+    return results
+
+class SlotCapacityChanged(Exception):
+    """A locked slot no longer had the capacity read for it; the chunk is rolled back"""
+
+
+def _book_bulk_chunk(user_id, entries):
+    """Book one chunk of parsed bulk items in a single transaction"""
+
+    def book(cursor):
+        # Resolve the slots of the whole chunk at once
+        all_lines = [line for entry in entries for line in entry['lines']]
+        all_slot_ids = resolve_line_slot_ids(cursor, all_lines)
 
-        if not user_result:
-            raise Exception("User not found")
+        offset = 0
+        for entry in entries:
+            entry['slot_ids'] = all_slot_ids[offset:offset + len(entry['lines'])]
+            offset += len(entry['lines'])
 
-        user_id = user_result[0]
+        # Lock every slot of the chunk in slot id order. Single bookings and
+        # holds update their slots in the same order, so concurrent bookings
+        # queue up on the rows instead of deadlocking on each other.
+        touched = sorted({slot_id for slot_id in all_slot_ids if slot_id})
+        remaining = {}
+        slot_rows = {}
+        if touched:
+            cursor.execute("""
+                SELECT road_booking_slot_id, available_capacity, road_id, slot_time
+                FROM road_booking_slots
+                WHERE road_booking_slot_id = ANY(%s::UUID[])
+                ORDER BY road_booking_slot_id
+                FOR UPDATE
+            """, (touched,))
+            for slot_id, capacity, road_id, slot_time in cursor.fetchall():
+                remaining[str(slot_id)] = capacity
+                slot_rows[str(slot_id)] = (road_id, slot_time)
+
+        # Hand out the remaining capacity in request order; a booking is
+        # accepted only if every one of its slots still has room
+        outcomes = []
+        accepted = []
+        slot_demand = {}
+        for entry in entries:
+            booking_id = str(uuid.uuid4())
+
+            if not entry['lines']:
+                outcomes.append({'success': False, 'booking_id': None, 'success_count': 0, 'total_count': entry['total_count']})
+                continue
+
+            missing = [line['road_id'] for slot_id, line in zip(entry['slot_ids'], entry['lines'])
+                       if not slot_id or slot_id not in remaining]
+            if missing:
+                outcomes.append({'success': False, 'error': f"Road with id {missing[0]} not found"})
+                continue
+
+            mismatched = mismatched_slot_line(entry['lines'], entry['slot_ids'], slot_rows)
+            if mismatched:
+                outcomes.append({
+                    'success': False,
+                    'error': f"Booking failed: Slot {mismatched['slot_id']} is not on road {mismatched['road_id']} at that time"
+                })
+                continue
+
+            demand = {}
+            for slot_id, line in zip(entry['slot_ids'], entry['lines']):
+                demand[slot_id] = demand.get(slot_id, 0) + line['quantity']
+
+            if any(remaining[slot_id] < quantity for slot_id, quantity in demand.items()):
+                outcomes.append({'success': False, 'error': "Booking failed: Road already booked"})
+                continue
+
+            for slot_id, quantity in demand.items():
+                remaining[slot_id] -= quantity
+                slot_demand[slot_id] = slot_demand.get(slot_id, 0) + quantity
+
+            entry['booking_id'] = booking_id
+            accepted.append(entry)
+            outcomes.append({
+                'success': True,
+                'booking_id': booking_id,
+                'success_count': len(entry['lines']),
+                'total_count': entry['total_count']
+            })
+
+        if not accepted:
+            return outcomes
+
+        # The rows are locked, so the merged decrement cannot fall short
+        cursor.execute("""
+            UPDATE road_booking_slots AS rbs
+            SET available_capacity = rbs.available_capacity - d.quantity
+            FROM (SELECT unnest(%s::UUID[]) AS slot_id, unnest(%s::INT[]) AS quantity) AS d
+            WHERE rbs.road_booking_slot_id = d.slot_id
+            AND rbs.available_capacity >= d.quantity
+        """, (sorted(slot_demand), [slot_demand[slot_id] for slot_id in sorted(slot_demand)]))
+
+        if cursor.rowcount != len(slot_demand):
+            raise SlotCapacityChanged("Slot capacity changed under a row lock")
 
-        # Create a booking record
         booking_timestamp = datetime.now()
+        summaries = [summarize_lines(entry['lines']) for entry in accepted]
         cursor.execute("""
             INSERT INTO bookings
-            (booking_id, user_id, origin, destination, booking_timestamp)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (booking_id, user_id, origin, destination, booking_timestamp))
+            (booking_id, user_id, origin, destination, booking_timestamp,
+             start_time, end_time, line_count, road_count, quantity)
+            SELECT unnest(%s::UUID[]), %s, unnest(%s::STRING[]), unnest(%s::STRING[]), %s,
+                   unnest(%s::TIMESTAMP[]), unnest(%s::TIMESTAMP[]), unnest(%s::INT[]),
+                   unnest(%s::INT[]), unnest(%s::INT[])
+        """, (
+            [entry['booking_id'] for entry in accepted],
+            user_id,
+            [entry['origin'] for entry in accepted],
+            [entry['destination'] for entry in accepted],
+            booking_timestamp,
+            [summary['start_time'] for summary in summaries],
+            [summary['end_time'] for summary in summaries],
+            [summary['line_count'] for summary in summaries],
+            [summary['road_count'] for summary in summaries],
+            [summary['quantity'] for summary in summaries]
+        ))
+
+        line_rows = [(entry['booking_id'], slot_id, line['quantity'])
+                     for entry in accepted
+                     for slot_id, line in zip(entry['slot_ids'], entry['lines'])]
+        cursor.execute("""
+            INSERT INTO booking_lines
+            (booking_line_id, booking_id, road_booking_slot_id, quantity)
+            SELECT unnest(%s::UUID[]), unnest(%s::UUID[]), unnest(%s::UUID[]), unnest(%s::INT[])
+        """, (
+            [str(uuid.uuid4()) for _ in line_rows],
+            [row[0] for row in line_rows],
+            [row[1] for row in line_rows],
+            [row[2] for row in line_rows]
+        ))
+
+        return outcomes
 
-        # Track successful bookings
-        success_count = 0
-        total_count = 0
-        booking_lines_data = [] # Store data for booking lines to insert later
+    try:
+        with cockroach_connection() as conn:
+            results = run_transaction(conn, book)
+
+        booked = [entry for entry, result in zip(entries, results) if result.get('success')]
+        if booked:
+            invalidate_availability(
+                (line['road_id'], line['slot_start']) for entry in booked for line in entry['lines']
+            )
+            # Capacity changed behind the admission counters, let them reseed
+            forget_slot_capacity(sorted({slot_id for entry in booked for slot_id in entry['slot_ids']}))
+
+        return results
+
+    except SlotCapacityChanged as e:
+        logger.error(f"Bulk booking chunk rolled back: {str(e)}")
+        return [{'success': False, 'retryable': True, 'error': "Booking failed: Road is busy, please try again"} for _ in entries]
+    except Exception as e:
+        # Details are logged once, each item only gets the generic result
+        failure = booking_failure(e, "_book_bulk_chunk")
+        return [dict(failure) for _ in entries]
 
-        # Pre-check and prepare booking data
-        for booking_data in bookings_data:
-            road_id = booking_data.get('road_id')
-            slots = booking_data.get('slots', [])
-            quantity = booking_data.get('quantity', 1)
+@booking_blueprint.route('/holds', methods=['POST'])
+@jwt_required()
+def create_hold_route():
+    """
+    Hold the selected slots for a short time while the user decides
 
-            if not road_id or not slots:
-                continue
+    Takes the same body as create-booking plus an optional ttl_seconds. The
+    capacity is taken straight away; confirming the hold books it without
+    checking capacity again, and an unconfirmed hold is released once it
+    expires.
+    """
+    current_user = get_jwt_identity()
+
+    try:
+        data = request.json or {}
+        bookings = data.get('bookings', [])
+        ttl_seconds = min(int(data.get('ttl_seconds', HOLD_TTL_SECONDS)), HOLD_MAX_TTL_SECONDS)
+
+        if not bookings:
+            return jsonify({'error': 'No bookings provided'}), 400
+
+        if ttl_seconds < 1:
+            return jsonify({'error': 'ttl_seconds must be positive'}), 400
+
+        try:
+            booking_lines_data, _ = parse_booking_lines(bookings)
+        except BookingRequestError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
 
-            total_count += 1
+        if not booking_lines_data:
+            return jsonify({'error': 'No slots selected'}), 400
 
-            for slot in slots:
-                slot_start = datetime.fromisoformat(slot.get('start_time').replace('Z', '+00:00'))
-                if slot_start < datetime.now():
-                    conn.rollback()
-                    return {
+        def hold(cursor):
+            slot_ids = resolve_line_slot_ids(cursor, booking_lines_data)
+            for slot_id, line in zip(slot_ids, booking_lines_data):
+                if not slot_id:
+                    raise TransactionAborted((jsonify({
                         'success': False,
-                        'error': "Booking failed: Cannot book a past time slot"
-                    }
-                slot_id = slot.get('slot_id')
-
-                if slot_id:
-                    # Check capacity for existing slot using FOR UPDATE to lock the row
-                    cursor.execute("""
-                        SELECT available_capacity
-                        FROM road_booking_slots
-                        WHERE road_booking_slot_id = %s
-                        FOR UPDATE
-                    """, (slot_id,))
-                    result = cursor.fetchone()
-
-                    if not result or result[0] < quantity:
-                        conn.rollback()
-                        return {
-                            'success': False,
-                            'error': "Booking failed: Road already booked" # Changed error message
-                        }
-                    booking_lines_data.append({'slot_id': slot_id, 'quantity': quantity, 'slot_exists': True, 'road_id': road_id, 'slot_start': slot_start})
+                        'error': f"Road with id {line['road_id']} not found"
+                    }), 404))
+
+            # Same slot id order as bookings, see _book_bulk_chunk
+            slot_demand = {}
+            for slot_id, line in zip(slot_ids, booking_lines_data):
+                slot_demand[slot_id] = slot_demand.get(slot_id, 0) + line['quantity']
+
+            cursor.execute("""
+                UPDATE road_booking_slots AS rbs
+                SET available_capacity = rbs.available_capacity - d.quantity
+                FROM (SELECT unnest(%s::UUID[]) AS slot_id, unnest(%s::INT[]) AS quantity) AS d
+                WHERE rbs.road_booking_slot_id = d.slot_id
+                AND rbs.available_capacity >= d.quantity
+                RETURNING rbs.road_booking_slot_id, rbs.road_id, rbs.slot_time
+            """, (sorted(slot_demand), [slot_demand[slot_id] for slot_id in sorted(slot_demand)]))
+            slot_rows = {str(slot_id): (road_id, slot_time) for slot_id, road_id, slot_time in cursor.fetchall()}
+
+            if len(slot_rows) != len(slot_demand):
+                raise TransactionAborted((jsonify({
+                    'success': False,
+                    'error': "Booking failed: Road already booked"
+                }), 409))
+
+            mismatched = mismatched_slot_line(booking_lines_data, slot_ids, slot_rows)
+            if mismatched:
+                raise TransactionAborted((jsonify({
+                    'success': False,
+                    'error': f"Slot {mismatched['slot_id']} is not on road {mismatched['road_id']} at that time"
+                }), 400))
+
+            return slot_ids
+
+        with cockroach_connection() as conn:
+            result = run_transaction(conn, hold)
+
+            # An aborted transaction hands back its error response
+            if isinstance(result, tuple):
+                return result
+
+            hold_id = str(uuid.uuid4())
+            try:
+                expires_at = save_hold(hold_id, current_user, booking_lines_data, result, ttl_seconds)
+            except redis.RedisError:
+                # Without a record nobody would ever release the capacity
+                held = [{'slot_id': slot_id, 'quantity': line['quantity']} for slot_id, line in zip(result, booking_lines_data)]
+                run_transaction(conn, lambda cursor: give_back_capacity(cursor, held))
+                raise
+
+            invalidate_availability(
+                (line['road_id'], line['slot_start']) for line in booking_lines_data
+            )
+            forget_slot_capacity(sorted(set(result)))
+
+            return jsonify({
+                'success': True,
+                'hold_id': hold_id,
+                'expires_at': datetime.utcfromtimestamp(expires_at).isoformat() + 'Z',
+                'slot_count': len(booking_lines_data)
+            }), 201
+
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid hold request'}), 400
+    except psycopg2.errors.SerializationFailure as e:
+        logger.error(f"Hold transaction gave up after retries: {str(e)}")
+        return jsonify({'success': False, 'error': "Booking failed: Road is busy, please try again"}), 409
+    except Exception as e:
+        logger.error(f"Error creating hold: {str(e)}")
+        return jsonify({'error': ERROR_UNEXPECTED}), 500
+
+@booking_blueprint.route('/holds/<hold_id>/confirm', methods=['POST'])
+@jwt_required()
+def confirm_hold_route(hold_id):
+    """Turn a hold into a booking, its capacity is already reserved"""
+    current_user = get_jwt_identity()
+    user_id = get_current_user_id()
+
+    if not user_id:
+        return jsonify({'error': ERROR_SESSION_EXPIRED}), 401
+
+    try:
+        data = request.json or {}
+        origin = data.get('origin', '')
+        destination = data.get('destination', '')
+
+        hold = get_hold(hold_id)
+
+        # Holds of other users are reported as missing
+        if not hold or hold.get('username') != current_user:
+            return jsonify({'error': 'Hold not found'}), 404
+
+        if hold['expires_at'] < time.time() or not claim_hold(hold_id):
+            return jsonify({'error': 'Hold has expired or was already used'}), 410
+
+        lines = hold['lines']
+        booking_id = str(uuid.uuid4())
+
+        def confirm(cursor):
+            # A road closed since the hold was taken wins over the hold
+            cursor.execute("""
+                SELECT 1 FROM road_booking_slots
+                WHERE road_booking_slot_id = ANY(%s::UUID[]) AND capacity = 0
+                LIMIT 1
+            """, ([line['slot_id'] for line in lines],))
+            if cursor.fetchone():
+                raise TransactionAborted({'success': False, 'error': 'A road of this hold has been closed'})
+
+            summary = summarize_lines(lines)
+            cursor.execute("""
+                INSERT INTO bookings
+                (booking_id, user_id, origin, destination, booking_timestamp,
+                 start_time, end_time, line_count, road_count, quantity)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (booking_id, user_id, origin, destination, datetime.now(),
+                  summary['start_time'], summary['end_time'], summary['line_count'],
+                  summary['road_count'], summary['quantity']))
 
-                else:
-                    # Get road capacity and check if enough for a new slot
-                    cursor.execute("SELECT hourly_capacity FROM roads WHERE id = %s", (road_id,))
-                    road_capacity_result = cursor.fetchone()
-                    if not road_capacity_result:
-                        conn.rollback()
-                        return {
-                            'success': False,
-                            'error': f"Road with id {road_id} not found" # Keep specific error for road not found
-                        }
-                    road_capacity = road_capacity_result[0]
-
-                    if road_capacity < quantity: # Check against road capacity initially
-                         conn.rollback()
-                         return {
-                            'success': False,
-                            'error': "Booking failed: Road already booked" # Changed error message
-                        }
-                    booking_lines_data.append({'slot_id': None, 'quantity': quantity, 'slot_exists': False, 'road_id': road_id, 'slot_start': slot_start, 'road_capacity': road_capacity})
-
-
-        # Process booking lines and update/create slots and booking lines
-        for booking_line_item in booking_lines_data:
-            slot_id = booking_line_item['slot_id']
-            quantity = booking_line_item['quantity']
-            slot_exists = booking_line_item['slot_exists']
-            road_id = booking_line_item['road_id']
-            slot_start = booking_line_item['slot_start']
-
-
-            if slot_exists:
-                # Update existing slot - capacity is already checked above with FOR UPDATE
-                cursor.execute("""
-                    UPDATE road_booking_slots
-                    SET available_capacity = available_capacity - %s
-                    WHERE road_booking_slot_id = %s
-                """, (quantity, slot_id))
-            else:
-                # Create new booking slot - capacity is already checked above
-                cursor.execute("""
-                    INSERT INTO road_booking_slots
-                    (road_id, slot_time, capacity, available_capacity)
-                    VALUES (%s, %s, %s, %s)
-                    RETURNING road_booking_slot_id
-                """, (road_id, slot_start, booking_line_item['road_capacity'], booking_line_item['road_capacity'] - quantity))
-                slot_id = cursor.fetchone()[0]
-
-
-            # Create booking line
-            booking_line_id = str(uuid.uuid4())
             cursor.execute("""
                 INSERT INTO booking_lines
                 (booking_line_id, booking_id, road_booking_slot_id, quantity)
-                VALUES (%s, %s, %s, %s)
-            """, (booking_line_id, booking_id, slot_id, quantity))
-            success_count += 1
+                SELECT unnest(%s::UUID[]), %s, unnest(%s::UUID[]), unnest(%s::INT[])
+            """, (
+                [str(uuid.uuid4()) for _ in lines],
+                booking_id,
+                [line['slot_id'] for line in lines],
+                [line['quantity'] for line in lines]
+            ))
+
+            return {
+                'success': True,
+                'booking_id': booking_id,
+                'success_count': len(lines),
+                'total_count': len({line['road_id'] for line in lines})
+            }
+
+        try:
+            with cockroach_connection() as conn:
+                result = run_transaction(conn, confirm)
+        except Exception:
+            # The hold is claimed, so give its capacity back ourselves
+            release_claimed_holds({hold_id: hold})
+            raise
+
+        if not result.get('success', False):
+            release_claimed_holds({hold_id: hold})
+            return jsonify(result), 409
+
+        drop_hold(hold_id)
+        return jsonify(result), 200
 
+    except Exception as e:
+        logger.error(f"Error confirming hold: {str(e)}")
+        return jsonify({'error': ERROR_UNEXPECTED}), 500
 
-        # Commit the transaction
-        conn.commit()
+@booking_blueprint.route('/holds/<hold_id>', methods=['DELETE'])
+@jwt_required()
+def release_hold_route(hold_id):
+    """Give up a hold before it expires"""
+    current_user = get_jwt_identity()
 
-        return {
-            'success': success_count > 0,
-            'booking_id': booking_id,
-            'success_count': success_count,
-            'total_count': total_count
-        }
+    try:
+        hold = get_hold(hold_id)
+
+        if not hold or hold.get('username') != current_user:
+            return jsonify({'error': 'Hold not found'}), 404
+
+        # A confirm or the sweeper got there first and owns the record now
+        if not claim_hold(hold_id):
+            return jsonify({'error': 'Hold has expired or was already used'}), 409
+
+        release_claimed_holds({hold_id: hold})
+        return jsonify({'success': True, 'status': 'released'}), 200
 
     except Exception as e:
-        if conn:
-            conn.rollback()
-        logger.error(f"Database error in create_route_booking: {str(e)}")
-        return {
-            'success': False,
-            'error': str(e)
-        }
-    finally:
-        if conn:
-            conn.autocommit = True
-            release_cockroach_connection(conn)
+        logger.error(f"Error releasing hold: {str(e)}")
+        return jsonify({'error': ERROR_UNEXPECTED}), 500
+
+def _encode_bookings_cursor(booking_timestamp, booking_id):
+    value = f"{booking_timestamp.isoformat()}|{booking_id}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+def _decode_bookings_cursor(cursor_value):
+    booking_timestamp, booking_id = base64.urlsafe_b64decode(cursor_value.encode()).decode().split('|', 1)
+    return datetime.fromisoformat(booking_timestamp), str(uuid.UUID(booking_id))
 
 @booking_blueprint.route('/user-bookings', methods=['GET'])
 @jwt_required()
 def get_user_bookings():
-    """Get all bookings for the current user"""
-    current_user = get_jwt_identity()
-    conn = None
+    """
+    Get the current user's bookings, newest first, one page at a time
+
+    Query parameters: limit, cursor (from the X-Next-Cursor header of the
+    previous page) and upcoming=true to skip bookings that are over.
+    """
+    user_id = get_current_user_id()
+
+    if not user_id:
+        return jsonify({'error': ERROR_SESSION_EXPIRED}), 401
 
     try:
-        conn = get_cockroach_connection()
-        cursor = conn.cursor()
+        limit = min(int(request.args.get('limit', USER_BOOKINGS_PAGE_SIZE)), USER_BOOKINGS_MAX_PAGE_SIZE)
+        upcoming = request.args.get('upcoming', 'false').lower() == 'true'
+        after_timestamp, after_booking_id = None, None
+        if request.args.get('cursor'):
+            after_timestamp, after_booking_id = _decode_bookings_cursor(request.args['cursor'])
 
-        # Get user ID
-        cursor.execute("SELECT id FROM users WHERE username = %s", (current_user,))
-        user_result = cursor.fetchone()
+        if limit < 1:
+            return jsonify({'error': 'limit must be positive'}), 400
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid pagination parameters'}), 400
 
-        if not user_result:
-            return jsonify({"error": "User not found"}), 404
+    try:
+        # A slot lasts an hour, so a booking is upcoming until its last slot ends
+        upcoming_after = datetime.utcnow() - timedelta(hours=1)
 
-        user_id = user_result[0]
+        with cockroach_connection() as conn:
+            cursor = conn.cursor()
 
-        # Get all bookings for this user
-        cursor.execute("""
-            SELECT
-                b.booking_id,
-                b.origin,
-                b.destination,
-                b.booking_timestamp,
-                MIN(rbs.slot_time) as start_time,
-                MAX(rbs.slot_time) as end_time,
-                COUNT(DISTINCT bl.booking_line_id) as booking_count,
-                COUNT(DISTINCT rbs.road_id) as road_count,
-                MAX(bl.quantity) as quantity
-            FROM bookings b
-            JOIN booking_lines bl ON b.booking_id = bl.booking_id
-            JOIN road_booking_slots rbs ON bl.road_booking_slot_id = rbs.road_booking_slot_id
-            WHERE b.user_id = %s
-            GROUP BY b.booking_id, b.origin, b.destination, b.booking_timestamp
-            ORDER BY b.booking_timestamp DESC
-        """, (user_id,))
+            # The summary columns make this a range scan of bookings_user_time_idx.
+            # line_count = 0 marks bookings the backfill has not reached yet
+            cursor.execute("""
+                SELECT booking_id, origin, destination, booking_timestamp,
+                       start_time, end_time, line_count, road_count, quantity
+                FROM bookings
+                WHERE user_id = %s
+                AND (%s::TIMESTAMP IS NULL OR (booking_timestamp, booking_id) < (%s::TIMESTAMP, %s::UUID))
+                AND (NOT %s OR end_time > %s OR line_count = 0)
+                ORDER BY booking_timestamp DESC, booking_id DESC
+                LIMIT %s
+            """, (user_id, after_timestamp, after_timestamp, after_booking_id,
+                  upcoming, upcoming_after, limit + 1))
+            rows = cursor.fetchall()
+
+            # Summarise those from their lines instead
+            pending = [row[0] for row in rows[:limit] if row[6] == 0]
+            summaries = summarize_bookings(cursor, pending) if pending else {}
 
         bookings = []
-        for row in cursor.fetchall():
+        for row in rows[:limit]:
+            start_time, end_time, line_count, road_count, quantity = row[4:9]
+            if line_count == 0:
+                summary = summaries.get(str(row[0]))
+                # Bookings without lines were never listed
+                if not summary:
+                    continue
+                start_time, end_time, line_count, road_count, quantity = summary
+                if upcoming and end_time <= upcoming_after:
+                    continue
+
             bookings.append({
                 'booking_id': row[0],
                 'origin': row[1],
                 'destination': row[2],
                 'created_at': row[3].isoformat() if row[3] else None,
-                'start_time': row[4].isoformat() if row[4] else None,
-                'end_time': row[5].isoformat() if row[5] else None,
-                'booking_count': row[6],
-                'road_count': row[7],
-                'quantity': row[8]
+                'start_time': start_time.isoformat() if start_time else None,
+                'end_time': end_time.isoformat() if end_time else None,
+                'booking_count': line_count,
+                'road_count': road_count,
+                'quantity': quantity
             })
 
-        return jsonify(bookings), 200
+        response = jsonify(bookings)
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            response.headers['X-Next-Cursor'] = _encode_bookings_cursor(last[3], last[0])
+        return response, 200
 
     except Exception as e:
         logger.error(f"Error getting user bookings: {str(e)}")
         return jsonify({'error': ERROR_UNEXPECTED}), 500
-    finally:
-        if conn:
-            release_cockroach_connection(conn)
 
 @booking_blueprint.route('/<booking_id>/cancel', methods=['POST'])
 @jwt_required()
 def cancel_booking(booking_id):
     """Cancel a booking and all its booking lines"""
-    current_user = get_jwt_identity()
-    conn = None
+    user_id = get_current_user_id()
 
-    try:
-        conn = get_cockroach_connection()
-        cursor = conn.cursor()
-
-        # Start transaction
-        conn.autocommit = False
+    if not user_id:
+        return jsonify({'error': ERROR_SESSION_EXPIRED}), 401
 
-        # First check if the booking exists at all
+    def cancel(cursor):
+        # One lookup tells a missing booking from someone else's
         cursor.execute("""
-            SELECT 1 FROM bookings WHERE booking_id = %s
+            SELECT user_id FROM bookings WHERE booking_id = %s
         """, (booking_id,))
+        booking = cursor.fetchone()
 
-        if not cursor.fetchone():
+        if not booking:
             # Booking doesn't exist at all
-            conn.rollback()
-            return jsonify({
+            raise TransactionAborted((jsonify({
                 "error": "Booking not found. It may have already been cancelled.",
                 "status": "not_found"
-            }), 404
+            }), 404))
 
         # Check if booking belongs to this user
-        cursor.execute("""
-            SELECT b.booking_id
-            FROM bookings b
-            JOIN users u ON b.user_id = u.id
-            WHERE b.booking_id = %s AND u.username = %s
-        """, (booking_id, current_user))
-
-        if not cursor.fetchone():
-            conn.rollback()
-            return jsonify({
+        if str(booking[0]) != user_id:
+            raise TransactionAborted((jsonify({
                 "error": "Access denied. This booking doesn't belong to your account.",
                 "status": "access_denied"
-            }), 403
+            }), 403))
 
-        # Get all booking lines to update road booking slots
-        cursor.execute("""
-            SELECT bl.booking_line_id, bl.road_booking_slot_id, bl.quantity
-            FROM booking_lines bl
-            WHERE bl.booking_id = %s
-        """, (booking_id,))
+        return cancel_bookings(cursor, [booking_id])
+
+    try:
+        with cockroach_connection() as conn:
+            result = run_transaction(conn, cancel)
 
-        booking_lines = cursor.fetchall()
+        # An aborted transaction hands back its error response
+        if isinstance(result, tuple):
+            return result
 
-        if not booking_lines:
-            # We found the booking but no lines - might be partially cancelled
-            cursor.execute("DELETE FROM bookings WHERE booking_id = %s", (booking_id,))
-            conn.commit()
+        if not result:
             return jsonify({
                 "success": True,
                 "cancelled_count": 0,
                 "status": "empty_booking"
             }), 200
 
-        cancelled_count = 0
-
-        # Update capacity for each booking slot
-        for line in booking_lines:
-            booking_line_id, slot_id, quantity = line
-
-            # Update available capacity in the slot
-            cursor.execute("""
-                UPDATE road_booking_slots
-                SET available_capacity = available_capacity + %s
-                WHERE road_booking_slot_id = %s
-            """, (quantity, slot_id))
-
-            cancelled_count += 1
-
-        # Delete all booking lines for this booking
-        cursor.execute("""
-            DELETE FROM booking_lines
-            WHERE booking_id = %s
-        """, (booking_id,))
-
-        # Delete the booking
-        cursor.execute("""
-            DELETE FROM bookings
-            WHERE booking_id = %s
-        """, (booking_id,))
-
-        # Commit the transaction
-        conn.commit()
+        release_cancelled_lines(result)
 
         return jsonify({
             "success": True,
-            "cancelled_count": cancelled_count,
+            "cancelled_count": len(result),
             "status": "cancelled"
         }), 200
 
+    except TRANSIENT_BOOKING_ERRORS as e:
+        # Retries ran out or no connection was free; the booking is untouched
+        logger.error(f"Database unavailable while cancelling booking: {str(e)}")
+        response = jsonify({
+            'error': ERROR_SERVICE_BUSY,
+            'status': 'error'
+        })
+        response.headers['Retry-After'] = '1'
+        return response, 503
     except Exception as e:
-        if conn:
-            conn.rollback()
         logger.error(f"Error cancelling booking: {str(e)}")
         return jsonify({
-            'error': str(e) if str(e) else ERROR_UNEXPECTED,
+            'error': ERROR_UNEXPECTED,
             'status': 'error'
         }), 500
-    finally:
-        if conn:
-            conn.autocommit = True
-            release_cockroach_connection(conn)
@@ -0,0 +1,154 @@
+import logging
+
+import psycopg2
+
+from app.db import cockroach_connection
+from app.const import BOOKING_SUMMARY_BACKFILL_BATCH
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Summary columns of bookings computed from their lines, for bookings
+# written before the columns existed
+_SUMMARY_QUERY = """
+    SELECT bl.booking_id,
+           MIN(rbs.slot_time) AS start_time,
+           MAX(rbs.slot_time) AS end_time,
+           COUNT(DISTINCT bl.booking_line_id) AS line_count,
+           COUNT(DISTINCT rbs.road_id) AS road_count,
+           MAX(bl.quantity) AS quantity
+    FROM booking_lines bl
+    JOIN road_booking_slots rbs ON bl.road_booking_slot_id = rbs.road_booking_slot_id
+    WHERE bl.booking_id = ANY(%s::UUID[])
+    GROUP BY bl.booking_id
+"""
+
+
+def summarize_lines(booking_lines_data):
+    """
+    Summary columns of a booking row for its lines, as written by
+    create-booking: start/end slot time, line and road counts and the
+    largest quantity
+    """
+    if not booking_lines_data:
+        return {"start_time": None, "end_time": None, "line_count": 0, "road_count": 0, "quantity": 0}
+
+    slot_times = [line["slot_start"] for line in booking_lines_data]
+    return {
+        "start_time": min(slot_times),
+        "end_time": max(slot_times),
+        "line_count": len(booking_lines_data),
+        "road_count": len({str(line["road_id"]) for line in booking_lines_data}),
+        "quantity": max(line["quantity"] for line in booking_lines_data)
+    }
+
+
+def summarize_bookings(cursor, booking_ids):
+    """
+    Summaries of bookings computed from their lines, as
+    {booking_id: (start_time, end_time, line_count, road_count, quantity)}.
+    Bookings without lines are left out.
+    """
+    cursor.execute(_SUMMARY_QUERY, ([str(booking_id) for booking_id in booking_ids],))
+    return {str(row[0]): row[1:] for row in cursor.fetchall()}
+
+
+def ensure_booking_summary_schema():
+    """
+    Add the summary columns and the pagination index to bookings.
+
+    init.sql creates them for new databases; this covers databases restored
+    from an older backup.
+    """
+    try:
+        with cockroach_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    ALTER TABLE bookings
+                    ADD COLUMN IF NOT EXISTS start_time TIMESTAMP,
+                    ADD COLUMN IF NOT EXISTS end_time TIMESTAMP,
+                    ADD COLUMN IF NOT EXISTS line_count INTEGER NOT NULL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS road_count INTEGER NOT NULL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS quantity INTEGER NOT NULL DEFAULT 0
+                """)
+            conn.commit()
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS bookings_user_time_idx
+                    ON bookings (user_id, booking_timestamp DESC, booking_id DESC)
+                """)
+            conn.commit()
+    except psycopg2.Error as e:
+        logger.error(f"Could not add the booking summary columns: {str(e)}")
+        raise
+
+
+def backfill_booking_summaries(batch_size=BOOKING_SUMMARY_BACKFILL_BATCH):
+    """
+    Fill the summary columns of bookings written before they existed, a
+    batch of bookings per transaction in booking_id order. Safe to re-run.
+    """
+    last_booking_id = None
+    updated = 0
+
+    try:
+        with cockroach_connection() as conn:
+            cursor = conn.cursor()
+
+            while True:
+                cursor.execute("""
+                    SELECT booking_id FROM bookings
+                    WHERE (%s::UUID IS NULL OR booking_id > %s::UUID)
+                    AND line_count = 0
+                    ORDER BY booking_id
+                    LIMIT %s
+                """, (last_booking_id, last_booking_id, batch_size))
+                booking_ids = [str(row[0]) for row in cursor.fetchall()]
+
+                if not booking_ids:
+                    conn.commit()
+                    break
+
+                cursor.execute(f"""
+                    UPDATE bookings AS b
+                    SET start_time = s.start_time,
+                        end_time = s.end_time,
+                        line_count = s.line_count,
+                        road_count = s.road_count,
+                        quantity = s.quantity
+                    FROM ({_SUMMARY_QUERY}) AS s
+                    WHERE b.booking_id = s.booking_id
+                """, (booking_ids,))
+                updated += cursor.rowcount
+                conn.commit()
+
+                last_booking_id = booking_ids[-1]
+
+            return updated
+
+    except psycopg2.Error as e:
+        logger.error(f"Database error while backfilling booking summaries: {str(e)}")
+        raise
+
+
+def upgrade_booking_summaries():
+    """
+    Add the summary columns if needed and backfill existing bookings. Run
+    once at startup; until it is done the bookings list summarises
+    bookings without a summary from their lines.
+    """
+    ensure_booking_summary_schema()
+    updated = backfill_booking_summaries()
+    logger.info(f"Booking summary backfill finished, {updated} bookings updated")
+    return updated
+
+
+def main():
+    """Upgrade the bookings table once and exit"""
+    upgrade_booking_summaries()
+
+
+if __name__ == "__main__":
+    main()
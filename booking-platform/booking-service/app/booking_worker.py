@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import socket
+import time
+
+import redis
+
+from app.db import cockroach_connection, redis_client
+from app.booking_routes import create_route_booking
+from app.booking_queue import (
+    ensure_booking_stream,
+    get_ticket,
+    set_ticket_status,
+    TICKET_QUEUED,
+    TICKET_PROCESSING,
+    TICKET_CONFIRMED,
+    TICKET_FAILED,
+)
+from app.const import (
+    ERROR_UNEXPECTED,
+    BOOKING_STREAM,
+    BOOKING_STREAM_GROUP,
+    BOOKING_WORKER_BATCH_SIZE,
+    BOOKING_WORKER_BLOCK_MS,
+    BOOKING_WORKER_CLAIM_IDLE_MS,
+    BOOKING_WORKER_MAX_DELIVERIES,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _booking_exists(booking_id):
+    with cockroach_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM bookings WHERE booking_id = %s", (booking_id,))
+            exists = cursor.fetchone() is not None
+        conn.commit()
+        return exists
+
+
+class BookingRetryLater(Exception):
+    """The booking hit a transient error; its message stays pending for redelivery"""
+
+
+def _times_delivered(message_id):
+    pending = redis_client.xpending_range(
+        BOOKING_STREAM, BOOKING_STREAM_GROUP, min=message_id, max=message_id, count=1
+    )
+    return pending[0]["times_delivered"] if pending else 1
+
+
+def process_message(message_id, fields):
+    """Run one queued booking and record its outcome on the ticket"""
+    ticket_id = (fields or {}).get("ticket_id")
+    ticket = get_ticket(ticket_id) if ticket_id else None
+
+    # A redelivered message whose ticket already finished is only acknowledged
+    if ticket and ticket["status"] not in (TICKET_CONFIRMED, TICKET_FAILED):
+        # The ticket id doubles as the booking id, so a booking that committed
+        # before its worker died, or before a retryable error reached it (e.g.
+        # a connection dropped during COMMIT), is detected instead of booked
+        # a second time. The ticket may be back in queued, so check either way
+        if _booking_exists(ticket_id):
+            set_ticket_status(ticket_id, TICKET_CONFIRMED, {"success": True, "booking_id": ticket_id})
+        else:
+            set_ticket_status(ticket_id, TICKET_PROCESSING)
+
+            payload = json.loads(fields["payload"])
+            result = create_route_booking(
+                fields["username"],
+                payload["bookings"],
+                payload["origin"],
+                payload["destination"],
+                booking_id=ticket_id,
+                user_id=fields.get("user_id")
+            )
+            if result.get("retryable", False) and _times_delivered(message_id) < BOOKING_WORKER_MAX_DELIVERIES:
+                # Not acknowledged, so xautoclaim hands it out again later
+                set_ticket_status(ticket_id, TICKET_QUEUED)
+                raise BookingRetryLater(result["error"])
+
+            status = TICKET_CONFIRMED if result.get("success", False) else TICKET_FAILED
+            set_ticket_status(ticket_id, status, result)
+
+    redis_client.xack(BOOKING_STREAM, BOOKING_STREAM_GROUP, message_id)
+
+
+def _give_up(message_id, fields):
+    """Fail the ticket of a message that keeps failing and acknowledge it"""
+    ticket_id = (fields or {}).get("ticket_id")
+    if ticket_id:
+        set_ticket_status(ticket_id, TICKET_FAILED, {"success": False, "error": ERROR_UNEXPECTED})
+    redis_client.xack(BOOKING_STREAM, BOOKING_STREAM_GROUP, message_id)
+
+
+def process_batch(messages):
+    for message_id, fields in messages:
+        try:
+            process_message(message_id, fields)
+        except BookingRetryLater as e:
+            logger.warning(f"Booking message {message_id} will be retried: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error processing booking message {message_id}: {str(e)}")
+            # Left pending, so it is claimed again after BOOKING_WORKER_CLAIM_IDLE_MS,
+            # until it has been delivered BOOKING_WORKER_MAX_DELIVERIES times
+            try:
+                if _times_delivered(message_id) >= BOOKING_WORKER_MAX_DELIVERIES:
+                    logger.error(f"Booking message {message_id} failed for good")
+                    _give_up(message_id, fields)
+            except redis.RedisError as e:
+                logger.error(f"Could not give up on booking message {message_id}: {str(e)}")
+
+
+def main():
+    """Drain the booking stream in batches until stopped"""
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    ensure_booking_stream()
+    logger.info(f"Booking worker {consumer} started")
+
+    while True:
+        try:
+            # Take over messages left behind by a worker that died mid-batch
+            _, claimed, *_ = redis_client.xautoclaim(
+                BOOKING_STREAM, BOOKING_STREAM_GROUP, consumer,
+                min_idle_time=BOOKING_WORKER_CLAIM_IDLE_MS,
+                count=BOOKING_WORKER_BATCH_SIZE
+            )
+            if claimed:
+                process_batch(claimed)
+
+            response = redis_client.xreadgroup(
+                BOOKING_STREAM_GROUP, consumer, {BOOKING_STREAM: ">"},
+                count=BOOKING_WORKER_BATCH_SIZE, block=BOOKING_WORKER_BLOCK_MS
+            )
+            for _, messages in response or []:
+                process_batch(messages)
+
+        except redis.RedisError as e:
+            logger.error(f"Booking worker lost Redis: {str(e)}")
+            time.sleep(1)
+
+
+if __name__ == "__main__":
+    main()
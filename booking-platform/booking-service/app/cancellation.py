@@ -0,0 +1,177 @@
+import logging
+
+from app.db import cockroach_connection, run_transaction
+from app.availability import invalidate_availability, invalidate_road_availability, DEFAULT_ROAD_CAPACITY
+from app.admission import release_slot_capacity, forget_slot_capacity, slot_quantities
+from app.const import ROAD_CLOSURE_CHUNK_SIZE
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def cancel_bookings(cursor, booking_ids):
+    """
+    Cancel bookings inside the caller's transaction.
+
+    Capacity goes back with one update grouped by slot, then lines and
+    bookings are deleted in bulk. Returns the cancelled lines as
+    (booking_line_id, slot_id, quantity, road_id, slot_time) rows for
+    release_cancelled_lines once the transaction has committed.
+    """
+    booking_ids = [str(booking_id) for booking_id in booking_ids]
+    if not booking_ids:
+        return []
+
+    cursor.execute("""
+        SELECT bl.booking_line_id, bl.road_booking_slot_id, bl.quantity,
+               rbs.road_id, rbs.slot_time
+        FROM booking_lines bl
+        JOIN road_booking_slots rbs ON bl.road_booking_slot_id = rbs.road_booking_slot_id
+        WHERE bl.booking_id = ANY(%s::UUID[])
+    """, (booking_ids,))
+    booking_lines = cursor.fetchall()
+
+    if booking_lines:
+        cursor.execute("""
+            UPDATE road_booking_slots AS rbs
+            SET available_capacity = LEAST(rbs.capacity, rbs.available_capacity + d.quantity)
+            FROM (
+                SELECT road_booking_slot_id AS slot_id, SUM(quantity) AS quantity
+                FROM booking_lines
+                WHERE booking_id = ANY(%s::UUID[])
+                GROUP BY road_booking_slot_id
+            ) AS d
+            WHERE rbs.road_booking_slot_id = d.slot_id
+        """, (booking_ids,))
+
+        cursor.execute("DELETE FROM booking_lines WHERE booking_id = ANY(%s::UUID[])", (booking_ids,))
+
+    cursor.execute("DELETE FROM bookings WHERE booking_id = ANY(%s::UUID[])", (booking_ids,))
+
+    return booking_lines
+
+
+def release_cancelled_lines(booking_lines):
+    """Refresh cached availability and admission counters after a committed cancellation"""
+    if not booking_lines:
+        return
+    invalidate_availability((line[3], line[4]) for line in booking_lines)
+    release_slot_capacity(slot_quantities(booking_lines))
+
+
+def cancel_road_bookings(road_id, start_time, end_time, close_slots=False, chunk_size=ROAD_CLOSURE_CHUNK_SIZE):
+    """
+    Cancel every booking with a line on road_id between start_time
+    (inclusive) and end_time (exclusive), chunk_size bookings per
+    transaction. Bookings are cancelled whole, since a route with a closed
+    road cannot be driven.
+
+    With close_slots the range is first recorded as a road closure and the
+    road's slots in it are closed, i.e. set to zero capacity, so no new
+    booking lands on them while the existing ones are cancelled. Slots
+    created in the range later, by the materialiser or a booking, start
+    closed. Holds, cancellations and capacity propagation all leave a
+    closed slot at zero until reopen_road_slots. Returns (bookings, lines).
+    """
+    cancelled_bookings = 0
+    cancelled_lines = 0
+
+    def cancel_chunk(cursor):
+        cursor.execute("""
+            SELECT DISTINCT bl.booking_id
+            FROM booking_lines bl
+            JOIN road_booking_slots rbs ON bl.road_booking_slot_id = rbs.road_booking_slot_id
+            WHERE rbs.road_id = %s
+            AND rbs.slot_time >= %s AND rbs.slot_time < %s
+            LIMIT %s
+        """, (road_id, start_time, end_time, chunk_size))
+        booking_ids = [str(row[0]) for row in cursor.fetchall()]
+        return booking_ids, cancel_bookings(cursor, booking_ids)
+
+    def close(cursor):
+        cursor.execute("""
+            INSERT INTO road_closures (road_id, start_time, end_time)
+            VALUES (%s, %s, %s)
+        """, (road_id, start_time, end_time))
+        cursor.execute("""
+            UPDATE road_booking_slots
+            SET capacity = 0, available_capacity = 0
+            WHERE road_id = %s
+            AND slot_time >= %s AND slot_time < %s
+            RETURNING road_booking_slot_id
+        """, (road_id, start_time, end_time))
+        return [str(row[0]) for row in cursor.fetchall()]
+
+    with cockroach_connection() as conn:
+        if close_slots:
+            closed_slot_ids = run_transaction(conn, close)
+            invalidate_road_availability([road_id])
+            forget_slot_capacity(closed_slot_ids)
+
+        while True:
+            booking_ids, booking_lines = run_transaction(conn, cancel_chunk)
+            if not booking_ids:
+                break
+
+            release_cancelled_lines(booking_lines)
+            cancelled_bookings += len(booking_ids)
+            cancelled_lines += len(booking_lines)
+
+        logger.info(f"Road closure on {road_id}: cancelled {cancelled_bookings} bookings ({cancelled_lines} lines)")
+        return cancelled_bookings, cancelled_lines
+
+
+def reopen_road_slots(road_id, start_time, end_time):
+    """
+    Reopen the closed slots of road_id between start_time (inclusive) and
+    end_time (exclusive) at the road's hourly capacity, less anything
+    still booked on them. Road closures are cut back to outside the range.
+    Returns the number of slots reopened.
+    """
+    def reopen(cursor):
+        cursor.execute("""
+            DELETE FROM road_closures
+            WHERE road_id = %s AND start_time < %s AND end_time > %s
+            RETURNING start_time, end_time
+        """, (road_id, end_time, start_time))
+        # What lies outside the reopened range stays closed
+        remaining = []
+        for closed_from, closed_until in cursor.fetchall():
+            if closed_from < start_time:
+                remaining.append((closed_from, start_time))
+            if closed_until > end_time:
+                remaining.append((end_time, closed_until))
+        if remaining:
+            cursor.execute("""
+                INSERT INTO road_closures (road_id, start_time, end_time)
+                SELECT %s, unnest(%s::TIMESTAMP[]), unnest(%s::TIMESTAMP[])
+            """, (road_id, [closed[0] for closed in remaining], [closed[1] for closed in remaining]))
+
+        booked = """
+            (SELECT COALESCE(SUM(bl.quantity), 0)
+             FROM booking_lines bl
+             WHERE bl.road_booking_slot_id = rbs.road_booking_slot_id)
+        """
+        capacity = f"GREATEST(COALESCE(NULLIF(r.hourly_capacity, 0), %s), {booked})"
+        cursor.execute(f"""
+            UPDATE road_booking_slots AS rbs
+            SET capacity = {capacity},
+                available_capacity = {capacity} - {booked}
+            FROM roads r
+            WHERE r.id = rbs.road_id
+            AND rbs.road_id = %s
+            AND rbs.slot_time >= %s AND rbs.slot_time < %s
+            AND rbs.capacity = 0
+            RETURNING rbs.road_booking_slot_id
+        """, (DEFAULT_ROAD_CAPACITY, DEFAULT_ROAD_CAPACITY, road_id, start_time, end_time))
+        return [str(row[0]) for row in cursor.fetchall()]
+
+    with cockroach_connection() as conn:
+        reopened_slot_ids = run_transaction(conn, reopen)
+
+    invalidate_road_availability([road_id])
+    forget_slot_capacity(reopened_slot_ids)
+
+    logger.info(f"Road reopening on {road_id}: reopened {len(reopened_slot_ids)} slots")
+    return len(reopened_slot_ids)
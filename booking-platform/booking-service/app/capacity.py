@@ -0,0 +1,163 @@
+import logging
+from datetime import datetime
+
+from app.db import cockroach_connection, run_transaction
+from app.availability import invalidate_road_availability, DEFAULT_ROAD_CAPACITY
+from app.admission import forget_slot_capacity
+from app.const import CAPACITY_PROPAGATION_CHUNK_SIZE
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Most roads listed in a dry-run report
+DRY_RUN_REPORT_LIMIT = 100
+
+# The capacity a slot should have: the road's hourly capacity (or the one
+# about to be set), never less than what is already booked on the slot.
+# Slots closed by a road closure have zero capacity and are left alone
+_TARGET_CAPACITY = """
+    GREATEST(
+        COALESCE(%s::INT, NULLIF(r.hourly_capacity, 0), %s),
+        rbs.capacity - rbs.available_capacity
+    )
+"""
+
+
+def road_filter(road_ids=None, region_id=None, road_type=None):
+    """SQL condition on roads r and its parameters for the given selection"""
+    conditions = []
+    params = []
+
+    if road_ids:
+        conditions.append("r.id = ANY(%s::UUID[])")
+        params.append([str(road_id) for road_id in road_ids])
+    if region_id:
+        conditions.append("r.region_id = %s")
+        params.append(region_id)
+    if road_type:
+        conditions.append("r.road_type = %s")
+        params.append(road_type)
+
+    if not conditions:
+        raise ValueError("A road selection is required")
+
+    return " AND ".join(conditions), params
+
+
+def set_hourly_capacity(cursor, hourly_capacity, road_ids=None, region_id=None, road_type=None):
+    """Set roads.hourly_capacity for every selected road, returns the number of roads"""
+    condition, params = road_filter(road_ids, region_id, road_type)
+    cursor.execute(f"UPDATE roads AS r SET hourly_capacity = %s WHERE {condition}", [hourly_capacity] + params)
+    return cursor.rowcount
+
+
+def capacity_change_report(hourly_capacity=None, road_ids=None, region_id=None, road_type=None):
+    """
+    Dry run: which future slots of the selected roads would change, and how
+    many of them would be held above the new capacity by existing bookings
+    """
+    condition, params = road_filter(road_ids, region_id, road_type)
+    now = datetime.utcnow()
+
+    with cockroach_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT rbs.road_id, r.name,
+                       COUNT(*) AS slots_affected,
+                       COUNT(*) FILTER (
+                           WHERE rbs.capacity - rbs.available_capacity
+                                 > COALESCE(%s::INT, NULLIF(r.hourly_capacity, 0), %s)
+                       ) AS slots_clamped,
+                       MIN(rbs.capacity) AS min_capacity,
+                       MAX(rbs.capacity) AS max_capacity,
+                       MAX({_TARGET_CAPACITY}) AS max_new_capacity
+                FROM road_booking_slots rbs
+                JOIN roads r ON r.id = rbs.road_id
+                WHERE {condition}
+                AND rbs.slot_time > %s
+                AND rbs.capacity > 0
+                AND rbs.capacity != {_TARGET_CAPACITY}
+                GROUP BY rbs.road_id, r.name
+                ORDER BY slots_affected DESC
+            """, [hourly_capacity, DEFAULT_ROAD_CAPACITY, hourly_capacity, DEFAULT_ROAD_CAPACITY]
+                 + params + [now, hourly_capacity, DEFAULT_ROAD_CAPACITY])
+            rows = cursor.fetchall()
+        conn.commit()
+
+        return {
+            "roads_affected": len(rows),
+            "slots_affected": sum(row[2] for row in rows),
+            "slots_clamped": sum(row[3] for row in rows),
+            "roads": [
+                {
+                    "road_id": str(row[0]),
+                    "name": row[1],
+                    "slots_affected": row[2],
+                    "slots_clamped": row[3],
+                    "current_capacity_range": [row[4], row[5]],
+                    "max_new_capacity": row[6]
+                }
+                for row in rows[:DRY_RUN_REPORT_LIMIT]
+            ]
+        }
+
+
+def propagate_road_capacity(road_ids=None, region_id=None, road_type=None, chunk_size=CAPACITY_PROPAGATION_CHUNK_SIZE):
+    """
+    Bring every future slot of the selected roads in line with the road's
+    hourly_capacity, chunk_size slots per transaction. Closed slots stay
+    closed.
+
+    Booked quantity is never taken away: a slot booked above the new
+    capacity keeps capacity equal to its booked quantity and no free room.
+    Only slots that still differ are picked, so each chunk makes progress
+    and the job can be re-run safely. Returns (slots_updated, slots_clamped).
+    """
+    condition, params = road_filter(road_ids, region_id, road_type)
+    now = datetime.utcnow()
+    updated = 0
+    clamped = 0
+
+    def update_chunk(cursor):
+        cursor.execute(f"""
+            UPDATE road_booking_slots AS rbs
+            SET capacity = {_TARGET_CAPACITY},
+                available_capacity = {_TARGET_CAPACITY} - (rbs.capacity - rbs.available_capacity)
+            FROM roads r
+            WHERE r.id = rbs.road_id
+            AND rbs.road_booking_slot_id IN (
+                SELECT rbs.road_booking_slot_id
+                FROM road_booking_slots rbs
+                JOIN roads r ON r.id = rbs.road_id
+                WHERE {condition}
+                AND rbs.slot_time > %s
+                AND rbs.capacity > 0
+                AND rbs.capacity != {_TARGET_CAPACITY}
+                LIMIT %s
+            )
+            RETURNING rbs.road_booking_slot_id, rbs.road_id,
+                      rbs.capacity > COALESCE(NULLIF(r.hourly_capacity, 0), %s)
+        """, [None, DEFAULT_ROAD_CAPACITY, None, DEFAULT_ROAD_CAPACITY]
+             + params + [now, None, DEFAULT_ROAD_CAPACITY, chunk_size, DEFAULT_ROAD_CAPACITY])
+        return cursor.fetchall()
+
+    with cockroach_connection() as conn:
+        while True:
+            rows = run_transaction(conn, update_chunk)
+            if not rows:
+                break
+
+            updated += len(rows)
+            clamped += sum(1 for row in rows if row[2])
+
+            invalidate_road_availability(sorted({str(row[1]) for row in rows}))
+            forget_slot_capacity([str(row[0]) for row in rows])
+
+            if len(rows) < chunk_size:
+                break
+
+        if updated:
+            logger.info(f"Propagated road capacity to {updated} future slots")
+        return updated, clamped
+
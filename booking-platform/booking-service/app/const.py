@@ -3,10 +3,97 @@ import os
 # Session and Token Constants
 SESSION_EXPIRY_SECONDS = os.getenv("SESSION_EXPIRY_SECONDS", 3600)
 TOKEN_EXPIRY_HOURS = os.getenv("TOKEN_EXPIRY_HOURS", 1)
+SESSION_CACHE_SECONDS = float(os.getenv("SESSION_CACHE_SECONDS", 5))
+SESSION_TOUCH_INTERVAL_SECONDS = int(os.getenv("SESSION_TOUCH_INTERVAL_SECONDS", 60))
+SESSION_REVOCATION_CHANNEL = "session:revocations"
+
+# Password hashing
+BCRYPT_LOG_ROUNDS = int(os.getenv("BCRYPT_LOG_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 8))
+PASSWORD_HASH_TIMEOUT_SECONDS = float(os.getenv("PASSWORD_HASH_TIMEOUT_SECONDS", 10))
+
+# Availability cache
+AVAILABILITY_CACHE_TTL_SECONDS = int(os.getenv("AVAILABILITY_CACHE_TTL_SECONDS", 60))
+
+# Slot materialiser
+SLOT_MATERIALIZER_INTERVAL_SECONDS = int(os.getenv("SLOT_MATERIALIZER_INTERVAL_SECONDS", 900))
+SLOT_MATERIALIZER_BATCH_ROADS = int(os.getenv("SLOT_MATERIALIZER_BATCH_ROADS", 50))
+SLOT_MATERIALIZER_LOOKAHEAD_DAYS = int(os.getenv("SLOT_MATERIALIZER_LOOKAHEAD_DAYS", 1))
+SLOT_MERGE_BATCH_SIZE = int(os.getenv("SLOT_MERGE_BATCH_SIZE", 200))
+
+# One-off startup tasks such as schema upgrades, retried until they succeed
+STARTUP_TASK_RETRY_SECONDS = int(os.getenv("STARTUP_TASK_RETRY_SECONDS", 30))
+STARTUP_TASK_LOCK_SECONDS = int(os.getenv("STARTUP_TASK_LOCK_SECONDS", 600))
+
+# gevent serving mode; the pool below is shared by all greenlets of a worker
+GEVENT_ENABLED = os.getenv("GEVENT_ENABLED", "False") == "True"
+
+# CockroachDB connection pool, per process
+COCKROACH_POOL_MAX_SIZE = int(os.getenv("COCKROACH_POOL_MAX_SIZE", 10))
+COCKROACH_POOL_TIMEOUT_SECONDS = float(os.getenv("COCKROACH_POOL_TIMEOUT_SECONDS", 5))
+COCKROACH_POOL_MAX_LIFETIME_SECONDS = int(os.getenv("COCKROACH_POOL_MAX_LIFETIME_SECONDS", 1800))
+COCKROACH_POOL_VALIDATE_AFTER_SECONDS = int(os.getenv("COCKROACH_POOL_VALIDATE_AFTER_SECONDS", 30))
+COCKROACH_POOL_LONG_HOLD_SECONDS = float(os.getenv("COCKROACH_POOL_LONG_HOLD_SECONDS", 5))
+
+# CockroachDB transaction retries
+COCKROACH_TXN_MAX_RETRIES = int(os.getenv("COCKROACH_TXN_MAX_RETRIES", 5))
+COCKROACH_TXN_BACKOFF_BASE_MS = int(os.getenv("COCKROACH_TXN_BACKOFF_BASE_MS", 10))
+COCKROACH_TXN_BACKOFF_MAX_MS = int(os.getenv("COCKROACH_TXN_BACKOFF_MAX_MS", 500))
+
+# Idempotency keys for create-booking
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 60))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 10))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# Redis admission control for hot booking slots
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "False") == "True"
+ADMISSION_COUNTER_TTL_SECONDS = int(os.getenv("ADMISSION_COUNTER_TTL_SECONDS", 300))
+
+# Asynchronous booking pipeline
+ASYNC_BOOKING_ENABLED = os.getenv("ASYNC_BOOKING_ENABLED", "False") == "True"
+BOOKING_STREAM = "booking:requests"
+BOOKING_STREAM_GROUP = "booking-workers"
+BOOKING_STREAM_MAXLEN = int(os.getenv("BOOKING_STREAM_MAXLEN", 100000))
+BOOKING_TICKET_TTL_SECONDS = int(os.getenv("BOOKING_TICKET_TTL_SECONDS", 86400))
+BOOKING_WORKER_BATCH_SIZE = int(os.getenv("BOOKING_WORKER_BATCH_SIZE", 20))
+BOOKING_WORKER_BLOCK_MS = int(os.getenv("BOOKING_WORKER_BLOCK_MS", 5000))
+BOOKING_WORKER_CLAIM_IDLE_MS = int(os.getenv("BOOKING_WORKER_CLAIM_IDLE_MS", 60000))
+BOOKING_WORKER_MAX_DELIVERIES = int(os.getenv("BOOKING_WORKER_MAX_DELIVERIES", 5))
+
+# Bulk (fleet) booking
+BULK_BOOKING_MAX_ITEMS = int(os.getenv("BULK_BOOKING_MAX_ITEMS", 200))
+BULK_BOOKING_CHUNK_SIZE = int(os.getenv("BULK_BOOKING_CHUNK_SIZE", 25))
+
+# Slot holds between availability check and confirmation
+HOLD_TTL_SECONDS = int(os.getenv("HOLD_TTL_SECONDS", 120))
+HOLD_MAX_TTL_SECONDS = int(os.getenv("HOLD_MAX_TTL_SECONDS", 600))
+HOLD_SWEEP_INTERVAL_SECONDS = int(os.getenv("HOLD_SWEEP_INTERVAL_SECONDS", 15))
+HOLD_SWEEP_BATCH_SIZE = int(os.getenv("HOLD_SWEEP_BATCH_SIZE", 100))
+
+# Road closures cancel this many bookings per transaction
+ROAD_CLOSURE_CHUNK_SIZE = int(os.getenv("ROAD_CLOSURE_CHUNK_SIZE", 100))
+
+# Road capacity changes are applied to this many future slots per transaction
+CAPACITY_PROPAGATION_CHUNK_SIZE = int(os.getenv("CAPACITY_PROPAGATION_CHUNK_SIZE", 500))
+
+# Booking listings
+USER_BOOKINGS_PAGE_SIZE = int(os.getenv("USER_BOOKINGS_PAGE_SIZE", 50))
+USER_BOOKINGS_MAX_PAGE_SIZE = int(os.getenv("USER_BOOKINGS_MAX_PAGE_SIZE", 200))
+BOOKING_SUMMARY_BACKFILL_BATCH = int(os.getenv("BOOKING_SUMMARY_BACKFILL_BATCH", 500))
 
 # Database Constants
 COCKROACHDB_USERS_TABLE = "users"
 MONGODB_LICENSES_COLLECTION = "user_licenses"
+MONGODB_LICENSE_BUCKET = "license_images"
+LICENSE_CHUNK_SIZE_BYTES = 255 * 1024
+LICENSE_THUMB_PX = int(os.getenv("LICENSE_THUMB_PX", 200))
+LICENSE_WEB_PX = int(os.getenv("LICENSE_WEB_PX", 1024))
+LICENSE_CACHE_MAX_AGE_SECONDS = int(os.getenv("LICENSE_CACHE_MAX_AGE_SECONDS", 86400))
+LICENSE_SWEEP_INTERVAL_SECONDS = int(os.getenv("LICENSE_SWEEP_INTERVAL_SECONDS", 3600))
+LICENSE_SWEEP_BATCH_SIZE = int(os.getenv("LICENSE_SWEEP_BATCH_SIZE", 200))
+LICENSE_ORPHAN_GRACE_SECONDS = int(os.getenv("LICENSE_ORPHAN_GRACE_SECONDS", 3600))
 
 # Error Messages
 ERROR_MISSING_FIELDS = "All fields are required"
@@ -17,6 +104,7 @@ ERROR_UNAUTHORIZED_ACCESS = "Unauthorized access"
 ERROR_SESSION_EXPIRED = "Session expired. Log in again"
 ERROR_DATABASE = "Database error"
 ERROR_UNEXPECTED = "An unexpected error occurred"
+ERROR_SERVICE_BUSY = "Service is busy, please try again"
 
 # Success Messages
 SUCCESS_REGISTRATION = "Registration successful"
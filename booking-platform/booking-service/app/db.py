@@ -1,13 +1,37 @@
 import psycopg2
-from psycopg2 import pool
+from contextlib import contextmanager
+from flask import g, has_request_context
+from psycopg2 import errors, pool
 from pymongo import MongoClient
 import redis
+import logging
 import os
+import random
+import sys
+import threading
+import time
 
-# create a connection to mongo client
+from app.const import (
+    COCKROACH_POOL_MAX_SIZE,
+    COCKROACH_POOL_TIMEOUT_SECONDS,
+    COCKROACH_POOL_MAX_LIFETIME_SECONDS,
+    COCKROACH_POOL_VALIDATE_AFTER_SECONDS,
+    COCKROACH_POOL_LONG_HOLD_SECONDS,
+    COCKROACH_TXN_MAX_RETRIES,
+    COCKROACH_TXN_BACKOFF_BASE_MS,
+    COCKROACH_TXN_BACKOFF_MAX_MS,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# create a connection to mongo client; it connects on first use, so a
+# preloading server can fork before any socket is opened
 mongo_client = MongoClient(
     host=os.getenv("MONGODB_HOST"),
-    port=int(os.getenv("MONGODB_PORT"))
+    port=int(os.getenv("MONGODB_PORT")),
+    connect=False
 )
 
 # extract the database "booking_db"
@@ -20,9 +44,223 @@ redis_client = redis.StrictRedis(
     decode_responses=True
 )
 
-# cockroach connection pools
-cockroach_pool = pool.SimpleConnectionPool(
-    1, 10,
+class PoolTimeout(pool.PoolError):
+    """No pooled connection became free within the checkout timeout"""
+
+
+class CockroachPool:
+    """
+    Thread-safe pool of at most maxconn CockroachDB connections.
+
+    Connections are opened on demand and reused most recently returned
+    first. A checkout waits up to timeout seconds for a free connection and
+    then raises PoolTimeout. A connection idle for longer than
+    validate_after seconds is checked with SELECT 1 before it is handed
+    out. Closed or broken connections, and connections older than
+    max_lifetime seconds, are closed instead of reused. A connection
+    returned inside a transaction is rolled back.
+
+    Every checkout records its call site. A connection held for longer than
+    long_hold seconds is logged with that site when it comes back, and
+    listed by stats() while it is still out.
+    """
+
+    def __init__(self, maxconn, timeout, max_lifetime, validate_after, long_hold, **connect_kwargs):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.validate_after = validate_after
+        self.long_hold = long_hold
+        self._connect_kwargs = connect_kwargs
+        self._idle = []  # (conn, returned_at)
+        self._opened_at = {}  # conn -> monotonic time it was opened
+        self._checked_out = {}  # conn -> (call site, thread name, checked out at)
+        self._retired = set()  # checked out connections to close when returned
+        self._inherited = []  # connections of the parent process, see reset_after_fork
+        self._size = 0
+        self._waiting = 0
+        self._counters = self._new_counters()
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def _new_counters():
+        return {
+            "checkouts": 0, "timeouts": 0, "opened": 0, "closed": 0,
+            "validation_failures": 0, "long_holds": 0,
+            "total_wait_ms": 0.0, "max_wait_ms": 0.0
+        }
+
+    def _open(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        with self._cond:
+            self._opened_at[conn] = time.monotonic()
+            self._counters["opened"] += 1
+        return conn
+
+    def _expired(self, conn, now):
+        return now - self._opened_at.get(conn, now) >= self.max_lifetime
+
+    def _is_usable(self, conn, returned_at):
+        now = time.monotonic()
+        if conn.closed or self._expired(conn, now):
+            return False
+        if now - returned_at < self.validate_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            with self._cond:
+                self._counters["validation_failures"] += 1
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._opened_at.pop(conn, None)
+            self._size -= 1
+            self._counters["closed"] += 1
+            self._cond.notify()
+
+    def _checked_out_to(self, conn, site, started):
+        now = time.monotonic()
+        wait_ms = (now - started) * 1000
+        with self._cond:
+            self._checked_out[conn] = (site, threading.current_thread().name, now)
+            self._counters["checkouts"] += 1
+            self._counters["total_wait_ms"] += wait_ms
+            self._counters["max_wait_ms"] = max(self._counters["max_wait_ms"], wait_ms)
+        return conn
+
+    def getconn(self, timeout=None, site=None):
+        started = time.monotonic()
+        deadline = started + (self.timeout if timeout is None else timeout)
+
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise PoolTimeout(f"no CockroachDB connection free after {self.timeout}s")
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    self._size += 1
+                    conn = None
+
+            if conn is None:
+                try:
+                    return self._checked_out_to(self._open(), site, started)
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            if self._is_usable(conn, returned_at):
+                return self._checked_out_to(conn, site, started)
+            self._discard(conn)
+
+    def putconn(self, conn):
+        with self._cond:
+            site, thread_name, checked_out_at = self._checked_out.pop(conn, (None, None, None))
+            retired = conn in self._retired
+            self._retired.discard(conn)
+        if checked_out_at is not None:
+            held = time.monotonic() - checked_out_at
+            if held >= self.long_hold:
+                with self._cond:
+                    self._counters["long_holds"] += 1
+                logger.warning(f"CockroachDB connection held for {held:.1f}s by {site} ({thread_name})")
+
+        if not conn.closed:
+            status = conn.get_transaction_status()
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+
+        if (retired
+                or conn.closed
+                or conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+                or self._expired(conn, time.monotonic())):
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        """Close the idle connections; checked out ones are closed when returned"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._retired.update(self._checked_out)
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def reset_after_fork(self):
+        """
+        Start over empty in a forked child. The inherited connections share
+        their sockets with the parent, so they are kept referenced but never
+        used or closed here; closing them would end the parent's sessions.
+        """
+        self._inherited.extend(conn for conn, _ in self._idle)
+        self._inherited.extend(self._checked_out)
+        self._idle = []
+        self._opened_at = {}
+        self._checked_out = {}
+        self._retired = set()
+        self._size = 0
+        self._waiting = 0
+        self._counters = self._new_counters()
+        self._cond = threading.Condition()
+
+    def stats(self):
+        """Gauges and counters of the pool, and the checkouts held too long"""
+        now = time.monotonic()
+        with self._cond:
+            stats = dict(self._counters)
+            stats.update(
+                size=self._size,
+                max_size=self.maxconn,
+                in_use=len(self._checked_out),
+                idle=len(self._idle),
+                waiting=self._waiting
+            )
+            held_too_long = [
+                {"site": site, "thread": thread_name, "held_seconds": round(now - checked_out_at, 1)}
+                for site, thread_name, checked_out_at in self._checked_out.values()
+                if now - checked_out_at >= self.long_hold
+            ]
+
+        total_wait_ms = stats.pop("total_wait_ms")
+        stats["avg_wait_ms"] = round(total_wait_ms / stats["checkouts"], 1) if stats["checkouts"] else 0.0
+        stats["max_wait_ms"] = round(stats["max_wait_ms"], 1)
+        stats["held_too_long"] = sorted(held_too_long, key=lambda hold: -hold["held_seconds"])
+        return stats
+
+
+# cockroach connection pool of this process
+cockroach_pool = CockroachPool(
+    maxconn=COCKROACH_POOL_MAX_SIZE,
+    timeout=COCKROACH_POOL_TIMEOUT_SECONDS,
+    max_lifetime=COCKROACH_POOL_MAX_LIFETIME_SECONDS,
+    validate_after=COCKROACH_POOL_VALIDATE_AFTER_SECONDS,
+    long_hold=COCKROACH_POOL_LONG_HOLD_SECONDS,
     dbname=os.getenv("COCKROACHDB_DATABASE", "booking"),
     user=os.getenv("COCKROACHDB_USER", "root"),
     password=os.getenv("COCKROACHDB_PASSWORD", ""),
@@ -30,19 +268,30 @@ cockroach_pool = pool.SimpleConnectionPool(
     port=os.getenv("COCKROACHDB_PORT", "26257"),
 )
 
+def _call_site(depth):
+    """module:line of the function depth frames above the caller"""
+    frame = sys._getframe(depth + 1)
+    return f"{frame.f_globals.get('__name__')}:{frame.f_lineno} in {frame.f_code.co_name}"
+
+
+def get_pool_stats():
+    return cockroach_pool.stats()
+
+
+def reset_clients_after_fork():
+    """
+    Give a forked worker its own database clients, called from gunicorn's
+    post_fork. Redis and CockroachDB pools are emptied without closing the
+    parent's sockets. The Mongo client is created with connect=False and
+    only connects in the workers.
+    """
+    cockroach_pool.reset_after_fork()
+    redis_client.connection_pool.reset()
+
+
 # function to get a cockroach connection from pool
-def get_cockroach_connection():
-    import psycopg2
-    db_name = "booking_test" if os.getenv("TESTING", "False") == "True" else "booking"
-    conn = psycopg2.connect(
-        host=os.getenv("COCKROACHDB_HOST", "localhost"),
-        port=os.getenv("COCKROACHDB_PORT", 26257),
-        user=os.getenv("DB_USER", "root"),
-        password=os.getenv("DB_PASSWORD", ""),
-        dbname=db_name,
-        sslmode="disable"
-    )
-    return cockroach_pool.getconn()
+def get_cockroach_connection(site=None):
+    return cockroach_pool.getconn(site=site or _call_site(1))
 
 
 # function to release the cockroach connection to pool
@@ -53,3 +302,132 @@ def release_cockroach_connection(conn):
     except psycopg2.DatabaseError as e:
         print(f"Error releasing CockroachDB connection: {e}")
 
+
+def _finish_request_block(conn):
+    """Leave the request connection idle, or drop it if it is broken"""
+    if not conn.closed and conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        return
+    try:
+        conn.rollback()
+    except psycopg2.Error:
+        g.pop("cockroach_conn", None)
+        release_cockroach_connection(conn)
+
+
+@contextmanager
+def cockroach_connection():
+    """
+    Borrow a connection for the duration of a with block. Leftover
+    transactions are rolled back on exit.
+
+    Inside a request, all blocks share one connection. It is checked out
+    on first use and returned by release_request_connection when the
+    request is torn down. A block nested in another gets a connection of
+    its own, so it cannot commit or roll back the outer block's
+    transaction. Outside a request, every block checks a connection out of
+    the pool and returns it on exit.
+    """
+    # The caller is behind contextlib's __enter__
+    site = _call_site(2)
+
+    if not has_request_context() or g.get("cockroach_conn_in_use"):
+        conn = get_cockroach_connection(site=site)
+        try:
+            yield conn
+        finally:
+            release_cockroach_connection(conn)
+        return
+
+    conn = g.get("cockroach_conn")
+    if conn is None:
+        conn = g.cockroach_conn = get_cockroach_connection(site=site)
+
+    g.cockroach_conn_in_use = True
+    try:
+        yield conn
+    finally:
+        g.cockroach_conn_in_use = False
+        _finish_request_block(conn)
+
+
+def release_request_connection(exc=None):
+    """Return the connection of the current request to the pool, at teardown"""
+    conn = g.pop("cockroach_conn", None)
+    if conn is not None:
+        release_cockroach_connection(conn)
+
+
+class TransactionAborted(Exception):
+    """Raised inside a transaction body to roll back and return result instead"""
+    def __init__(self, result):
+        super().__init__("transaction aborted")
+        self.result = result
+
+
+# per-process transaction counters
+_transaction_stats = {"committed": 0, "aborted": 0, "retries": 0, "exhausted": 0}
+_transaction_stats_lock = threading.Lock()
+
+
+def _count_transaction(field, amount=1):
+    with _transaction_stats_lock:
+        _transaction_stats[field] += amount
+
+
+def get_transaction_stats():
+    with _transaction_stats_lock:
+        return dict(_transaction_stats)
+
+
+# function to run fn(cursor) as a retried cockroach transaction
+def run_transaction(conn, fn, max_retries=COCKROACH_TXN_MAX_RETRIES):
+    """
+    Run fn(cursor) inside a transaction using CockroachDB's client-side retry
+    protocol (SAVEPOINT cockroach_restart). On a 40001 serialization failure
+    the transaction is rolled back to the savepoint and fn is run again, up to
+    max_retries times with jittered exponential backoff.
+
+    conn must not hold uncommitted work; a leftover read transaction is
+    rolled back first. fn may raise TransactionAborted(result) to roll back
+    and return result. Any other exception rolls back and propagates; when
+    retries run out the last SerializationFailure is raised.
+    """
+    autocommit = conn.autocommit
+    if autocommit:
+        conn.autocommit = False
+    elif conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        # the restart savepoint has to be the first statement of the transaction
+        conn.rollback()
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SAVEPOINT cockroach_restart")
+            attempt = 0
+            while True:
+                try:
+                    result = fn(cursor)
+                    cursor.execute("RELEASE SAVEPOINT cockroach_restart")
+                    conn.commit()
+                    _count_transaction("committed")
+                    return result
+                except errors.SerializationFailure:
+                    if attempt >= max_retries:
+                        _count_transaction("exhausted")
+                        conn.rollback()
+                        raise
+                    cursor.execute("ROLLBACK TO SAVEPOINT cockroach_restart")
+                    attempt += 1
+                    _count_transaction("retries")
+                    backoff_ms = min(COCKROACH_TXN_BACKOFF_MAX_MS, COCKROACH_TXN_BACKOFF_BASE_MS * 2 ** attempt)
+                    time.sleep(random.uniform(0, backoff_ms) / 1000)
+                except TransactionAborted as e:
+                    conn.rollback()
+                    _count_transaction("aborted")
+                    return e.result
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        if autocommit and not conn.closed:
+            conn.autocommit = True
@@ -0,0 +1,23 @@
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def patch_for_gevent():
+    """
+    Make blocking I/O cooperative for gunicorn's gevent worker.
+
+    The standard library is monkey-patched, which covers the sockets of
+    redis-py and pymongo and the threads and locks of the connection pool.
+    psycopg2 talks to CockroachDB through libpq, so it gets a wait callback
+    from psycogreen instead. Has to run before anything opens a socket.
+    """
+    from gevent import monkey
+    if not monkey.is_module_patched("socket"):
+        monkey.patch_all()
+
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+    logger.info("Serving with gevent: cooperative I/O for psycopg2, pymongo and redis")
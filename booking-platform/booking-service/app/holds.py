@@ -0,0 +1,158 @@
+import json
+import logging
+import time
+from datetime import datetime
+
+from app.db import cockroach_connection, redis_client, run_transaction
+from app.availability import invalidate_availability
+from app.admission import forget_slot_capacity
+from app.const import HOLD_SWEEP_BATCH_SIZE
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Hold ids scored by their expiry time
+HOLD_INDEX_KEY = "booking:holds"
+BOOKING_HOLD_KEY = "booking:hold:{hold_id}"
+
+
+def _hold_key(hold_id):
+    return BOOKING_HOLD_KEY.format(hold_id=hold_id)
+
+
+def _encode_lines(lines, slot_ids):
+    return json.dumps([
+        {
+            "slot_id": slot_id,
+            "road_id": str(line["road_id"]),
+            "slot_start": line["slot_start"].isoformat(),
+            "quantity": line["quantity"]
+        }
+        for slot_id, line in zip(slot_ids, lines)
+    ])
+
+
+def _decode_lines(value):
+    lines = json.loads(value)
+    for line in lines:
+        line["slot_start"] = datetime.fromisoformat(line["slot_start"])
+    return lines
+
+
+def save_hold(hold_id, username, lines, slot_ids, ttl_seconds):
+    """
+    Record a hold whose capacity has already been taken in the database.
+    The record has no TTL: it is the only note of which slots to give back,
+    so it stays until the capacity has been returned or booked.
+    """
+    expires_at = time.time() + ttl_seconds
+
+    pipe = redis_client.pipeline()
+    pipe.hset(_hold_key(hold_id), mapping={
+        "username": username,
+        "lines": _encode_lines(lines, slot_ids),
+        "expires_at": expires_at
+    })
+    pipe.zadd(HOLD_INDEX_KEY, {hold_id: expires_at})
+    pipe.execute()
+
+    return expires_at
+
+
+def get_hold(hold_id):
+    """Return a stored hold, or None if it is unknown"""
+    hold = redis_client.hgetall(_hold_key(hold_id))
+    if not hold:
+        return None
+    hold["lines"] = _decode_lines(hold["lines"])
+    hold["expires_at"] = float(hold["expires_at"])
+    return hold
+
+
+def claim_hold(hold_id):
+    """
+    Take a hold out of the index. Only one caller - a confirm, a cancel or
+    the sweeper - wins, and that caller owns the held capacity.
+    """
+    return redis_client.zrem(HOLD_INDEX_KEY, hold_id) == 1
+
+
+def drop_hold(hold_id):
+    redis_client.delete(_hold_key(hold_id))
+
+
+def give_back_capacity(cursor, lines):
+    """
+    Return the capacity of held lines to their slots in one statement. A
+    slot closed in the meantime has zero capacity and stays closed.
+    """
+    slot_demand = {}
+    for line in lines:
+        slot_demand[line["slot_id"]] = slot_demand.get(line["slot_id"], 0) + line["quantity"]
+
+    cursor.execute("""
+        UPDATE road_booking_slots AS rbs
+        SET available_capacity = LEAST(rbs.capacity, rbs.available_capacity + d.quantity)
+        FROM (SELECT unnest(%s::UUID[]) AS slot_id, unnest(%s::INT[]) AS quantity) AS d
+        WHERE rbs.road_booking_slot_id = d.slot_id
+    """, (sorted(slot_demand), [slot_demand[slot_id] for slot_id in sorted(slot_demand)]))
+
+
+def release_holds(holds):
+    """Give the capacity of holds back in a single transaction"""
+    lines = [line for hold in holds for line in hold["lines"]]
+    if not lines:
+        return
+
+    with cockroach_connection() as conn:
+        run_transaction(conn, lambda cursor: give_back_capacity(cursor, lines))
+
+    invalidate_availability((line["road_id"], line["slot_start"]) for line in lines)
+    forget_slot_capacity(sorted({line["slot_id"] for line in lines}))
+
+
+def release_claimed_holds(claimed):
+    """
+    Give back the capacity of claimed holds, given as {hold_id: hold}, and
+    drop their records. If the release fails the holds go back into the
+    index as already expired, records intact, for the sweeper to retry.
+    """
+    try:
+        release_holds(list(claimed.values()))
+    except Exception:
+        redis_client.zadd(HOLD_INDEX_KEY, {hold_id: 0 for hold_id in claimed})
+        raise
+
+    redis_client.delete(*[_hold_key(hold_id) for hold_id in claimed])
+
+
+def sweep_expired_holds():
+    """Release expired holds, HOLD_SWEEP_BATCH_SIZE at a time"""
+    released = 0
+
+    while True:
+        hold_ids = redis_client.zrangebyscore(HOLD_INDEX_KEY, "-inf", time.time(), start=0, num=HOLD_SWEEP_BATCH_SIZE)
+        if not hold_ids:
+            break
+
+        claimed = {}
+        for hold_id in hold_ids:
+            if not claim_hold(hold_id):
+                continue  # confirmed or cancelled in the meantime
+            hold = get_hold(hold_id)
+            if hold:
+                claimed[hold_id] = hold
+            else:
+                logger.warning(f"Expired hold {hold_id} has no record, its capacity cannot be released")
+
+        if claimed:
+            release_claimed_holds(claimed)
+            released += len(claimed)
+
+        if len(hold_ids) < HOLD_SWEEP_BATCH_SIZE:
+            break
+
+    if released:
+        logger.info(f"Released {released} expired booking holds")
+    return released
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import logging
+import time
+
+from app.db import redis_client
+from app.const import (
+    IDEMPOTENCY_TTL_SECONDS,
+    IDEMPOTENCY_LOCK_SECONDS,
+    IDEMPOTENCY_WAIT_SECONDS,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY = "idempotency:{username}:{key}"
+
+# How often a duplicate request checks whether the original has finished
+IDEMPOTENCY_POLL_SECONDS = 0.1
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used with a different request body"""
+
+
+class IdempotencyInProgress(Exception):
+    """The original request is still running after the wait period"""
+
+
+def request_fingerprint(data):
+    """Stable hash of a JSON request body"""
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def begin_idempotent_request(username, key, fingerprint):
+    """
+    Claim an idempotency key for a request.
+
+    Returns None when the caller owns the key and must run the request,
+    or (body, status) of the stored result when it already completed.
+    A concurrent duplicate waits up to IDEMPOTENCY_WAIT_SECONDS for the
+    in-flight request to finish before IdempotencyInProgress is raised.
+    """
+    redis_key = IDEMPOTENCY_KEY.format(username=username, key=key)
+    claim = json.dumps({"state": "in_progress", "fingerprint": fingerprint})
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+
+    while True:
+        # The claim expires on its own if the owner dies mid-request
+        if redis_client.set(redis_key, claim, nx=True, ex=IDEMPOTENCY_LOCK_SECONDS):
+            return None
+
+        stored = redis_client.get(redis_key)
+        if stored is None:
+            continue
+
+        stored = json.loads(stored)
+        if stored["fingerprint"] != fingerprint:
+            raise IdempotencyConflict()
+
+        if stored["state"] == "done":
+            return stored["body"], stored["status"]
+
+        if time.monotonic() >= deadline:
+            raise IdempotencyInProgress()
+
+        time.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+
+def complete_idempotent_request(username, key, fingerprint, body, status):
+    """Store the result of a request so replays return it unchanged"""
+    redis_key = IDEMPOTENCY_KEY.format(username=username, key=key)
+    redis_client.setex(redis_key, IDEMPOTENCY_TTL_SECONDS, json.dumps({
+        "state": "done",
+        "fingerprint": fingerprint,
+        "body": body,
+        "status": status
+    }))
+
+
+def release_idempotent_request(username, key):
+    """Give up a claim so the client can retry the request with the same key"""
+    redis_client.delete(IDEMPOTENCY_KEY.format(username=username, key=key))
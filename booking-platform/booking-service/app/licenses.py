@@ -0,0 +1,527 @@
+import hashlib
+import io
+import logging
+from datetime import datetime, timedelta
+
+import gridfs
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from PIL import Image
+
+from app.db import cockroach_connection, mongo_db
+from app.const import (
+    COCKROACHDB_USERS_TABLE,
+    MONGODB_LICENSES_COLLECTION,
+    MONGODB_LICENSE_BUCKET,
+    LICENSE_CHUNK_SIZE_BYTES,
+    LICENSE_THUMB_PX,
+    LICENSE_WEB_PX,
+    LICENSE_SWEEP_BATCH_SIZE,
+    LICENSE_ORPHAN_GRACE_SECONDS,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Renditions served next to the original, by their longest side in pixels
+LICENSE_SIZES = {"thumb": LICENSE_THUMB_PX, "web": LICENSE_WEB_PX}
+LICENSE_ORIGINAL = "original"
+
+# Uploads of the same bytes racing each other settle within a few rounds
+LICENSE_STORE_ATTEMPTS = 3
+
+license_bucket = gridfs.GridFSBucket(
+    mongo_db,
+    bucket_name=MONGODB_LICENSE_BUCKET,
+    chunk_size_bytes=LICENSE_CHUNK_SIZE_BYTES
+)
+
+
+class LicenseImage:
+    """A stored license image: its metadata and a seekable stream of its bytes"""
+
+    def __init__(self, filename, length, stream, last_modified, etag):
+        self.filename = filename
+        self.length = length
+        self.stream = stream
+        self.last_modified = last_modified
+        self.etag = etag
+
+    @property
+    def mimetype(self):
+        return f"image/{self.filename.split('.')[-1]}"
+
+    def read(self):
+        try:
+            return self.stream.read()
+        finally:
+            self.stream.close()
+
+    def iter_range(self, start, stop):
+        """Yield the bytes from start up to stop, one chunk at a time"""
+        self.stream.seek(start)
+        remaining = stop - start
+        try:
+            while remaining > 0:
+                chunk = self.stream.read(min(LICENSE_CHUNK_SIZE_BYTES, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            self.stream.close()
+
+
+def _object_id(license_image_id):
+    try:
+        return ObjectId(license_image_id)
+    except (InvalidId, TypeError):
+        return None
+
+
+def _files():
+    return mongo_db[f"{MONGODB_LICENSE_BUCKET}.files"]
+
+
+def _content_hash(stream):
+    """SHA-256 of a seekable upload stream, read in chunks and rewound"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(LICENSE_CHUNK_SIZE_BYTES), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def _chunks():
+    return mongo_db[f"{MONGODB_LICENSE_BUCKET}.chunks"]
+
+
+def _add_reference(sha256, username):
+    """
+    Record username as a user of the stored image with this content hash.
+    Returns (image id, whether a reference was added), or (None, False) if
+    no such image is stored. A retried upload by the same user does not add
+    a second reference.
+
+    The lookup and the reference are one update, and an image whose last
+    reference is gone is never matched, so a concurrent release cannot
+    delete the image from under the new reference.
+    """
+    files_entry = _files().find_one_and_update(
+        {
+            "metadata.sha256": sha256,
+            "metadata.ref_count": {"$gt": 0},
+            "metadata.owners": {"$ne": username}
+        },
+        {
+            "$push": {"metadata.owners": username},
+            "$inc": {"metadata.ref_count": 1},
+            "$set": {"metadata.referenced_at": datetime.utcnow()}
+        },
+        projection={"_id": 1}
+    )
+    if files_entry:
+        return str(files_entry["_id"]), True
+
+    files_entry = _files().find_one(
+        {"metadata.sha256": sha256, "metadata.ref_count": {"$gt": 0}, "metadata.owners": username},
+        {"_id": 1}
+    )
+    if files_entry:
+        return str(files_entry["_id"]), False
+    return None, False
+
+
+def store_license_image(username, file_storage):
+    """
+    Store an uploaded image for username and return (image id, whether a
+    reference was added); only an added reference needs releasing if the
+    registration fails.
+
+    Images are keyed by the SHA-256 of their content: an upload whose bytes
+    are already stored only adds a reference to the existing image.
+    Otherwise the upload is streamed into GridFS chunk by chunk. The users
+    referencing an image are kept in its metadata for ownership checks.
+    """
+    sha256 = _content_hash(file_storage.stream)
+    file_extension = file_storage.filename.split(".")[-1]
+
+    for _ in range(LICENSE_STORE_ATTEMPTS):
+        license_image_id, added = _add_reference(sha256, username)
+        if license_image_id:
+            return license_image_id, added
+
+        grid_in = license_bucket.open_upload_stream(
+            f"{sha256}.{file_extension}",
+            metadata={
+                "sha256": sha256,
+                "owners": [username],
+                "ref_count": 1,
+                "referenced_at": datetime.utcnow(),
+                "content_type": file_storage.mimetype
+            }
+        )
+        try:
+            grid_in.write(file_storage.stream)
+            grid_in.close()
+            return str(grid_in._id), True
+        except DuplicateKeyError:
+            # The same bytes were stored concurrently, or are held by a copy
+            # nobody references; drop our chunks, clear such a copy out of
+            # the way and look again
+            _chunks().delete_many({"files_id": grid_in._id})
+            unreferenced = _files().find_one(
+                {"metadata.sha256": sha256, "metadata.ref_count": {"$lte": 0}}, {"_id": 1}
+            )
+            if unreferenced:
+                _delete_with_renditions(unreferenced["_id"], {"metadata.ref_count": {"$lte": 0}})
+            file_storage.stream.seek(0)
+        except Exception:
+            grid_in.abort()
+            raise
+
+    raise RuntimeError(f"Could not store license image {sha256} for {username}")
+
+
+def _delete_with_renditions(object_id, condition=None):
+    """
+    Delete an image and its renditions. With a condition, only if its files
+    entry still matches it when deleted; returns whether it was deleted.
+    """
+    if _files().delete_one({"_id": object_id, **(condition or {})}).deleted_count == 0:
+        return False
+    _chunks().delete_many({"files_id": object_id})
+    for rendition in _files().find({"metadata.source_id": str(object_id)}, {"_id": 1}):
+        try:
+            license_bucket.delete(rendition["_id"])
+        except gridfs.errors.NoFile:
+            pass
+    return True
+
+
+def release_license_image(license_image_id, username):
+    """
+    Drop the reference of username to an image, deleting the image and its
+    renditions once nobody references it
+    """
+    object_id = _object_id(license_image_id)
+    if not object_id:
+        return
+
+    released = _files().find_one_and_update(
+        {"_id": object_id, "metadata.owners": username},
+        {"$pull": {"metadata.owners": username}, "$inc": {"metadata.ref_count": -1}},
+        projection={"metadata.ref_count": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if released is None:
+        # Images uploaded before GridFS are single documents
+        mongo_db[MONGODB_LICENSES_COLLECTION].delete_one({"_id": object_id})
+        return
+
+    if released["metadata"]["ref_count"] <= 0:
+        # _add_reference never revives an image at zero, but check anyway
+        _delete_with_renditions(object_id, {"metadata.ref_count": {"$lte": 0}})
+
+
+def get_license_owners(license_image_id):
+    """
+    Users referencing a GridFS license image, from its files entry alone
+    without reading any chunk. None if the image is unknown or predates
+    GridFS.
+    """
+    object_id = _object_id(license_image_id)
+    if not object_id:
+        return None
+    files_entry = _files().find_one(
+        {"_id": object_id}, {"metadata.owners": 1, "metadata.username": 1}
+    )
+    if not files_entry:
+        return None
+    metadata = files_entry.get("metadata") or {}
+    if "owners" in metadata:
+        return metadata["owners"]
+    return [metadata["username"]] if metadata.get("username") else []
+
+
+def _merge_images(survivor, duplicates):
+    """
+    Fold duplicate copies of an image into survivor: users move over to it,
+    the survivor's owners become everyone using any copy, then the copies
+    are deleted with their renditions. Returns the copies deleted.
+    """
+    with cockroach_connection() as conn:
+        with conn.cursor() as cursor:
+            # Users move first so none is left pointing at a deleted copy
+            if duplicates:
+                cursor.execute(
+                    f"UPDATE {COCKROACHDB_USERS_TABLE} SET license_image_id = %s WHERE license_image_id = ANY(%s)",
+                    (str(survivor), [str(object_id) for object_id in duplicates])
+                )
+            cursor.execute(
+                f"SELECT username FROM {COCKROACHDB_USERS_TABLE} WHERE license_image_id = %s",
+                (str(survivor),)
+            )
+            owners = {row[0] for row in cursor.fetchall()}
+        conn.commit()
+
+    # Owners without a user yet may be registrations still in flight
+    for files_entry in _files().find({"_id": {"$in": [survivor] + duplicates}}, {"metadata": 1}):
+        metadata = files_entry.get("metadata") or {}
+        owners.update(metadata.get("owners") or ([metadata["username"]] if metadata.get("username") else []))
+
+    _files().update_one({"_id": survivor}, {"$set": {
+        "metadata.owners": sorted(owners),
+        "metadata.ref_count": len(owners),
+        "metadata.referenced_at": datetime.utcnow()
+    }})
+
+    return sum(1 for object_id in duplicates if _delete_with_renditions(object_id))
+
+
+def _backfill_content_hashes(batch_size=LICENSE_SWEEP_BATCH_SIZE):
+    """
+    Key the license images stored before deduplication by their content
+    hash, a batch of images at a time in id order. An image whose bytes
+    are already stored under that hash is merged into the stored copy; any
+    other gets the hash and its users as owners. Returns the copies merged.
+    """
+    last_id = None
+    hashed = 0
+    merged = 0
+
+    while True:
+        query = {"metadata.sha256": {"$exists": False}, "metadata.source_id": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(_files().find(query, {"_id": 1}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        for files_entry in batch:
+            object_id = files_entry["_id"]
+            try:
+                grid_out = license_bucket.open_download_stream(object_id)
+                try:
+                    sha256 = _content_hash(grid_out)
+                finally:
+                    grid_out.close()
+            except gridfs.errors.GridFSError as e:
+                logger.error(f"Could not hash license image {object_id}: {str(e)}")
+                continue
+
+            stored = _files().find_one({"metadata.sha256": sha256}, {"_id": 1})
+            if not stored:
+                try:
+                    _files().update_one({"_id": object_id}, {"$set": {"metadata.sha256": sha256}})
+                    _merge_images(object_id, [])
+                    hashed += 1
+                    continue
+                except DuplicateKeyError:
+                    # The same bytes were uploaded meanwhile
+                    stored = _files().find_one({"metadata.sha256": sha256}, {"_id": 1})
+            merged += _merge_images(stored["_id"], [object_id])
+
+        if len(batch) < batch_size:
+            break
+
+    if hashed:
+        logger.info(f"Hashed {hashed} license images stored before deduplication")
+    return merged
+
+
+def _merge_duplicate_hashes():
+    """
+    Fold images that share a content hash into the oldest copy. Only a
+    deployment without the unique index yet can have them, when uploads
+    raced the hash backfill. Returns the copies merged.
+    """
+    merged = 0
+    groups = _files().aggregate([
+        {"$match": {"metadata.sha256": {"$exists": True}}},
+        {"$group": {"_id": "$metadata.sha256", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ])
+    for group in groups:
+        survivor, *duplicates = sorted(group["ids"])
+        merged += _merge_images(survivor, duplicates)
+    return merged
+
+
+def ensure_license_indexes():
+    """
+    Create the indexes of the license image bucket.
+
+    init-mongo.js creates them on a fresh volume; this covers existing
+    deployments, whose images from before deduplication are hashed first
+    and folded into any copy with the same content, so the unique content
+    hash index can be built.
+    """
+    merged = _backfill_content_hashes() + _merge_duplicate_hashes()
+    if merged:
+        logger.info(f"Merged {merged} duplicate license images")
+
+    _files().create_index([("metadata.source_id", 1), ("metadata.size", 1)])
+    _files().create_index(
+        [("metadata.sha256", 1)],
+        unique=True,
+        partialFilterExpression={"metadata.sha256": {"$exists": True}}
+    )
+
+
+def sweep_orphan_license_images(batch_size=LICENSE_SWEEP_BATCH_SIZE):
+    """
+    Reconcile stored license images with users.license_image_id, a batch
+    of images at a time in id order.
+
+    Users that really reference an image are always added to its owners.
+    Owners without a user, and images nobody references, are only dropped
+    once the image was last referenced more than LICENSE_ORPHAN_GRACE_SECONDS
+    ago, which leaves time for a registration that has added its reference
+    but not yet committed its user. Owners are rewritten only if they are
+    still as read, so a reference added meanwhile is never overwritten.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=LICENSE_ORPHAN_GRACE_SECONDS)
+    last_id = None
+    deleted = 0
+
+    with cockroach_connection() as conn:
+        while True:
+            query = {"metadata.source_id": {"$exists": False}}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            batch = list(
+                _files().find(query, {"_id": 1, "uploadDate": 1, "metadata.owners": 1, "metadata.referenced_at": 1})
+                .sort("_id", 1)
+                .limit(batch_size)
+            )
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT username, license_image_id FROM {COCKROACHDB_USERS_TABLE} WHERE license_image_id = ANY(%s)",
+                    ([str(files_entry["_id"]) for files_entry in batch],)
+                )
+                referenced = {}
+                for username, license_image_id in cursor.fetchall():
+                    referenced.setdefault(license_image_id, []).append(username)
+            conn.commit()
+
+            for files_entry in batch:
+                metadata = files_entry.get("metadata") or {}
+                stored_owners = metadata.get("owners")
+                users = set(referenced.get(str(files_entry["_id"]), []))
+                settled = metadata.get("referenced_at", files_entry["uploadDate"]) < cutoff
+
+                if users:
+                    # Recent owners may belong to registrations still in flight
+                    owners = sorted(users if settled else users | set(stored_owners or []))
+                    if sorted(stored_owners or []) != owners:
+                        _files().update_one(
+                            {"_id": files_entry["_id"], "metadata.owners": stored_owners},
+                            {"$set": {"metadata.owners": owners, "metadata.ref_count": len(owners)}}
+                        )
+                elif settled:
+                    # Not if a reference was added since the batch was read
+                    if _delete_with_renditions(
+                        files_entry["_id"], {"metadata.referenced_at": metadata.get("referenced_at")}
+                    ):
+                        deleted += 1
+
+            if len(batch) < batch_size:
+                break
+
+        if deleted:
+            logger.info(f"Deleted {deleted} orphan license images")
+        return deleted
+
+
+def _open_grid_file(file_id, etag):
+    try:
+        grid_out = license_bucket.open_download_stream(file_id)
+    except gridfs.errors.NoFile:
+        return None
+    return LicenseImage(
+        grid_out.filename,
+        grid_out.length,
+        grid_out,
+        grid_out.upload_date,
+        etag
+    )
+
+
+def _open_original(object_id):
+    # Images never change once stored, so the id is a strong validator
+    image = _open_grid_file(object_id, str(object_id))
+    if image:
+        return image
+
+    # Images uploaded before GridFS are single documents
+    license_data = mongo_db[MONGODB_LICENSES_COLLECTION].find_one({"_id": object_id})
+    if not license_data:
+        return None
+    data = license_data["license_image"]
+    return LicenseImage(
+        license_data["filename"], len(data), io.BytesIO(data), object_id.generation_time, str(object_id)
+    )
+
+
+def _render(data, max_px):
+    """Scale an image down to max_px on its longest side as a JPEG"""
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((max_px, max_px))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=85, optimize=True)
+    output.seek(0)
+    return output
+
+
+def _open_derivative(object_id, size):
+    """Open a rendition of an original image, rendering and storing it on first request"""
+    etag = f"{object_id}-{size}"
+    files_entry = mongo_db[f"{MONGODB_LICENSE_BUCKET}.files"].find_one(
+        {"metadata.source_id": str(object_id), "metadata.size": size}, {"_id": 1}
+    )
+    if files_entry:
+        image = _open_grid_file(files_entry["_id"], etag)
+        if image:
+            return image
+
+    original = _open_original(object_id)
+    if not original:
+        return None
+
+    try:
+        rendition = _render(original.read(), LICENSE_SIZES[size])
+    except (OSError, Image.DecompressionBombError) as e:
+        # Not an image PIL can read, e.g. a PDF or a truncated upload; the
+        # original is all there is to serve
+        logger.warning(f"Could not render license image {object_id} as {size}: {str(e)}")
+        return _open_original(object_id)
+
+    # Two first requests racing may both store a rendition; either one serves
+    file_id = license_bucket.upload_from_stream(
+        f"{original.filename.rsplit('.', 1)[0]}_{size}.jpeg",
+        rendition,
+        metadata={"source_id": str(object_id), "size": size}
+    )
+    return _open_grid_file(file_id, etag)
+
+
+def open_license_image(license_image_id, size=LICENSE_ORIGINAL):
+    """Open a license image or one of its LICENSE_SIZES renditions, None if there is none"""
+    object_id = _object_id(license_image_id)
+    if not object_id:
+        return None
+
+    if size == LICENSE_ORIGINAL:
+        return _open_original(object_id)
+    return _open_derivative(object_id, size)
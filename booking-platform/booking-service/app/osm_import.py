@@ -10,7 +10,7 @@ from shapely.ops import linemerge  # Added for merging line segments
 from pathlib import Path
 import xml.etree.ElementTree as ET  # Add XML parser for fallback
 from collections import defaultdict
-from app.db import get_cockroach_connection, release_cockroach_connection
+from app.db import cockroach_connection, get_cockroach_connection, release_cockroach_connection
 import io
 
 # Configure logging - set to debug level to see more information
@@ -832,16 +832,16 @@ def autofill_road_name_from_tags(tags):
 
 def autofill_mising_names():
     # select all the roads with missing names
-    conn = get_cockroach_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, tags FROM roads WHERE name IS NULL")
-    rows = cursor.fetchall()
-    for row in rows:
-        id = row[0]
-        tags = row[1]
-        name = autofill_road_name_from_tags(tags)
-        cursor.execute("UPDATE roads SET name = %s WHERE id = %s", (name, id))
-    conn.commit()
+    with cockroach_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, tags FROM roads WHERE name IS NULL")
+        rows = cursor.fetchall()
+        for row in rows:
+            id = row[0]
+            tags = row[1]
+            name = autofill_road_name_from_tags(tags)
+            cursor.execute("UPDATE roads SET name = %s WHERE id = %s", (name, id))
+        conn.commit()
 def main():
     """Main function to import OSM road data from local file"""
     # Ensure database is set up before proceeding
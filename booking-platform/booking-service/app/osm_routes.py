@@ -3,7 +3,7 @@ from flask_jwt_extended import jwt_required
 import json
 import logging
 
-from app.db import get_cockroach_connection, release_cockroach_connection
+from app.db import cockroach_connection
 from app.user_routes import session_required
 
 # Configure logging
@@ -30,7 +30,7 @@ def get_regions():
         query += " ORDER BY name"
 
         # Execute query
-        with get_cockroach_connection() as cockroach_conn:
+        with cockroach_connection() as cockroach_conn:
             with cockroach_conn.cursor() as cursor:
                 cursor.execute(query, tuple(params))
                 regions = cursor.fetchall()
@@ -57,7 +57,7 @@ def get_regions():
 def get_road(road_id):
     """Get details for a specific road by ID with its segments"""
     try:
-        with get_cockroach_connection() as cockroach_conn:
+        with cockroach_connection() as cockroach_conn:
             with cockroach_conn.cursor() as cursor:
                 # First get the road details
                 cursor.execute(
@@ -141,7 +141,7 @@ def get_road(road_id):
 def get_all_roads():
     """Get all roads with their segments"""
     try:
-        with get_cockroach_connection() as cockroach_conn:
+        with cockroach_connection() as cockroach_conn:
             with cockroach_conn.cursor() as cursor:
                 # Get all roads
                 cursor.execute(
@@ -248,7 +248,7 @@ def get_road_segments_by_node_ids():
 
         logger.info(f"Searching for road segments matching {len(node_ids)} OSM node IDs")
 
-        with get_cockroach_connection() as cockroach_conn:
+        with cockroach_connection() as cockroach_conn:
             with cockroach_conn.cursor() as cursor:
                 # Find all road segments that have any of the given node IDs as start or end nodes
                 query = """
@@ -0,0 +1,129 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+
+from app.const import (
+    GEVENT_ENABLED,
+    BCRYPT_LOG_ROUNDS,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_MAX_QUEUE,
+    PASSWORD_HASH_TIMEOUT_SECONDS,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasherBusy(Exception):
+    """
+    More hashing calls are waiting than PASSWORD_HASH_MAX_QUEUE allows, or a
+    call did not finish within PASSWORD_HASH_TIMEOUT_SECONDS
+    """
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+# per-process hashing counters
+_hash_stats = {"pending": 0, "peak_pending": 0, "completed": 0, "rejected": 0, "total_ms": 0.0}
+_hash_stats_lock = threading.Lock()
+
+
+def _get_executor():
+    """The hashing pool of this process, created on first use and again after a fork"""
+    global _executor, _executor_pid
+
+    if _executor_pid == os.getpid():
+        return _executor
+
+    with _executor_lock:
+        if _executor_pid != os.getpid():
+            if GEVENT_ENABLED:
+                # Native threads: bcrypt releases the GIL and the greenlets keep running
+                from gevent.threadpool import ThreadPoolExecutor
+                _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+            else:
+                # Forking a worker that already runs request and listener threads
+                # can leave the children stuck on locks held by those threads.
+                # The pool is only handed bcrypt's own functions, so a child
+                # never has to import app
+                _executor = ProcessPoolExecutor(
+                    max_workers=PASSWORD_HASH_WORKERS,
+                    mp_context=multiprocessing.get_context("forkserver")
+                )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _run(fn, *args):
+    """
+    Run fn in the hashing pool and wait for it. Calls beyond
+    PASSWORD_HASH_MAX_QUEUE are turned away so a login burst cannot tie up
+    every request thread of the instance.
+    """
+    with _hash_stats_lock:
+        if _hash_stats["pending"] >= PASSWORD_HASH_MAX_QUEUE:
+            _hash_stats["rejected"] += 1
+            raise PasswordHasherBusy()
+        _hash_stats["pending"] += 1
+        _hash_stats["peak_pending"] = max(_hash_stats["peak_pending"], _hash_stats["pending"])
+
+    started = time.monotonic()
+    try:
+        if PASSWORD_HASH_WORKERS < 1:
+            result = fn(*args)
+        else:
+            future = _get_executor().submit(fn, *args)
+            try:
+                result = future.result(timeout=PASSWORD_HASH_TIMEOUT_SECONDS)
+            except FutureTimeoutError:
+                # Still queued behind other hashes: drop it rather than hash for nobody
+                future.cancel()
+                with _hash_stats_lock:
+                    _hash_stats["rejected"] += 1
+                raise PasswordHasherBusy()
+    finally:
+        with _hash_stats_lock:
+            _hash_stats["pending"] -= 1
+
+    # Only calls that produced a result count towards completed and avg_ms
+    with _hash_stats_lock:
+        _hash_stats["completed"] += 1
+        _hash_stats["total_ms"] += (time.monotonic() - started) * 1000
+    return result
+
+
+def get_password_hashing_stats():
+    with _hash_stats_lock:
+        stats = dict(_hash_stats)
+    total_ms = stats.pop("total_ms")
+    stats["avg_ms"] = round(total_ms / stats["completed"], 1) if stats["completed"] else 0.0
+    stats["workers"] = PASSWORD_HASH_WORKERS
+    stats["max_queue"] = PASSWORD_HASH_MAX_QUEUE
+    return stats
+
+
+def hash_password(password):
+    """bcrypt hash of password at the configured work factor"""
+    salt = bcrypt.gensalt(BCRYPT_LOG_ROUNDS)
+    return _run(bcrypt.hashpw, password.encode("utf-8"), salt).decode("utf-8")
+
+
+def check_password(hashed, password):
+    """True if password matches the stored bcrypt hash"""
+    return _run(bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+def needs_rehash(hashed):
+    """True if hashed was made with a different work factor than the configured one"""
+    try:
+        return int(hashed.split("$")[2]) != BCRYPT_LOG_ROUNDS
+    except (IndexError, ValueError):
+        return False
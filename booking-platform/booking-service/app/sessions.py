@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import redis
+
+from app.db import redis_client
+from app.const import (
+    SESSION_EXPIRY_SECONDS,
+    SESSION_CACHE_SECONDS,
+    SESSION_TOUCH_INTERVAL_SECONDS,
+    SESSION_REVOCATION_CHANNEL,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = "session: {username}"
+
+# username -> (session, cached_at, touched_at), per process
+_session_cache = {}
+_session_cache_lock = threading.Lock()
+
+# The near-cache is only trusted while this process is subscribed to
+# revocations; otherwise every request goes to Redis as before
+_listener_connected = threading.Event()
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def _session_key(username):
+    return SESSION_KEY.format(username=username)
+
+
+def _forget(username=None):
+    with _session_cache_lock:
+        if username is None:
+            _session_cache.clear()
+        else:
+            _session_cache.pop(username, None)
+
+
+def _listen_for_revocations():
+    while True:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(SESSION_REVOCATION_CHANNEL)
+            # Anything revoked while we were not listening may be cached
+            _forget()
+            _listener_connected.set()
+
+            for message in pubsub.listen():
+                if message["type"] == "message":
+                    _forget(message["data"])
+        except redis.RedisError as e:
+            logger.warning(f"Session revocation listener disconnected: {str(e)}")
+        finally:
+            _listener_connected.clear()
+            pubsub.close()
+        time.sleep(1)
+
+
+def _ensure_listener():
+    """Start the revocation listener once per process, also after a fork"""
+    global _listener_pid
+
+    if _listener_pid == os.getpid():
+        return
+
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+        _listener_connected.clear()
+        _forget()
+
+        thread = threading.Thread(target=_listen_for_revocations, name="session-revocations", daemon=True)
+        thread.start()
+
+
+def save_session(username, session):
+    """Store a new session record at login"""
+    redis_client.setex(_session_key(username), SESSION_EXPIRY_SECONDS, json.dumps(session))
+    _publish_revocation(username)
+
+
+def get_session(username):
+    """Return the Redis session record of a user, or None if there is none"""
+    record = redis_client.get(_session_key(username))
+    if not record:
+        return None
+    try:
+        return json.loads(record)
+    except ValueError:
+        # Sessions from before the record held the user's role
+        return None
+
+
+def validate_session(username):
+    """
+    Return the session of a user, or None if they are logged out.
+
+    A session checked less than SESSION_CACHE_SECONDS ago is served from
+    memory, and its Redis TTL is extended at most once every
+    SESSION_TOUCH_INTERVAL_SECONDS. Logouts and role changes are published
+    on SESSION_REVOCATION_CHANNEL, so every instance drops them at once.
+    """
+    _ensure_listener()
+    now = time.monotonic()
+
+    with _session_cache_lock:
+        cached = _session_cache.get(username)
+
+    if cached and _listener_connected.is_set() and now - cached[1] < SESSION_CACHE_SECONDS:
+        session, cached_at, touched_at = cached
+    else:
+        session = get_session(username)
+        if not session:
+            _forget(username)
+            return None
+        cached_at = now
+        touched_at = cached[2] if cached else None
+
+    if touched_at is None or now - touched_at >= SESSION_TOUCH_INTERVAL_SECONDS:
+        if not redis_client.expire(_session_key(username), SESSION_EXPIRY_SECONDS):
+            # Expired since it was cached
+            _forget(username)
+            return None
+        touched_at = now
+
+    with _session_cache_lock:
+        _session_cache[username] = (session, cached_at, touched_at)
+
+    return session
+
+
+def _publish_revocation(username):
+    try:
+        redis_client.publish(SESSION_REVOCATION_CHANNEL, username)
+    except redis.RedisError as e:
+        # Cached copies still run out after SESSION_CACHE_SECONDS
+        logger.warning(f"Could not publish session revocation: {str(e)}")
+    _forget(username)
+
+
+def delete_session(username):
+    """Log a user out on every instance"""
+    redis_client.delete(_session_key(username))
+    _publish_revocation(username)
+
+
+def update_session_role(username, is_admin):
+    """
+    Record a role change in the user's session. Tokens carrying the old
+    is_admin claim are refused from then on, so the user logs in again and
+    gets a token with the new role.
+    """
+    session = get_session(username)
+    if not session:
+        return
+    session["is_admin"] = bool(is_admin)
+    redis_client.set(_session_key(username), json.dumps(session), keepttl=True)
+    _publish_revocation(username)
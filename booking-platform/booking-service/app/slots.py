@@ -0,0 +1,300 @@
+import logging
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+
+from app.db import cockroach_connection, run_transaction
+from app.availability import get_booking_horizon, invalidate_road_availability, DEFAULT_ROAD_CAPACITY
+from app.admission import forget_slot_capacity
+from app.const import SLOT_MATERIALIZER_BATCH_ROADS, SLOT_MATERIALIZER_LOOKAHEAD_DAYS, SLOT_MERGE_BATCH_SIZE
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_schema_checked = False
+
+# Capacity of a new slot of road r starting at {slot_time}: the road's
+# hourly capacity, or zero inside one of the road's closures so a closed
+# hour stays closed however late its slot is created
+_NEW_SLOT_CAPACITY = """
+    CASE WHEN EXISTS (
+        SELECT 1 FROM road_closures rc
+        WHERE rc.road_id = r.id
+        AND rc.start_time <= {slot_time} AND rc.end_time > {slot_time}
+    ) THEN 0 ELSE COALESCE(NULLIF(r.hourly_capacity, 0), %s) END
+"""
+
+
+def parse_slot_time(value):
+    """Parse a slot start time from a client and normalise it to naive UTC"""
+    slot_time = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if slot_time.tzinfo:
+        slot_time = slot_time.astimezone(timezone.utc).replace(tzinfo=None)
+    return slot_time
+
+
+def _merge_duplicate_slots(cursor, batch_size):
+    """
+    Fold up to batch_size groups of road_booking_slots rows sharing a road
+    and hour into the group's first row. Booking lines move to that row and
+    the booked quantities add up on it; closed rows keep the slot closed.
+    Returns the road ids and slot ids touched.
+    """
+    cursor.execute("""
+        SELECT road_booking_slot_id, road_id, slot_time, capacity, available_capacity
+        FROM road_booking_slots
+        WHERE (road_id, slot_time) IN (
+            SELECT road_id, slot_time
+            FROM road_booking_slots
+            GROUP BY road_id, slot_time
+            HAVING COUNT(*) > 1
+            LIMIT %s
+        )
+        ORDER BY road_id, slot_time, road_booking_slot_id
+    """, (batch_size,))
+
+    groups = {}
+    for slot_id, road_id, slot_time, capacity, available_capacity in cursor.fetchall():
+        groups.setdefault((str(road_id), slot_time), []).append((str(slot_id), capacity, available_capacity))
+    if not groups:
+        return [], []
+
+    survivors, capacities, availables = [], [], []
+    duplicates, duplicate_survivors = [], []
+    for rows in groups.values():
+        survivor = rows[0][0]
+        booked = sum(capacity - available_capacity for _, capacity, available_capacity in rows)
+        if any(capacity == 0 for _, capacity, _ in rows):
+            capacity = 0
+        else:
+            # Never below what is booked, as with a capacity change
+            capacity = max(max(capacity for _, capacity, _ in rows), booked)
+
+        survivors.append(survivor)
+        capacities.append(capacity)
+        availables.append(max(capacity - booked, 0))
+        for slot_id, _, _ in rows[1:]:
+            duplicates.append(slot_id)
+            duplicate_survivors.append(survivor)
+
+    cursor.execute("""
+        UPDATE booking_lines AS bl
+        SET road_booking_slot_id = m.survivor
+        FROM (SELECT unnest(%s::UUID[]) AS duplicate, unnest(%s::UUID[]) AS survivor) AS m
+        WHERE bl.road_booking_slot_id = m.duplicate
+    """, (duplicates, duplicate_survivors))
+
+    cursor.execute("""
+        UPDATE road_booking_slots AS rbs
+        SET capacity = d.capacity, available_capacity = d.available_capacity
+        FROM (
+            SELECT unnest(%s::UUID[]) AS slot_id, unnest(%s::INT[]) AS capacity,
+                   unnest(%s::INT[]) AS available_capacity
+        ) AS d
+        WHERE rbs.road_booking_slot_id = d.slot_id
+    """, (survivors, capacities, availables))
+
+    cursor.execute("DELETE FROM road_booking_slots WHERE road_booking_slot_id = ANY(%s::UUID[])", (duplicates,))
+
+    return sorted({road_id for road_id, _ in groups}), survivors + duplicates
+
+
+def is_bookable_slot_time(slot_time, now=None):
+    """True if slot_time is the start of a future hour inside the booking window"""
+    now, _, window_end = get_booking_horizon(now)
+    on_the_hour = slot_time == slot_time.replace(minute=0, second=0, microsecond=0)
+    return on_the_hour and now < slot_time < window_end
+
+
+def ensure_slot_schema(batch_size=SLOT_MERGE_BATCH_SIZE):
+    """
+    Make sure road_booking_slots has one row per road and hour, and that
+    the road_closures table slots are created against exists.
+
+    init.sql creates both for new databases; this covers databases
+    restored from an older backup, where concurrent bookings may have
+    created the same slot twice. Those rows are merged, batch_size road
+    hours per transaction, before the unique index is built.
+    """
+    global _schema_checked
+
+    if _schema_checked:
+        return
+
+    try:
+        with cockroach_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS road_closures (
+                        closure_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                        road_id UUID NOT NULL REFERENCES roads(id),
+                        start_time TIMESTAMP NOT NULL,
+                        end_time TIMESTAMP NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        CHECK (end_time > start_time)
+                    )
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS road_closures_road_time_idx
+                    ON road_closures (road_id, start_time)
+                """)
+            conn.commit()
+
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT 1 FROM pg_indexes
+                    WHERE tablename = 'road_booking_slots' AND indexname = 'road_booking_slots_road_time_key'
+                """)
+                indexed = cursor.fetchone() is not None
+            conn.commit()
+
+            if not indexed:
+                merged = 0
+                while True:
+                    road_ids, slot_ids = run_transaction(
+                        conn, lambda cursor: _merge_duplicate_slots(cursor, batch_size)
+                    )
+                    if not slot_ids:
+                        break
+                    merged += len(slot_ids)
+                    invalidate_road_availability(road_ids)
+                    forget_slot_capacity(slot_ids)
+
+                if merged:
+                    logger.info(f"Merged {merged} duplicate road booking slot rows")
+
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        CREATE UNIQUE INDEX IF NOT EXISTS road_booking_slots_road_time_key
+                        ON road_booking_slots (road_id, slot_time)
+                    """)
+                conn.commit()
+
+            _schema_checked = True
+    except psycopg2.Error as e:
+        logger.error(f"Could not create the (road_id, slot_time) unique index: {str(e)}")
+        raise
+
+
+def materialize_booking_horizon():
+    """
+    Create every missing road_booking_slots row from the next hour to the end
+    of the booking window plus the lookahead, a batch of roads at a time.
+
+    Existing rows are left untouched thanks to the unique (road_id, slot_time)
+    key, so the job is safe to run repeatedly and from several instances.
+    """
+    ensure_slot_schema()
+
+    now, _, window_end = get_booking_horizon()
+    first_slot = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    last_slot = window_end + timedelta(days=SLOT_MATERIALIZER_LOOKAHEAD_DAYS) - timedelta(hours=1)
+
+    last_road_id = None
+    created = 0
+
+    try:
+        with cockroach_connection() as conn:
+            cursor = conn.cursor()
+
+            while True:
+                # Walk the roads in id order so each batch is a small transaction
+                cursor.execute("""
+                    SELECT id FROM roads
+                    WHERE %s::UUID IS NULL OR id > %s::UUID
+                    ORDER BY id
+                    LIMIT %s
+                """, (last_road_id, last_road_id, SLOT_MATERIALIZER_BATCH_ROADS))
+                road_ids = [str(row[0]) for row in cursor.fetchall()]
+
+                if not road_ids:
+                    conn.commit()
+                    break
+
+                capacity = _NEW_SLOT_CAPACITY.format(slot_time="s.slot_time")
+                cursor.execute(f"""
+                    INSERT INTO road_booking_slots (road_id, slot_time, capacity, available_capacity)
+                    SELECT r.id, s.slot_time, {capacity}, {capacity}
+                    FROM roads r
+                    CROSS JOIN generate_series(%s::TIMESTAMP, %s::TIMESTAMP, '1 hour'::INTERVAL) AS s(slot_time)
+                    WHERE r.id = ANY(%s::UUID[])
+                    ON CONFLICT (road_id, slot_time) DO NOTHING
+                """, (DEFAULT_ROAD_CAPACITY, DEFAULT_ROAD_CAPACITY, first_slot, last_slot, road_ids))
+                inserted = cursor.rowcount
+                conn.commit()
+
+                # Cached availability still shows the new rows without a slot id
+                if inserted > 0:
+                    created += inserted
+                    invalidate_road_availability(road_ids)
+
+                last_road_id = road_ids[-1]
+
+            if created:
+                logger.info(f"Materialised {created} road booking slots up to {last_slot.isoformat()}")
+            return created
+
+    except psycopg2.Error as e:
+        logger.error(f"Database error while materialising slots: {str(e)}")
+        raise
+
+
+def resolve_slot_ids(cursor, road_slots):
+    """
+    Look up the slot ids for (road_id, slot_time) pairs inside the caller's
+    transaction.
+
+    Slots are normally pre-materialised. A bookable hour the materialiser
+    has not reached yet, e.g. on a road added since its last run, is
+    created on the spot, relying on the unique key so concurrent callers
+    end up with the same row. Nothing is created for any other instant.
+    Returns a dict keyed by (road_id, slot_time); pairs without a slot
+    are missing.
+    """
+    pairs = list(dict.fromkeys((str(road_id), slot_time) for road_id, slot_time in road_slots))
+    if not pairs:
+        return {}
+
+    road_ids = [road_id for road_id, _ in pairs]
+    slot_times = [slot_time for _, slot_time in pairs]
+
+    def fetch():
+        cursor.execute("""
+            SELECT rbs.road_id, rbs.slot_time, rbs.road_booking_slot_id
+            FROM road_booking_slots rbs
+            JOIN (SELECT unnest(%s::UUID[]) AS road_id, unnest(%s::TIMESTAMP[]) AS slot_time) AS p
+            ON rbs.road_id = p.road_id AND rbs.slot_time = p.slot_time
+        """, (road_ids, slot_times))
+        return {(str(road_id), slot_time): str(slot_id) for road_id, slot_time, slot_id in cursor.fetchall()}
+
+    resolved = fetch()
+    if len(resolved) == len(pairs):
+        return resolved
+
+    missing = [pair for pair in pairs if pair not in resolved and is_bookable_slot_time(pair[1])]
+    if not missing:
+        return resolved
+
+    capacity = _NEW_SLOT_CAPACITY.format(slot_time="p.slot_time")
+    cursor.execute(f"""
+        INSERT INTO road_booking_slots (road_id, slot_time, capacity, available_capacity)
+        SELECT r.id, p.slot_time, {capacity}, {capacity}
+        FROM roads r
+        JOIN (SELECT unnest(%s::UUID[]) AS road_id, unnest(%s::TIMESTAMP[]) AS slot_time) AS p
+        ON r.id = p.road_id
+        ON CONFLICT (road_id, slot_time) DO NOTHING
+    """, (DEFAULT_ROAD_CAPACITY, DEFAULT_ROAD_CAPACITY,
+          [road_id for road_id, _ in missing], [slot_time for _, slot_time in missing]))
+
+    return fetch()
+
+
+def main():
+    """Materialise the booking horizon once and exit"""
+    created = materialize_booking_horizon()
+    logger.info(f"Slot materialisation finished, {created} slots created")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@
 let selectedSlots = {}; // Change to object to track slots by road
 let suggestedSlots = [];
 let userBookings = [];
+let userBookingsCursor = null; // X-Next-Cursor of the last page loaded
 let bookingModal = null;
 
 // Initialize booking functionality
@@ -410,77 +411,122 @@ async function confirmRouteBooking() {
     }
 }
 
-// Load user's existing bookings
+// Load the first page of the user's existing bookings
 async function loadUserBookings() {
     const container = document.getElementById('user-bookings');
 
     try {
-        const response = await fetch('/booking/user-bookings', {
-            method: 'GET',
-            headers: {
-                'Authorization': `Bearer ${localStorage.getItem('accessToken')}`
-            }
-        });
+        userBookings = [];
+        userBookingsCursor = null;
+        await fetchUserBookingsPage();
+        renderUserBookings();
+    } catch (error) {
+        console.error('Error loading bookings:', error);
+        container.innerHTML = `<p class="error">Error loading bookings: ${error.message}</p>`;
+    }
+}
 
-        if (!response.ok) {
-            throw new Error('Failed to fetch bookings');
+// Append the next page, following the cursor of the last one
+async function loadMoreUserBookings() {
+    const loadMoreBtn = document.getElementById('load-more-bookings-btn');
+    if (loadMoreBtn) {
+        loadMoreBtn.disabled = true;
+        loadMoreBtn.textContent = 'Loading...';
+    }
+
+    try {
+        await fetchUserBookingsPage();
+        renderUserBookings();
+    } catch (error) {
+        console.error('Error loading more bookings:', error);
+        if (loadMoreBtn) {
+            loadMoreBtn.disabled = false;
+            loadMoreBtn.textContent = 'Load more bookings';
         }
+    }
+}
 
-        const bookings = await response.json();
-        userBookings = bookings;
+// The bookings list is paged: each page names the next in X-Next-Cursor
+async function fetchUserBookingsPage() {
+    let url = '/booking/user-bookings';
+    if (userBookingsCursor) {
+        url += `?cursor=${encodeURIComponent(userBookingsCursor)}`;
+    }
 
-        if (bookings.length === 0) {
-            container.innerHTML = '<p class="no-bookings">You have no current bookings</p>';
-            return;
+    const response = await fetch(url, {
+        method: 'GET',
+        headers: {
+            'Authorization': `Bearer ${localStorage.getItem('accessToken')}`
         }
+    });
+
+    if (!response.ok) {
+        throw new Error('Failed to fetch bookings');
+    }
+
+    const bookings = await response.json();
+    userBookings = userBookings.concat(bookings);
+    userBookingsCursor = response.headers.get('X-Next-Cursor');
+}
+
+function renderUserBookings() {
+    const container = document.getElementById('user-bookings');
 
-        let html = '<div class="booking-list">';
-
-        // Display each booking with improved layout
-        bookings.forEach(booking => {
-            const startTime = new Date(booking.start_time).toLocaleString();
-            const endTime = booking.end_time ? new Date(booking.end_time).toLocaleString() : 'Varies';
-
-            html += `
-                <div class="booking-item">
-                    <div class="booking-header">
-                        <h6>
-                        <strong> Origin : </strong> ${booking.origin || 'Unknown'}
-
-                        <strong> Destination : </strong> ${booking.destination || 'Unknown'}
-                        </h6>
-                    </div>
-                    <div class="booking-time">
-                        <span class="booking-date">${startTime}</span>
-                    </div>
-                    <div class="booking-details">
-                        <p><strong>Roads:</strong> <span>${booking.road_count}</span></p>
-                        <p><strong>Time slots:</strong> <span>${booking.booking_count}</span></p>
-                    </div>
-                    <button class="btn btn-sm btn-danger cancel-booking-btn" data-booking-id="${booking.booking_id}">
-                        Cancel Booking
-                    </button>
+    if (userBookings.length === 0) {
+        container.innerHTML = '<p class="no-bookings">You have no current bookings</p>';
+        return;
+    }
+
+    let html = '<div class="booking-list">';
+
+    // Display each booking with improved layout
+    userBookings.forEach(booking => {
+        const startTime = new Date(booking.start_time).toLocaleString();
+
+        html += `
+            <div class="booking-item">
+                <div class="booking-header">
+                    <h6>
+                    <strong> Origin : </strong> ${booking.origin || 'Unknown'}
+
+                    <strong> Destination : </strong> ${booking.destination || 'Unknown'}
+                    </h6>
                 </div>
-            `;
-        });
+                <div class="booking-time">
+                    <span class="booking-date">${startTime}</span>
+                </div>
+                <div class="booking-details">
+                    <p><strong>Roads:</strong> <span>${booking.road_count}</span></p>
+                    <p><strong>Time slots:</strong> <span>${booking.booking_count}</span></p>
+                </div>
+                <button class="btn btn-sm btn-danger cancel-booking-btn" data-booking-id="${booking.booking_id}">
+                    Cancel Booking
+                </button>
+            </div>
+        `;
+    });
+
+    html += '</div>';
 
-        html += '</div>';
+    if (userBookingsCursor) {
+        html += '<button id="load-more-bookings-btn" class="btn btn-sm btn-secondary">Load more bookings</button>';
+    }
 
-        container.innerHTML = html;
+    container.innerHTML = html;
 
-        // Add event listeners for cancel buttons
-        document.querySelectorAll('.cancel-booking-btn').forEach(btn => {
-            btn.addEventListener('click', function() {
-                const bookingId = this.getAttribute('data-booking-id');
-                if (confirm(`Are you sure you want to cancel this booking?`)) {
-                    cancelBooking(bookingId);
-                }
-            });
+    // Add event listeners for cancel buttons
+    document.querySelectorAll('.cancel-booking-btn').forEach(btn => {
+        btn.addEventListener('click', function() {
+            const bookingId = this.getAttribute('data-booking-id');
+            if (confirm(`Are you sure you want to cancel this booking?`)) {
+                cancelBooking(bookingId);
+            }
         });
+    });
 
-    } catch (error) {
-        console.error('Error loading bookings:', error);
-        container.innerHTML = `<p class="error">Error loading bookings: ${error.message}</p>`;
+    const loadMoreBtn = document.getElementById('load-more-bookings-btn');
+    if (loadMoreBtn) {
+        loadMoreBtn.addEventListener('click', loadMoreUserBookings);
     }
 }
 
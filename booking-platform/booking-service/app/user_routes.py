@@ -1,21 +1,27 @@
-from flask import Blueprint, request, jsonify, send_file
-from flask_bcrypt import Bcrypt
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 from functools import wraps
 import psycopg2
-from bson import ObjectId
 from pymongo.errors import PyMongoError
-from datetime import timedelta
-import io
+from datetime import timedelta, timezone
+from werkzeug.http import http_date, quote_etag
 import logging
 
 from app import limiter
-from app.db import get_cockroach_connection, release_cockroach_connection, mongo_db, redis_client
+from app.db import cockroach_connection, release_request_connection
+from app.licenses import (
+    store_license_image,
+    release_license_image,
+    get_license_owners,
+    open_license_image,
+    LICENSE_ORIGINAL,
+    LICENSE_SIZES,
+)
+from app.sessions import validate_session, save_session, delete_session
+from app.passwords import hash_password, check_password, needs_rehash, PasswordHasherBusy
 from app.const import (
-    SESSION_EXPIRY_SECONDS,
     TOKEN_EXPIRY_HOURS,
     COCKROACHDB_USERS_TABLE,
-    MONGODB_LICENSES_COLLECTION,
     ERROR_MISSING_FIELDS,
     ERROR_USER_EXISTS,
     ERROR_USER_NOT_FOUND,
@@ -24,35 +30,41 @@ from app.const import (
     ERROR_SESSION_EXPIRED,
     ERROR_DATABASE,
     ERROR_UNEXPECTED,
+    ERROR_SERVICE_BUSY,
     SUCCESS_REGISTRATION,
     SUCCESS_LOGIN,
     SUCCESS_LOGOUT,
     RATE_LIMIT_LOGIN,
     RATE_LIMIT_REGISTER,
+    LICENSE_CACHE_MAX_AGE_SECONDS,
 )
 
 user_blueprint = Blueprint("user", __name__)
-bcrypt = Bcrypt()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def get_current_user_id():
+    """User id from the access token claims, None for tokens without them"""
+    return get_jwt().get("user_id")
+
+def is_current_user_admin():
+    return bool(get_jwt().get("is_admin", False))
+
 def session_required(fn):
     @wraps(fn)
     @jwt_required()
     def decorated_fn(*args, **kwargs):
-        username = get_jwt_identity()
-        if not redis_client.get(f"session: {username}"):
+        session = validate_session(get_jwt_identity())
+        if not session or session.get("is_admin") != is_current_user_admin():
             return jsonify({"error": ERROR_SESSION_EXPIRED}), 401
-        redis_client.expire(f"session: {username}", SESSION_EXPIRY_SECONDS)
         return fn(*args, **kwargs)
     return decorated_fn
 
 @user_blueprint.route("/register", methods=["POST"])
 @limiter.limit(RATE_LIMIT_REGISTER)
 def register():
-    cockroach_conn = None
     try:
         givennames = request.form.get("givennames")
         lastname = request.form.get("lastname")
@@ -79,48 +91,60 @@ def register():
             "missing_fields": missing_fields
             }), 400
 
-        hashed_password = bcrypt.generate_password_hash(password).decode("utf-8")
+        hashed_password = hash_password(password)
 
-        file_extension = license_img.filename.split(".")[-1]
-        license_data = {
-            "filename": f"{username}_license.{file_extension}",
-            "license_image": license_img.read()
-        }
-        license_collection = mongo_db[MONGODB_LICENSES_COLLECTION]
-        inserted_license = license_collection.insert_one(license_data)
-        license_img_id = str(inserted_license.inserted_id)
-        cockroach_conn = get_cockroach_connection()
-
-        with cockroach_conn.cursor() as cursor:
-            cursor.execute(f"SELECT username FROM {COCKROACHDB_USERS_TABLE} WHERE username = %s", (username,))
-            if cursor.fetchone():
-                return jsonify({"error": ERROR_USER_EXISTS}), 400
-
-            cursor.execute(
-                f"INSERT INTO {COCKROACHDB_USERS_TABLE} (givennames, lastname, username, password, license_image_id) VALUES (%s, %s, %s, %s, %s)",
-                (givennames, lastname, username, hashed_password, license_img_id)
-            )
-            cockroach_conn.commit()
+        # Streamed into GridFS in chunks instead of read into one document
+        license_img_id, license_ref_added = store_license_image(username, license_img)
+        with cockroach_connection() as cockroach_conn:
+            with cockroach_conn.cursor() as cursor:
+                cursor.execute(f"SELECT username FROM {COCKROACHDB_USERS_TABLE} WHERE username = %s", (username,))
+                if cursor.fetchone():
+                    if license_ref_added:
+                        release_license_image(license_img_id, username)
+                    return jsonify({"error": ERROR_USER_EXISTS}), 400
+
+                cursor.execute(
+                    f"INSERT INTO {COCKROACHDB_USERS_TABLE} (givennames, lastname, username, password, license_image_id) VALUES (%s, %s, %s, %s, %s)",
+                    (givennames, lastname, username, hashed_password, license_img_id)
+                )
+                cockroach_conn.commit()
 
         return jsonify({"message": SUCCESS_REGISTRATION}), 200
 
+    except PasswordHasherBusy:
+        return jsonify({"error": ERROR_SERVICE_BUSY}), 503, {"Retry-After": "1"}
     except (psycopg2.Error, PyMongoError) as e:
-        cockroach_conn.rollback()
-        if "inserted_license" in locals():
-            license_collection.delete_one({"_id": inserted_license.inserted_id})
+        if "license_img_id" in locals() and license_ref_added:
+            try:
+                release_license_image(license_img_id, username)
+            except PyMongoError:
+                # The orphan sweeper removes the reference later
+                pass
         logger.error(f"Database error: {str(e)}")
         return jsonify({"error": ERROR_DATABASE, "details": str(e)}), 500
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         return jsonify({"error": ERROR_UNEXPECTED, "details": str(e)}), 500
-    finally:
-        if cockroach_conn:
-            release_cockroach_connection(cockroach_conn)
+
+def _rehash_password(user_id, old_hash, password):
+    """Store the password again at the current work factor after a successful login"""
+    try:
+        new_hash = hash_password(password)
+        with cockroach_connection() as cockroach_conn:
+            with cockroach_conn.cursor() as cursor:
+                # Skipped if the password was changed in the meantime
+                cursor.execute(
+                    f"UPDATE {COCKROACHDB_USERS_TABLE} SET password = %s WHERE id = %s AND password = %s",
+                    (new_hash, user_id, old_hash)
+                )
+            cockroach_conn.commit()
+    except (PasswordHasherBusy, psycopg2.Error) as e:
+        # The old hash still works, so try again on a later login
+        logger.warning(f"Could not rehash password: {str(e)}")
 
 @user_blueprint.route("/login", methods=["POST"])
 @limiter.limit(RATE_LIMIT_LOGIN)
 def login():
-    cockroach_conn = None
     try:
         username = request.form.get("username")
         password = request.form.get("password")
@@ -128,37 +152,53 @@ def login():
         if not (username and password):
             return jsonify({"error": ERROR_MISSING_FIELDS}), 400
 
-        cockroach_conn = get_cockroach_connection()
-        with cockroach_conn.cursor() as cursor:
-            cursor.execute(f"SELECT password FROM {COCKROACHDB_USERS_TABLE} WHERE username = %s", (username,))
-            user_password_hash = cursor.fetchone()
+        with cockroach_connection() as cockroach_conn:
+            with cockroach_conn.cursor() as cursor:
+                cursor.execute(f"SELECT id, password, is_admin FROM {COCKROACHDB_USERS_TABLE} WHERE username = %s", (username,))
+                user_record = cursor.fetchone()
+            cockroach_conn.commit()
+
+        # Do not hold the request's pooled connection while the password is checked
+        release_request_connection()
 
-        if not user_password_hash:
+        if not user_record:
             return jsonify({"error": ERROR_USER_NOT_FOUND}), 401
 
-        if bcrypt.check_password_hash(user_password_hash[0], password):
-            token = create_access_token(identity=username, expires_delta=timedelta(hours=TOKEN_EXPIRY_HOURS))
-            redis_client.setex(f"session: {username}", SESSION_EXPIRY_SECONDS, token)
+        user_id, user_password_hash, is_admin = user_record
+        if check_password(user_password_hash, password):
+            if needs_rehash(user_password_hash):
+                _rehash_password(user_id, user_password_hash, password)
+
+            # Id and role travel in the token so handlers need no user lookup
+            token = create_access_token(
+                identity=username,
+                expires_delta=timedelta(hours=TOKEN_EXPIRY_HOURS),
+                additional_claims={"user_id": str(user_id), "is_admin": bool(is_admin)}
+            )
+            save_session(username, {
+                "token": token,
+                "user_id": str(user_id),
+                "is_admin": bool(is_admin)
+            })
             return jsonify({"message": SUCCESS_LOGIN, "access_token": token}), 200
 
         return jsonify({"error": ERROR_INVALID_CREDENTIALS}), 401
 
+    except PasswordHasherBusy:
+        return jsonify({"error": ERROR_SERVICE_BUSY}), 503, {"Retry-After": "1"}
     except psycopg2.Error as e:
         logger.error(f"Database error: {str(e)}")
         return jsonify({"error": ERROR_DATABASE, "details": str(e)}), 500
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         return jsonify({"error": ERROR_UNEXPECTED, "details": str(e)}), 500
-    finally:
-        if cockroach_conn:
-            release_cockroach_connection(cockroach_conn)
 
 @user_blueprint.route("/logout", methods=["POST"])
 @session_required
 def logout():
     try:
         username = get_jwt_identity()
-        redis_client.delete(f"session: {username}")
+        delete_session(username)
         return jsonify({"message": SUCCESS_LOGOUT}), 200
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
@@ -169,12 +209,12 @@ def logout():
 def profile():
     try:
         username = get_jwt_identity()
-        cockroach_conn = get_cockroach_connection()
-        with cockroach_conn.cursor() as cursor:
-            cursor.execute(
-                f"SELECT givennames, lastname, username, license_image_id FROM {COCKROACHDB_USERS_TABLE} WHERE username = %s", (username,)
-            )
-            user_record = cursor.fetchone()
+        with cockroach_connection() as cockroach_conn:
+            with cockroach_conn.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT givennames, lastname, username, license_image_id FROM {COCKROACHDB_USERS_TABLE} WHERE username = %s", (username,)
+                )
+                user_record = cursor.fetchone()
 
         if not user_record:
             return jsonify({"error": ERROR_USER_NOT_FOUND}), 404
@@ -189,36 +229,89 @@ def profile():
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         return jsonify({"error": ERROR_UNEXPECTED, "details": str(e)}), 500
-    finally:
-        release_cockroach_connection(cockroach_conn)
 
 @user_blueprint.route("/licenses/<license_image_id>", methods=["GET"])
 @session_required
 def get_license_image(license_image_id):
+    """
+    Stream a license image, honouring a Range header with a single byte range
+
+    ?size=thumb or ?size=web returns a scaled-down rendition. Responses
+    carry ETag and Last-Modified, and a matching conditional GET gets 304.
+    """
     try:
         username = get_jwt_identity()
-        cockroach_conn = get_cockroach_connection()
-        with cockroach_conn.cursor() as cursor:
-            cursor.execute(
-                f"SELECT license_image_id FROM {COCKROACHDB_USERS_TABLE} WHERE username = %s", (username,)
-            )
-            user_license_id = cursor.fetchone()
+        size = request.args.get("size", LICENSE_ORIGINAL)
+
+        if size != LICENSE_ORIGINAL and size not in LICENSE_SIZES:
+            return jsonify({"error": f"size must be one of {', '.join([LICENSE_ORIGINAL, *LICENSE_SIZES])}"}), 400
+
+        # GridFS images carry their owner, so the check reads no image data
+        owners = get_license_owners(license_image_id)
+        if owners is None:
+            with cockroach_connection() as cockroach_conn:
+                with cockroach_conn.cursor() as cursor:
+                    cursor.execute(
+                        f"SELECT license_image_id FROM {COCKROACHDB_USERS_TABLE} WHERE username = %s", (username,)
+                    )
+                    user_license_id = cursor.fetchone()
+            owners = [username] if user_license_id and user_license_id[0] == license_image_id else []
 
-        if not user_license_id or user_license_id[0] != license_image_id:
+        if username not in owners:
             return jsonify({"error": ERROR_UNAUTHORIZED_ACCESS}), 403
 
-        license_data = mongo_db[MONGODB_LICENSES_COLLECTION].find_one({"_id": ObjectId(license_image_id)})
-        if not license_data:
+        image = open_license_image(license_image_id, size)
+        if not image:
             return jsonify({"error": ERROR_USER_NOT_FOUND}), 404
 
-        image_type = license_data["filename"].split(".")[-1]
-        return send_file(
-            io.BytesIO(license_data["license_image"]),
-            mimetype=f"image/{image_type}",
-            as_attachment=False
+        # Stored images never change, so validators stay good for their lifetime
+        headers = {
+            "Accept-Ranges": "bytes",
+            "ETag": quote_etag(image.etag),
+            "Last-Modified": http_date(image.last_modified),
+            "Cache-Control": f"private, max-age={LICENSE_CACHE_MAX_AGE_SECONDS}"
+        }
+
+        # If-None-Match wins over If-Modified-Since when both are sent
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(image.etag)
+        elif request.if_modified_since:
+            last_modified = image.last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+            not_modified = last_modified <= request.if_modified_since
+        else:
+            not_modified = False
+
+        if not_modified:
+            image.stream.close()
+            return Response(status=304, headers=headers)
+
+        status = 200
+        start, stop = 0, image.length
+
+        # Only a single byte range is served partially; other range forms are
+        # ignored and the whole image sent, as RFC 9110 allows
+        if request.range and request.range.units == "bytes" and len(request.range.ranges) == 1:
+            first, last = request.range.ranges[0]
+            if last is None and first < 0:
+                # Suffix range: the final -first bytes, all of them if the image is shorter
+                start, stop = max(0, image.length + first), image.length
+            else:
+                start, stop = first, min(last or image.length, image.length)
+
+            if start >= stop:
+                image.stream.close()
+                return Response(status=416, headers={"Content-Range": f"bytes */{image.length}"})
+            headers["Content-Range"] = f"bytes {start}-{stop - 1}/{image.length}"
+            status = 206
+
+        headers["Content-Length"] = str(stop - start)
+        return Response(
+            stream_with_context(image.iter_range(start, stop)),
+            status=status,
+            mimetype=image.mimetype,
+            headers=headers,
+            direct_passthrough=True
         )
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         return jsonify({"error": ERROR_UNEXPECTED, "details": str(e)}), 500
-    finally:
-        release_cockroach_connection(cockroach_conn)
\ No newline at end of file
@@ -0,0 +1,97 @@
+import math
+import os
+
+# Only plain settings here: importing anything from app would load the
+# Flask app before the settings below take effect. Defaults match app/const.py.
+COCKROACH_POOL_MAX_SIZE = int(os.getenv("COCKROACH_POOL_MAX_SIZE", 10))
+GEVENT_ENABLED = os.getenv("GEVENT_ENABLED", "False") == "True"
+
+# CockroachDB connections one instance may open over all its workers. The
+# default keeps the three instances of docker-compose.yml at 120 connections
+# to the single node however many CPUs they see; 0 lifts the limit
+COCKROACH_CONNECTION_BUDGET = int(os.getenv("COCKROACH_CONNECTION_BUDGET", 40))
+
+
+def _available_cpus():
+    """CPUs this container may use, honouring a cgroup CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # A docker --cpus limit shows up as a quota, not as fewer CPUs
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+
+    return cpus
+
+
+def _workers():
+    workers = int(os.getenv("GUNICORN_WORKERS", 0)) or _available_cpus() * 2 + 1
+    # Each worker has a pool of its own
+    if COCKROACH_CONNECTION_BUDGET:
+        workers = min(workers, max(1, COCKROACH_CONNECTION_BUDGET // COCKROACH_POOL_MAX_SIZE))
+    return workers
+
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = _workers()
+
+if GEVENT_ENABLED:
+    worker_class = "gevent"
+    # Every greenlet past the pool size queues for a connection and gives up
+    # after COCKROACH_POOL_TIMEOUT_SECONDS. Allow a few requests per pooled
+    # connection, since many are answered from Redis alone, and no more
+    worker_connections = (
+        int(os.getenv("GEVENT_WORKER_CONNECTIONS", 0))
+        or COCKROACH_POOL_MAX_SIZE * int(os.getenv("GEVENT_REQUESTS_PER_DB_CONNECTION", 4))
+    )
+else:
+    # More threads than pooled connections would only queue on the pool
+    threads = int(os.getenv("GUNICORN_THREADS", 0)) or COCKROACH_POOL_MAX_SIZE
+    worker_class = "gthread" if threads > 1 else "sync"
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+# Recycle workers so slow leaks stay bounded; the jitter keeps them from
+# all restarting at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+# Load the app once in the master so workers share its memory copy-on-write.
+# Not with gevent: the master would import threading, ssl and psycopg2
+# before the worker gets to monkey-patch them
+preload_app = os.getenv("GUNICORN_PRELOAD", "True") == "True" and not GEVENT_ENABLED
+if preload_app:
+    os.environ.setdefault("BACKGROUND_TASKS_DEFERRED", "True")
+
+
+def post_fork(server, worker):
+    # Sockets opened in the master must not be shared by the workers
+    from app.db import reset_clients_after_fork
+    from app.background import start_background_tasks
+
+    reset_clients_after_fork()
+    start_background_tasks(after_fork=True)
+
+
+def worker_exit(server, worker):
+    from app.db import cockroach_pool
+
+    cockroach_pool.closeall()
+
+
+def when_ready(server):
+    concurrency = worker_connections if GEVENT_ENABLED else threads
+    server.log.info(
+        f"Booking service: {workers} {worker_class} workers of up to {concurrency} "
+        f"concurrent requests, sharing a CockroachDB pool of {COCKROACH_POOL_MAX_SIZE} per worker "
+        f"({workers * COCKROACH_POOL_MAX_SIZE} connections in all)"
+    )
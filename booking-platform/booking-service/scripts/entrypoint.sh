@@ -20,6 +20,6 @@ done
 # echo "Starting OSM data import in the background..."
 # python -m app.osm_import &
 
-# Start the Flask application
+# Start the Flask application; workers, threads and hooks are in gunicorn.conf.py
 echo "Starting the Flask application..."
-gunicorn --bind 0.0.0.0:5000 app.app:app 
\ No newline at end of file
+gunicorn --config gunicorn.conf.py app.app:app
@@ -0,0 +1,114 @@
+# booking-service/tests/conftest.py
+
+import os
+os.environ["TESTING"] = "True"
+
+import pytest
+from app import app as flask_app
+from app.db import get_cockroach_connection, release_cockroach_connection, cockroach_connection
+import uuid
+import datetime
+from test.db_reset import reset_test_db
+from test.helpers import insert_road
+from flask_bcrypt import Bcrypt
+
+# Reset DB before the test session starts
+@pytest.fixture(scope="session", autouse=True)
+def clean_db_once():
+    reset_test_db()
+    yield  # Allows other tests to run
+    
+def insert_test_user_and_road():
+    #Insert a test user and road into the database.
+    with cockroach_connection() as conn:
+        cursor = conn.cursor()
+
+        # Insert user
+        username = "testuser"
+        password = "testpassword"
+        bcrypt = Bcrypt()
+        hashed_password = bcrypt.generate_password_hash(password).decode("utf-8")
+        givennames = "Test"
+        lastname = "User"
+        license_image_id = "test_license_img_001"
+        cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
+        result = cursor.fetchone()
+        if not result:
+            cursor.execute("""
+                INSERT INTO users (id, username, password, givennames, lastname, license_image_id)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (
+                str(uuid.uuid4()),
+                username,
+                hashed_password,
+                givennames,
+                lastname,
+                license_image_id
+            ))
+
+        # Insert road
+        road_id = str(uuid.uuid4())
+        cursor.execute("SELECT id FROM roads LIMIT 1")
+        existing = cursor.fetchone()
+        if not existing:
+            cursor.execute("INSERT INTO roads (id, name, hourly_capacity) VALUES (%s, %s, %s)",
+                           (road_id, "Test Road", 10))
+        else:
+            road_id = existing[0]
+
+        # Insert booking slot for the next whole hour, the first one bookable.
+        # Every call inserts the same hour, so later calls find it there
+        slot_id = str(uuid.uuid4())
+        slot_time = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+        cursor.execute("""
+            INSERT INTO road_booking_slots (road_booking_slot_id, road_id, slot_time, capacity, available_capacity)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (road_id, slot_time) DO NOTHING
+        """, (slot_id, road_id, slot_time, 10, 10))
+
+        conn.commit()
+
+    return username, password, road_id
+
+@pytest.fixture
+def app():
+    flask_app.config.update({"TESTING": True})
+    yield flask_app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def token(client):
+    username, password, _ = insert_test_user_and_road()
+    resp = client.post("/user/login", data={"username": username, "password": password})
+    return resp.get_json()["access_token"]
+
+@pytest.fixture
+def test_road_id():
+    _, _, road_id = insert_test_user_and_road()
+    return road_id
+
+@pytest.fixture
+def admin_token(client):
+    # Insert an admin user once and log in as it
+    conn = get_cockroach_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM users WHERE username = %s", ("adminuser",))
+    if not cursor.fetchone():
+        hashed_password = Bcrypt().generate_password_hash("adminpassword").decode("utf-8")
+        cursor.execute("""
+            INSERT INTO users (id, username, password, givennames, lastname, license_image_id, is_admin)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, (str(uuid.uuid4()), "adminuser", hashed_password, "Admin", "User", "test_license_img_002", True))
+    conn.commit()
+    release_cockroach_connection(conn)
+
+    resp = client.post("/user/login", data={"username": "adminuser", "password": "adminpassword"})
+    return resp.get_json()["access_token"]
+
+@pytest.fixture
+def new_road_id():
+    # A road of its own, for tests that change capacity or close slots
+    return insert_road()
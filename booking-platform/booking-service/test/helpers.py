@@ -0,0 +1,81 @@
+# booking-service/tests/helpers.py
+
+import io
+import uuid
+from datetime import datetime, timedelta
+from app.db import get_cockroach_connection, release_cockroach_connection
+
+def next_hour(hours=1):
+    # Slot times are naive UTC, see parse_slot_time
+    return (datetime.utcnow().replace(minute=0, second=0, microsecond=0) + timedelta(hours=hours)).isoformat()
+
+def booking_body(road_id, start_time, quantity=1, slot_id=None):
+    slot = {"start_time": start_time}
+    if slot_id:
+        slot["slot_id"] = slot_id
+    return {
+        "bookings": [{"road_id": road_id, "slots": [slot], "quantity": quantity}],
+        "origin": "A",
+        "destination": "B"
+    }
+
+def book(client, token, road_id, start_time, quantity=1, slot_id=None):
+    return client.post(
+        "/booking/create-booking",
+        headers={"Authorization": f"Bearer {token}"},
+        json=booking_body(road_id, start_time, quantity, slot_id)
+    )
+
+def insert_road(hourly_capacity=10):
+    conn = get_cockroach_connection()
+    cursor = conn.cursor()
+    road_id = str(uuid.uuid4())
+    cursor.execute("INSERT INTO roads (id, name, hourly_capacity) VALUES (%s, %s, %s)",
+                   (road_id, f"Test Road {road_id[:8]}", hourly_capacity))
+    conn.commit()
+    release_cockroach_connection(conn)
+    return road_id
+
+def available_slot(client, token, road_id, start_time):
+    resp = client.post(
+        "/booking/available-slots",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"road_ids": [road_id], "duration_minutes": 10, "distance_meters": 1000}
+    )
+    assert resp.status_code == 200
+    return next(slot for slot in resp.get_json()["available_slots"][road_id] if slot["start_time"] == start_time)
+
+def slot_capacity(road_id, start_time):
+    # (capacity, available_capacity) of a slot, None if it does not exist
+    conn = get_cockroach_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT capacity, available_capacity FROM road_booking_slots WHERE road_id = %s AND slot_time = %s",
+        (road_id, datetime.fromisoformat(start_time))
+    )
+    row = cursor.fetchone()
+    conn.commit()
+    release_cockroach_connection(conn)
+    return row
+
+def login(client, username, password="pass123"):
+    resp = client.post("/user/login", data={"username": username, "password": password})
+    assert resp.status_code == 200
+    return resp.get_json()["access_token"]
+
+def register_and_login(client, content=None, extension="jpg"):
+    # A user of its own, with its own license image unless content is shared
+    username = f"user_{uuid.uuid4().hex[:12]}"
+    resp = client.post("/user/register", data={
+        "givennames": "Test",
+        "lastname": "User",
+        "username": username,
+        "password": "pass123",
+        "license_img": (io.BytesIO(content or uuid.uuid4().bytes), f"{username}_license.{extension}")
+    }, content_type="multipart/form-data")
+    assert resp.status_code == 200
+    return username, login(client, username)
+
+def get_license_image_id(client, token):
+    profile = client.get("/user/profile", headers={"Authorization": f"Bearer {token}"}).get_json()
+    return profile["license_image_id"]
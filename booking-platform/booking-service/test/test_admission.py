@@ -0,0 +1,58 @@
+# booking-service/tests/test_admission.py
+
+import pytest
+from app.admission import reserve_slot_capacity, release_slot_capacity, ADMISSION_COUNTER_KEY
+from app.db import redis_client
+from test.helpers import next_hour, book, available_slot
+
+@pytest.fixture(autouse=True)
+def admission_enabled(monkeypatch):
+    monkeypatch.setattr("app.admission.ADMISSION_CONTROL_ENABLED", True)
+
+def test_reserve_and_release(client, token, new_road_id):
+    start_time = next_hour(9)
+    assert book(client, token, new_road_id, start_time, 8).status_code == 200
+    slot_id = available_slot(client, token, new_road_id, start_time)["slot_id"]
+
+    # Counter is seeded from the database with the 2 places left
+    assert reserve_slot_capacity({slot_id: 2}) == {slot_id: 2}
+    assert reserve_slot_capacity({slot_id: 1}) is None
+
+    release_slot_capacity({slot_id: 2})
+    assert reserve_slot_capacity({slot_id: 1}) == {slot_id: 1}
+    redis_client.delete(ADMISSION_COUNTER_KEY.format(slot_id=slot_id))
+
+def test_full_slot_rejected_by_counter(client, token, new_road_id):
+    start_time = next_hour(10)
+    assert book(client, token, new_road_id, start_time, 1).status_code == 200
+    slot_id = available_slot(client, token, new_road_id, start_time)["slot_id"]
+
+    assert book(client, token, new_road_id, start_time, 9, slot_id=slot_id).status_code == 200
+    resp = book(client, token, new_road_id, start_time, 1, slot_id=slot_id)
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "Booking failed: Road already booked"
+
+def test_counter_dropped_after_booking_by_start_time(client, token, new_road_id):
+    start_time = next_hour(11)
+    assert book(client, token, new_road_id, start_time, 1).status_code == 200
+    slot_id = available_slot(client, token, new_road_id, start_time)["slot_id"]
+    assert book(client, token, new_road_id, start_time, 1, slot_id=slot_id).status_code == 200
+    assert redis_client.exists(ADMISSION_COUNTER_KEY.format(slot_id=slot_id))
+
+    # Booked without a slot id, so the counter never saw it
+    assert book(client, token, new_road_id, start_time, 8).status_code == 200
+    assert not redis_client.exists(ADMISSION_COUNTER_KEY.format(slot_id=slot_id))
+
+    resp = book(client, token, new_road_id, start_time, 1, slot_id=slot_id)
+    assert resp.status_code == 400
+
+def test_counter_dropped_when_database_rejects(client, token, new_road_id):
+    start_time = next_hour(12)
+    assert book(client, token, new_road_id, start_time, 10).status_code == 200
+    slot_id = available_slot(client, token, new_road_id, start_time)["slot_id"]
+
+    # A counter that disagrees with the database
+    redis_client.set(ADMISSION_COUNTER_KEY.format(slot_id=slot_id), 5)
+    resp = book(client, token, new_road_id, start_time, 1, slot_id=slot_id)
+    assert resp.status_code == 400
+    assert not redis_client.exists(ADMISSION_COUNTER_KEY.format(slot_id=slot_id))
@@ -0,0 +1,105 @@
+# booking-service/tests/test_async_booking.py
+
+import json
+import pytest
+from datetime import datetime, timedelta
+from app.booking_worker import process_message, process_batch, BookingRetryLater
+from app.const import BOOKING_WORKER_MAX_DELIVERIES
+from app.db import redis_client
+from test.helpers import next_hour, booking_body
+
+@pytest.fixture(autouse=True)
+def async_enabled(monkeypatch):
+    monkeypatch.setattr("app.booking_routes.ASYNC_BOOKING_ENABLED", True)
+
+def queue_booking(client, token, road_id, start_time):
+    return client.post(
+        "/booking/create-booking",
+        headers={"Authorization": f"Bearer {token}", "Prefer": "respond-async"},
+        json=booking_body(road_id, start_time)
+    )
+
+def worker_fields(ticket_id, road_id, start_time):
+    # What enqueue_booking puts on the stream
+    return {
+        "ticket_id": ticket_id,
+        "username": "testuser",
+        "payload": json.dumps(booking_body(road_id, start_time))
+    }
+
+def get_ticket_status(client, token, ticket_id):
+    resp = client.get(f"/booking/tickets/{ticket_id}", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 200
+    return resp.get_json()["status"]
+
+def test_async_booking_queued(client, token, new_road_id):
+    resp = queue_booking(client, token, new_road_id, next_hour(13))
+    assert resp.status_code == 202
+    ticket_id = resp.get_json()["ticket_id"]
+    assert resp.headers["Location"] == f"/booking/tickets/{ticket_id}"
+    assert get_ticket_status(client, token, ticket_id) == "queued"
+
+def test_async_booking_rejects_invalid_time(client, token, new_road_id):
+    start_time = (datetime.utcnow() + timedelta(hours=2)).replace(minute=15).isoformat()
+    resp = queue_booking(client, token, new_road_id, start_time)
+    assert resp.status_code == 400
+    assert "ticket_id" not in resp.get_json()
+
+def test_worker_confirms_ticket(client, token, new_road_id):
+    start_time = next_hour(14)
+    ticket_id = queue_booking(client, token, new_road_id, start_time).get_json()["ticket_id"]
+
+    process_message("0-1", worker_fields(ticket_id, new_road_id, start_time))
+    assert get_ticket_status(client, token, ticket_id) == "confirmed"
+
+def test_worker_retries_transient_failure(client, token, new_road_id, monkeypatch):
+    start_time = next_hour(15)
+    ticket_id = queue_booking(client, token, new_road_id, start_time).get_json()["ticket_id"]
+
+    monkeypatch.setattr(
+        "app.booking_worker.create_route_booking",
+        lambda *args, **kwargs: {"success": False, "retryable": True, "error": "busy"}
+    )
+    with pytest.raises(BookingRetryLater):
+        process_message("0-1", worker_fields(ticket_id, new_road_id, start_time))
+
+    # Not failed for good, the message is delivered again
+    assert get_ticket_status(client, token, ticket_id) == "queued"
+
+def test_worker_confirms_committed_booking_on_redelivery(client, token, new_road_id, monkeypatch):
+    start_time = next_hour(16)
+    ticket_id = queue_booking(client, token, new_road_id, start_time).get_json()["ticket_id"]
+    fields = worker_fields(ticket_id, new_road_id, start_time)
+
+    # The booking commits, but the worker only sees a dropped connection
+    from app.booking_worker import create_route_booking as book
+    def book_then_fail(*args, **kwargs):
+        book(*args, **kwargs)
+        return {"success": False, "retryable": True, "error": "busy"}
+    monkeypatch.setattr("app.booking_worker.create_route_booking", book_then_fail)
+    with pytest.raises(BookingRetryLater):
+        process_message("0-1", fields)
+    assert get_ticket_status(client, token, ticket_id) == "queued"
+
+    # The redelivery finds the booking instead of booking again
+    monkeypatch.undo()
+    monkeypatch.setattr("app.booking_routes.ASYNC_BOOKING_ENABLED", True)
+    process_message("0-1", fields)
+    assert get_ticket_status(client, token, ticket_id) == "confirmed"
+
+def test_worker_gives_up_on_poison_message(client, token, new_road_id, monkeypatch):
+    ticket_id = queue_booking(client, token, new_road_id, next_hour(17)).get_json()["ticket_id"]
+    fields = dict(worker_fields(ticket_id, new_road_id, next_hour(17)), payload="{not json")
+    acked = []
+    monkeypatch.setattr(redis_client, "xack", lambda stream, group, message_id: acked.append(message_id))
+
+    # Left pending while deliveries remain
+    monkeypatch.setattr("app.booking_worker._times_delivered", lambda message_id: 1)
+    process_batch([("0-1", fields)])
+    assert acked == []
+    assert get_ticket_status(client, token, ticket_id) == "processing"
+
+    monkeypatch.setattr("app.booking_worker._times_delivered", lambda message_id: BOOKING_WORKER_MAX_DELIVERIES)
+    process_batch([("0-1", fields)])
+    assert acked == ["0-1"]
+    assert get_ticket_status(client, token, ticket_id) == "failed"
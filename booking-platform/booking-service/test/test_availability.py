@@ -0,0 +1,64 @@
+# booking-service/tests/test_availability.py
+
+import uuid
+from test.helpers import next_hour, book, available_slot
+
+def route_windows(client, token, **body):
+    return client.post("/booking/route-windows", headers={"Authorization": f"Bearer {token}"}, json=body)
+
+def test_cached_availability_follows_bookings(client, token, new_road_id):
+    start_time = next_hour(3)
+
+    # First read fills the cache
+    assert available_slot(client, token, new_road_id, start_time)["available_capacity"] == 10
+    assert book(client, token, new_road_id, start_time, 4).status_code == 200
+
+    slot = available_slot(client, token, new_road_id, start_time)
+    assert slot["available_capacity"] == 6
+    assert slot["slot_id"]
+
+def test_cached_availability_follows_cancellation(client, token, new_road_id):
+    start_time = next_hour(4)
+    booking_id = book(client, token, new_road_id, start_time, 2).get_json()["booking_id"]
+    assert available_slot(client, token, new_road_id, start_time)["available_capacity"] == 8
+
+    cancel_resp = client.post(f"/booking/{booking_id}/cancel", headers={"Authorization": f"Bearer {token}"})
+    assert cancel_resp.status_code == 200
+    assert available_slot(client, token, new_road_id, start_time)["available_capacity"] == 10
+
+def test_route_windows_earliest_first(client, token, new_road_id):
+    resp = route_windows(client, token, road_ids=[new_road_id], duration_minutes=30, limit=3)
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data["count"] == 3
+    assert [window["departure_time"] for window in data["windows"]] == [next_hour(1), next_hour(2), next_hour(3)]
+
+def test_route_windows_skip_full_hours(client, token, new_road_id):
+    # Fill the first hour, then book the first window offered
+    book(client, token, new_road_id, next_hour(1), 10)
+
+    window = route_windows(client, token, road_ids=[new_road_id], duration_minutes=30, limit=1).get_json()["windows"][0]
+    assert window["departure_time"] == next_hour(2)
+
+    resp = client.post(
+        "/booking/create-booking",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"bookings": window["bookings"], "origin": "A", "destination": "B"}
+    )
+    assert resp.status_code == 200
+
+def test_route_windows_quantity_over_capacity(client, token, new_road_id):
+    resp = route_windows(client, token, road_ids=[new_road_id], duration_minutes=30, quantity=11)
+    assert resp.status_code == 200
+    assert resp.get_json()["count"] == 0
+
+def test_route_windows_unknown_road(client, token):
+    road_id = str(uuid.uuid4())
+    resp = route_windows(client, token, road_ids=[road_id], duration_minutes=30)
+    assert resp.status_code == 404
+    assert resp.get_json()["road_ids"] == [road_id]
+
+def test_route_windows_invalid(client, token, new_road_id):
+    assert route_windows(client, token, road_ids=[new_road_id], duration_minutes=0).status_code == 400
+    assert route_windows(client, token, road_ids=[new_road_id], duration_minutes="soon").status_code == 400
+    assert route_windows(client, token, road_ids=[]).status_code == 400
@@ -0,0 +1,77 @@
+# booking-service/tests/test_bulk_booking.py
+
+import psycopg2
+from datetime import datetime, timedelta
+from app.const import ERROR_UNEXPECTED, ERROR_SERVICE_BUSY
+from test.helpers import next_hour, booking_body
+
+def test_bulk_partial_acceptance(client, token, new_road_id):
+    resp = client.post(
+        "/booking/bulk-create",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"bookings": [
+            booking_body(new_road_id, next_hour(16)),
+            booking_body(new_road_id, (datetime.utcnow() + timedelta(hours=17)).replace(minute=30).isoformat()),
+            {"origin": "A", "destination": "B"},
+            booking_body(new_road_id, next_hour(17), quantity=11),
+            booking_body(new_road_id, next_hour(18), quantity=2)
+        ]}
+    )
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data["success_count"] == 2
+    assert data["total_count"] == 5
+    assert [result["success"] for result in data["results"]] == [True, False, False, False, True]
+    assert data["results"][1]["error"] == "Booking failed: Slots start on the hour"
+    assert data["results"][3]["error"] == "Booking failed: Road already booked"
+
+def test_bulk_items_share_a_slot(client, token, new_road_id):
+    start_time = next_hour(19)
+    resp = client.post(
+        "/booking/bulk-create",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"bookings": [booking_body(new_road_id, start_time, quantity=6) for _ in range(2)]}
+    )
+    assert resp.status_code == 200
+    # Only one of them fits into the capacity of 10
+    assert resp.get_json()["success_count"] == 1
+
+def test_bulk_all_rejected(client, token, new_road_id):
+    resp = client.post(
+        "/booking/bulk-create",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"bookings": [booking_body(new_road_id, next_hour(-3))]}
+    )
+    assert resp.status_code == 400
+    assert resp.get_json()["success_count"] == 0
+
+def test_bulk_empty(client, token):
+    resp = client.post("/booking/bulk-create", headers={"Authorization": f"Bearer {token}"}, json={"bookings": []})
+    assert resp.status_code == 400
+
+def test_bulk_database_error_is_not_leaked(client, token, new_road_id, monkeypatch):
+    def fail(*args, **kwargs):
+        raise psycopg2.ProgrammingError("relation \"road_booking_slots\" does not exist")
+    monkeypatch.setattr("app.booking_routes.resolve_line_slot_ids", fail)
+    resp = client.post(
+        "/booking/bulk-create",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"bookings": [booking_body(new_road_id, next_hour(20)) for _ in range(2)]}
+    )
+    assert resp.status_code == 400
+    for result in resp.get_json()["results"]:
+        assert result["error"] == ERROR_UNEXPECTED
+        assert "retryable" not in result
+
+def test_bulk_transient_error_is_retryable(client, token, new_road_id, monkeypatch):
+    def fail(*args, **kwargs):
+        raise psycopg2.OperationalError("server closed the connection unexpectedly")
+    monkeypatch.setattr("app.booking_routes.resolve_line_slot_ids", fail)
+    resp = client.post(
+        "/booking/bulk-create",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"bookings": [booking_body(new_road_id, next_hour(21))]}
+    )
+    result = resp.get_json()["results"][0]
+    assert result["error"] == ERROR_SERVICE_BUSY
+    assert result["retryable"] is True
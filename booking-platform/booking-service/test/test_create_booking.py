@@ -0,0 +1,160 @@
+# booking-service/tests/test_create_booking.py
+
+import uuid
+import pytest
+import psycopg2
+from datetime import datetime, timedelta
+from app.db import get_cockroach_connection, release_cockroach_connection
+from app.slots import ensure_slot_schema
+from app.availability import AVAILABILITY_HORIZON_DAYS
+from test.helpers import next_hour, book, available_slot, insert_road
+
+def test_booking_without_slot_id_creates_slot(client, token, new_road_id):
+    resp = book(client, token, new_road_id, next_hour(2))
+    assert resp.status_code == 200
+    assert resp.get_json()["success"] is True
+
+def test_booking_not_on_the_hour(client, token, new_road_id):
+    start_time = (datetime.utcnow().replace(minute=0, second=0, microsecond=0) + timedelta(hours=2, minutes=30)).isoformat()
+    resp = book(client, token, new_road_id, start_time)
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "Booking failed: Slots start on the hour"
+
+def test_booking_beyond_window(client, token, new_road_id):
+    resp = book(client, token, new_road_id, next_hour(24 * 30))
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "Booking failed: Slot is beyond the booking window"
+
+def test_booking_past_slot(client, token, new_road_id):
+    resp = book(client, token, new_road_id, next_hour(-2))
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "Booking failed: Cannot book a past time slot"
+
+def test_rejected_times_create_no_slots(client, token, new_road_id):
+    book(client, token, new_road_id, next_hour(24 * 30))
+    conn = get_cockroach_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM road_booking_slots WHERE road_id = %s", (new_road_id,))
+    assert cursor.fetchone()[0] == 0
+    conn.commit()
+    release_cockroach_connection(conn)
+
+def test_booking_slot_of_another_road(client, token, test_road_id, new_road_id):
+    start_time = next_hour(3)
+    assert book(client, token, test_road_id, start_time).status_code == 200
+    slot_id = available_slot(client, token, test_road_id, start_time)["slot_id"]
+
+    # The slot id of test_road_id sent for new_road_id
+    resp = book(client, token, new_road_id, start_time, slot_id=slot_id)
+    assert resp.status_code == 400
+    assert "is not on road" in resp.get_json()["error"]
+
+def test_booking_invalid_slot_id(client, token, new_road_id):
+    resp = book(client, token, new_road_id, next_hour(4), slot_id="not-a-uuid")
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "Booking failed: Invalid slot id"
+    assert "Retry-After" not in resp.headers
+
+def test_slot_schema_upgrade_is_repeatable(monkeypatch):
+    # Checked once per process otherwise
+    monkeypatch.setattr("app.slots._schema_checked", False)
+    ensure_slot_schema()
+    monkeypatch.setattr("app.slots._schema_checked", False)
+    ensure_slot_schema()
+
+def test_one_slot_per_road_and_hour(new_road_id):
+    slot_time = datetime.utcnow().replace(minute=0, second=0, microsecond=0) + timedelta(hours=50)
+    conn = get_cockroach_connection()
+    cursor = conn.cursor()
+    insert = """
+        INSERT INTO road_booking_slots (road_booking_slot_id, road_id, slot_time, capacity, available_capacity)
+        VALUES (%s, %s, %s, %s, %s)
+    """
+    cursor.execute(insert, (str(uuid.uuid4()), new_road_id, slot_time, 10, 10))
+    conn.commit()
+
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        cursor.execute(insert, (str(uuid.uuid4()), new_road_id, slot_time, 10, 10))
+    conn.rollback()
+    release_cockroach_connection(conn)
+
+def available_slots(client, token, road_ids):
+    resp = client.post(
+        "/booking/available-slots",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"road_ids": road_ids, "duration_minutes": 10, "distance_meters": 1000}
+    )
+    assert resp.status_code == 200
+    return resp.get_json()["available_slots"]
+
+def test_available_slots_for_several_roads(client, token, new_road_id):
+    small_road_id = insert_road(2)
+    unknown_road_id = str(uuid.uuid4())
+
+    slots = available_slots(client, token, [new_road_id, small_road_id, unknown_road_id])
+    assert slots[unknown_road_id] == []
+    assert {slot["capacity"] for slot in slots[new_road_id]} == {10}
+    assert {slot["capacity"] for slot in slots[small_road_id]} == {2}
+    # Every future hour of the window, no more
+    assert len(slots[new_road_id]) < AVAILABILITY_HORIZON_DAYS * 24
+    assert slots[new_road_id][0]["start_time"] == next_hour(1)
+
+def test_route_booking_all_or_nothing(client, token, new_road_id):
+    small_road_id = insert_road(2)
+    start_time = next_hour(2)
+
+    # Room on the first road, not on the second
+    resp = client.post(
+        "/booking/create-booking",
+        headers={"Authorization": f"Bearer {token}"},
+        json={
+            "bookings": [
+                {"road_id": new_road_id, "slots": [{"start_time": start_time}], "quantity": 3},
+                {"road_id": small_road_id, "slots": [{"start_time": start_time}], "quantity": 3}
+            ],
+            "origin": "A",
+            "destination": "B"
+        }
+    )
+    assert resp.status_code == 400
+
+    assert available_slot(client, token, new_road_id, start_time)["available_capacity"] == 10
+
+def test_route_booking_over_several_hours(client, token, new_road_id):
+    small_road_id = insert_road(2)
+    resp = client.post(
+        "/booking/create-booking",
+        headers={"Authorization": f"Bearer {token}"},
+        json={
+            "bookings": [
+                {"road_id": new_road_id, "slots": [{"start_time": next_hour(3)}, {"start_time": next_hour(4)}], "quantity": 2},
+                {"road_id": small_road_id, "slots": [{"start_time": next_hour(4)}], "quantity": 2}
+            ],
+            "origin": "A",
+            "destination": "B"
+        }
+    )
+    assert resp.status_code == 200
+    assert resp.get_json()["success_count"] == 3
+    assert resp.get_json()["total_count"] == 2
+
+    slots = available_slots(client, token, [new_road_id, small_road_id])
+    assert [slot["available_capacity"] for slot in slots[new_road_id] if slot["start_time"] in (next_hour(3), next_hour(4))] == [8, 8]
+    assert next(slot for slot in slots[small_road_id] if slot["start_time"] == next_hour(4))["available"] is False
+
+def test_route_booking_without_slots_writes_nothing(client, token, new_road_id):
+    origin = f"empty-{uuid.uuid4().hex[:8]}"
+    resp = client.post(
+        "/booking/create-booking",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"bookings": [{"road_id": new_road_id, "slots": []}], "origin": origin, "destination": "B"}
+    )
+    assert resp.status_code == 400
+    assert resp.get_json()["booking_id"] is None
+
+    conn = get_cockroach_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM bookings WHERE origin = %s", (origin,))
+    assert cursor.fetchone()[0] == 0
+    conn.commit()
+    release_cockroach_connection(conn)
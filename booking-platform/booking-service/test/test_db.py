@@ -0,0 +1,180 @@
+# booking-service/tests/test_db.py
+
+import threading
+import time
+import pytest
+import psycopg2.errors
+import psycopg2.extensions
+from app.db import (
+    CockroachPool, PoolTimeout, cockroach_pool, cockroach_connection, release_request_connection,
+    get_cockroach_connection, release_cockroach_connection, run_transaction, get_transaction_stats, TransactionAborted
+)
+from app.const import ERROR_SERVICE_BUSY, ERROR_UNEXPECTED
+from test.helpers import next_hour, book
+
+@pytest.fixture
+def small_pool():
+    # Same database as the app's pool, two connections at most
+    pool = CockroachPool(maxconn=2, timeout=0.2, max_lifetime=600, validate_after=0, long_hold=0.1,
+                         **cockroach_pool._connect_kwargs)
+    yield pool
+    pool.closeall()
+
+def test_pool_reuses_connections(small_pool):
+    conn = small_pool.getconn()
+    small_pool.putconn(conn)
+    assert small_pool.getconn() is conn
+    small_pool.putconn(conn)
+
+    stats = small_pool.stats()
+    assert stats["opened"] == 1
+    assert stats["checkouts"] == 2
+    assert stats["idle"] == 1
+
+def test_pool_is_bounded(small_pool):
+    first, second = small_pool.getconn(), small_pool.getconn()
+    with pytest.raises(PoolTimeout):
+        small_pool.getconn()
+    assert small_pool.stats()["timeouts"] == 1
+
+    small_pool.putconn(first)
+    small_pool.putconn(second)
+
+def test_pool_hands_over_returned_connection(small_pool):
+    first, second = small_pool.getconn(), small_pool.getconn()
+    threading.Timer(0.05, small_pool.putconn, args=(first,)).start()
+
+    # Waits for the connection given back by the timer
+    assert small_pool.getconn(timeout=1) is first
+    small_pool.putconn(first)
+    small_pool.putconn(second)
+
+def test_pool_rolls_back_returned_transaction(small_pool):
+    conn = small_pool.getconn()
+    conn.cursor().execute("SELECT 1")
+    small_pool.putconn(conn)
+
+    conn = small_pool.getconn()
+    assert conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    small_pool.putconn(conn)
+
+def test_pool_drops_closed_connections(small_pool):
+    conn = small_pool.getconn()
+    conn.close()
+    small_pool.putconn(conn)
+
+    stats = small_pool.stats()
+    assert stats["size"] == 0
+    assert stats["closed"] == 1
+    new_conn = small_pool.getconn()
+    assert new_conn is not conn
+    small_pool.putconn(new_conn)
+
+def test_pool_reports_long_holds(small_pool):
+    conn = small_pool.getconn(site="test_db:long_hold")
+    time.sleep(0.2)
+
+    held = small_pool.stats()["held_too_long"]
+    assert [hold["site"] for hold in held] == ["test_db:long_hold"]
+
+    small_pool.putconn(conn)
+    stats = small_pool.stats()
+    assert stats["long_holds"] == 1
+    assert stats["held_too_long"] == []
+
+def test_admin_metrics_report_pool(client, admin_token):
+    resp = client.get("/admin/metrics", headers={"Authorization": f"Bearer {admin_token}"})
+    assert resp.status_code == 200
+    pool_stats = resp.get_json()["cockroach_pool"]
+    assert pool_stats["max_size"] == cockroach_pool.maxconn
+    assert pool_stats["in_use"] >= 0
+    assert "held_too_long" in pool_stats
+
+def test_blocks_of_a_request_share_a_connection(app):
+    with app.test_request_context():
+        with cockroach_connection() as first:
+            first.cursor().execute("SELECT 1")
+        with cockroach_connection() as second:
+            pass
+        assert second is first
+
+        # Left idle between blocks, not inside a transaction
+        assert first.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        release_request_connection()
+
+def test_nested_block_gets_its_own_connection(app):
+    with app.test_request_context():
+        with cockroach_connection() as outer:
+            with cockroach_connection() as inner:
+                assert inner is not outer
+        release_request_connection()
+
+def test_request_connection_returned_at_teardown(app):
+    in_use = cockroach_pool.stats()["in_use"]
+    with app.test_request_context():
+        with cockroach_connection():
+            assert cockroach_pool.stats()["in_use"] == in_use + 1
+        # Still held by the request until it is torn down
+        assert cockroach_pool.stats()["in_use"] == in_use + 1
+    assert cockroach_pool.stats()["in_use"] == in_use
+
+def test_outside_a_request(app):
+    in_use = cockroach_pool.stats()["in_use"]
+    with cockroach_connection():
+        assert cockroach_pool.stats()["in_use"] == in_use + 1
+    assert cockroach_pool.stats()["in_use"] == in_use
+
+def force_retry(cursor):
+    # CockroachDB fails the transaction with 40001 until it is 50ms old
+    cursor.execute("SELECT crdb_internal.force_retry('50ms'::INTERVAL)")
+    return "done"
+
+def test_serialization_failure_is_retried():
+    conn = get_cockroach_connection()
+    before = get_transaction_stats()
+    try:
+        assert run_transaction(conn, force_retry, max_retries=50) == "done"
+    finally:
+        release_cockroach_connection(conn)
+
+    after = get_transaction_stats()
+    assert after["retries"] > before["retries"]
+    assert after["committed"] == before["committed"] + 1
+
+def test_retries_run_out():
+    conn = get_cockroach_connection()
+    try:
+        with pytest.raises(psycopg2.errors.SerializationFailure):
+            run_transaction(conn, force_retry, max_retries=0)
+    finally:
+        release_cockroach_connection(conn)
+
+def test_transaction_aborted_returns_result():
+    def abort(cursor):
+        cursor.execute("SELECT 1")
+        raise TransactionAborted({"success": False})
+
+    conn = get_cockroach_connection()
+    try:
+        assert run_transaction(conn, abort) == {"success": False}
+    finally:
+        release_cockroach_connection(conn)
+
+def test_cancel_errors_are_not_leaked(client, token, new_road_id, monkeypatch):
+    booking_id = book(client, token, new_road_id, next_hour(48)).get_json()["booking_id"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def busy(cursor, booking_ids):
+        raise psycopg2.errors.SerializationFailure("restart transaction: TransactionRetryWithProtoRefreshError")
+    monkeypatch.setattr("app.booking_routes.cancel_bookings", busy)
+    resp = client.post(f"/booking/{booking_id}/cancel", headers=headers)
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+    assert resp.get_json()["error"] == ERROR_SERVICE_BUSY
+
+    def broken(cursor, booking_ids):
+        raise RuntimeError("relation \"booking_lines\" does not exist")
+    monkeypatch.setattr("app.booking_routes.cancel_bookings", broken)
+    resp = client.post(f"/booking/{booking_id}/cancel", headers=headers)
+    assert resp.status_code == 500
+    assert resp.get_json()["error"] == ERROR_UNEXPECTED
@@ -0,0 +1,62 @@
+# booking-service/tests/test_gunicorn_conf.py
+
+import os
+import runpy
+
+GUNICORN_CONF = os.path.join(os.path.dirname(os.path.dirname(__file__)), "gunicorn.conf.py")
+
+def load_conf(monkeypatch, **env):
+    for name in ("GEVENT_ENABLED", "GEVENT_WORKER_CONNECTIONS", "GEVENT_REQUESTS_PER_DB_CONNECTION",
+                 "COCKROACH_POOL_MAX_SIZE", "COCKROACH_CONNECTION_BUDGET", "GUNICORN_WORKERS",
+                 "GUNICORN_THREADS", "GUNICORN_PRELOAD", "GUNICORN_MAX_REQUESTS", "GUNICORN_MAX_REQUESTS_JITTER"):
+        monkeypatch.delenv(name, raising=False)
+    # Unset, and put back as it was after the test whatever the preload branch sets
+    monkeypatch.setenv("BACKGROUND_TASKS_DEFERRED", "")
+    monkeypatch.delenv("BACKGROUND_TASKS_DEFERRED")
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return runpy.run_path(GUNICORN_CONF)
+
+def test_gevent_connections_follow_pool(monkeypatch):
+    conf = load_conf(monkeypatch, GEVENT_ENABLED="True", COCKROACH_POOL_MAX_SIZE="10")
+    assert conf["worker_class"] == "gevent"
+    assert conf["worker_connections"] == 40
+
+def test_gevent_connections_per_db_connection(monkeypatch):
+    conf = load_conf(monkeypatch, GEVENT_ENABLED="True", COCKROACH_POOL_MAX_SIZE="5",
+                     GEVENT_REQUESTS_PER_DB_CONNECTION="2")
+    assert conf["worker_connections"] == 10
+
+def test_gevent_connections_override(monkeypatch):
+    conf = load_conf(monkeypatch, GEVENT_ENABLED="True", GEVENT_WORKER_CONNECTIONS="100")
+    assert conf["worker_connections"] == 100
+
+def test_threads_follow_pool(monkeypatch):
+    conf = load_conf(monkeypatch, COCKROACH_POOL_MAX_SIZE="8", GUNICORN_PRELOAD="False")
+    assert conf["worker_class"] == "gthread"
+    assert conf["threads"] == 8
+
+def test_workers_capped_by_connection_budget(monkeypatch):
+    conf = load_conf(monkeypatch, GUNICORN_WORKERS="16", COCKROACH_POOL_MAX_SIZE="10",
+                     COCKROACH_CONNECTION_BUDGET="40", GUNICORN_PRELOAD="False")
+    assert conf["workers"] == 4
+
+def test_workers_without_connection_budget(monkeypatch):
+    conf = load_conf(monkeypatch, GUNICORN_WORKERS="16", COCKROACH_CONNECTION_BUDGET="0",
+                     GUNICORN_PRELOAD="False")
+    assert conf["workers"] == 16
+
+def test_preload_defers_background_tasks(monkeypatch):
+    conf = load_conf(monkeypatch)
+    assert conf["preload_app"] is True
+    # Workers start them after the fork instead
+    assert os.environ["BACKGROUND_TASKS_DEFERRED"] == "True"
+
+def test_workers_recycled(monkeypatch):
+    conf = load_conf(monkeypatch, GUNICORN_PRELOAD="False")
+    assert conf["max_requests"] == 1000
+    assert conf["max_requests_jitter"] == 100
+
+def test_no_preload_under_gevent(monkeypatch):
+    conf = load_conf(monkeypatch, GEVENT_ENABLED="True")
+    assert conf["preload_app"] is False
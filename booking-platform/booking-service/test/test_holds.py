@@ -0,0 +1,74 @@
+# booking-service/tests/test_holds.py
+
+import time
+from app.holds import claim_hold, get_hold, release_claimed_holds, sweep_expired_holds
+from test.helpers import next_hour, slot_capacity
+
+def create_hold(client, token, road_id, start_time, quantity, ttl_seconds=None):
+    body = {"bookings": [{"road_id": road_id, "slots": [{"start_time": start_time}], "quantity": quantity}]}
+    if ttl_seconds:
+        body["ttl_seconds"] = ttl_seconds
+    return client.post("/booking/holds", headers={"Authorization": f"Bearer {token}"}, json=body)
+
+def test_hold_and_confirm(client, token, new_road_id):
+    start_time = next_hour(20)
+    resp = create_hold(client, token, new_road_id, start_time, 4)
+    assert resp.status_code == 201
+    hold_id = resp.get_json()["hold_id"]
+    assert slot_capacity(new_road_id, start_time) == (10, 6)
+
+    confirm = client.post(f"/booking/holds/{hold_id}/confirm", headers={"Authorization": f"Bearer {token}"}, json={})
+    assert confirm.status_code == 200
+    assert confirm.get_json()["success"] is True
+    assert slot_capacity(new_road_id, start_time) == (10, 6)
+
+    # Used up
+    again = client.post(f"/booking/holds/{hold_id}/confirm", headers={"Authorization": f"Bearer {token}"}, json={})
+    assert again.status_code == 404
+
+def test_hold_over_capacity(client, token, new_road_id):
+    resp = create_hold(client, token, new_road_id, next_hour(21), 11)
+    assert resp.status_code == 409
+
+def test_release_hold(client, token, new_road_id):
+    start_time = next_hour(22)
+    hold_id = create_hold(client, token, new_road_id, start_time, 3).get_json()["hold_id"]
+
+    resp = client.delete(f"/booking/holds/{hold_id}", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 200
+    assert slot_capacity(new_road_id, start_time) == (10, 10)
+
+def test_release_hold_claimed_elsewhere(client, token, new_road_id):
+    start_time = next_hour(23)
+    hold_id = create_hold(client, token, new_road_id, start_time, 3).get_json()["hold_id"]
+
+    # A confirm or the sweeper has taken the hold but not finished with it
+    assert claim_hold(hold_id)
+    resp = client.delete(f"/booking/holds/{hold_id}", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 409
+    assert slot_capacity(new_road_id, start_time) == (10, 7)
+
+    release_claimed_holds({hold_id: get_hold(hold_id)})
+    assert slot_capacity(new_road_id, start_time) == (10, 10)
+
+def test_expired_hold(client, token, new_road_id):
+    start_time = next_hour(24)
+    hold_id = create_hold(client, token, new_road_id, start_time, 5, ttl_seconds=1).get_json()["hold_id"]
+    time.sleep(1.5)
+
+    resp = client.post(f"/booking/holds/{hold_id}/confirm", headers={"Authorization": f"Bearer {token}"}, json={})
+    assert resp.status_code == 410
+
+    sweep_expired_holds()
+    assert get_hold(hold_id) is None
+    assert slot_capacity(new_road_id, start_time) == (10, 10)
+
+def test_swept_hold_returns_capacity(client, token, new_road_id):
+    start_time = next_hour(25)
+    hold_id = create_hold(client, token, new_road_id, start_time, 5, ttl_seconds=1).get_json()["hold_id"]
+    assert slot_capacity(new_road_id, start_time) == (10, 5)
+    time.sleep(1.5)
+
+    sweep_expired_holds()
+    assert get_hold(hold_id) is None
+    assert slot_capacity(new_road_id, start_time) == (10, 10)
@@ -0,0 +1,40 @@
+# booking-service/tests/test_idempotency.py
+
+import uuid
+from test.helpers import next_hour, booking_body
+
+def test_idempotent_replay(client, token, new_road_id):
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": str(uuid.uuid4())}
+    body = booking_body(new_road_id, next_hour(5))
+
+    first = client.post("/booking/create-booking", headers=headers, json=body)
+    assert first.status_code == 200
+
+    replay = client.post("/booking/create-booking", headers=headers, json=body)
+    assert replay.status_code == 200
+    assert replay.headers.get("Idempotent-Replayed") == "true"
+    assert replay.get_json()["booking_id"] == first.get_json()["booking_id"]
+
+    # Booked once only
+    bookings = client.get("/booking/user-bookings", headers={"Authorization": f"Bearer {token}"}).get_json()
+    assert sum(1 for booking in bookings if booking["booking_id"] == first.get_json()["booking_id"]) == 1
+
+def test_idempotency_key_reused_with_other_body(client, token, new_road_id):
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": str(uuid.uuid4())}
+
+    first = client.post("/booking/create-booking", headers=headers, json=booking_body(new_road_id, next_hour(6)))
+    assert first.status_code == 200
+
+    conflict = client.post("/booking/create-booking", headers=headers, json=booking_body(new_road_id, next_hour(7)))
+    assert conflict.status_code == 422
+
+def test_failed_booking_is_not_replayed(client, token, new_road_id):
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": str(uuid.uuid4())}
+    body = booking_body(new_road_id, next_hour(8), quantity=11)
+
+    first = client.post("/booking/create-booking", headers=headers, json=body)
+    assert first.status_code == 400
+
+    retry = client.post("/booking/create-booking", headers=headers, json=body)
+    assert retry.status_code == 400
+    assert retry.headers.get("Idempotent-Replayed") is None
@@ -0,0 +1,255 @@
+# booking-service/tests/test_licenses.py
+
+import io
+import uuid
+import pytest
+from bson import ObjectId
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from app.db import mongo_db, get_cockroach_connection, release_cockroach_connection
+from app.const import MONGODB_LICENSE_BUCKET
+from app.licenses import ensure_license_indexes, get_license_owners, license_bucket, store_license_image, sweep_orphan_license_images
+from test.helpers import register_and_login, get_license_image_id
+
+@pytest.fixture
+def license_image(client):
+    # 32 bytes of their own, so the image is not shared with other users
+    content = uuid.uuid4().hex.encode()
+    _, token = register_and_login(client, content)
+    return token, f"/user/licenses/{get_license_image_id(client, token)}", content
+
+@pytest.fixture
+def license_photo(client):
+    # A random colour keeps the image out of the way of other users' images
+    output = io.BytesIO()
+    Image.new("RGB", (800, 600), tuple(uuid.uuid4().bytes[:3])).save(output, format="PNG")
+    _, token = register_and_login(client, output.getvalue(), "png")
+    return token, f"/user/licenses/{get_license_image_id(client, token)}"
+
+def get_image(client, token, url, **headers):
+    return client.get(url, headers={"Authorization": f"Bearer {token}", **headers})
+
+def test_license_full_image(client, license_image):
+    token, url, content = license_image
+    resp = get_image(client, token, url)
+    assert resp.status_code == 200
+    assert resp.data == content
+    assert resp.headers["Accept-Ranges"] == "bytes"
+    assert resp.headers["Content-Length"] == str(len(content))
+
+def test_license_byte_range(client, license_image):
+    token, url, content = license_image
+    resp = get_image(client, token, url, Range="bytes=0-3")
+    assert resp.status_code == 206
+    assert resp.data == content[0:4]
+    assert resp.headers["Content-Range"] == "bytes 0-3/32"
+
+def test_license_range_past_the_end(client, license_image):
+    token, url, content = license_image
+    resp = get_image(client, token, url, Range="bytes=28-100")
+    assert resp.status_code == 206
+    assert resp.data == content[28:]
+    assert resp.headers["Content-Range"] == "bytes 28-31/32"
+
+def test_license_suffix_range(client, license_image):
+    token, url, content = license_image
+    resp = get_image(client, token, url, Range="bytes=-5")
+    assert resp.status_code == 206
+    assert resp.data == content[-5:]
+    assert resp.headers["Content-Range"] == "bytes 27-31/32"
+
+def test_license_suffix_longer_than_image(client, license_image):
+    token, url, content = license_image
+    resp = get_image(client, token, url, Range="bytes=-100")
+    assert resp.status_code == 206
+    assert resp.data == content
+    assert resp.headers["Content-Range"] == "bytes 0-31/32"
+
+def test_license_unsatisfiable_range(client, license_image):
+    token, url, _ = license_image
+    resp = get_image(client, token, url, Range="bytes=40-")
+    assert resp.status_code == 416
+    assert resp.headers["Content-Range"] == "bytes */32"
+
+def test_license_multiple_ranges(client, license_image):
+    token, url, content = license_image
+    resp = get_image(client, token, url, Range="bytes=0-1,4-5")
+    assert resp.status_code == 200
+    assert resp.data == content
+
+def test_license_other_user(client, license_image):
+    _, url, _ = license_image
+    _, other_token = register_and_login(client)
+    resp = get_image(client, other_token, url)
+    assert resp.status_code == 403
+
+def test_license_if_none_match(client, license_photo):
+    token, url = license_photo
+    first = get_image(client, token, url)
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"].startswith("private")
+
+    resp = get_image(client, token, url, **{"If-None-Match": first.headers["ETag"]})
+    assert resp.status_code == 304
+    assert resp.data == b""
+
+def test_license_if_modified_since(client, license_photo):
+    token, url = license_photo
+    first = get_image(client, token, url)
+    resp = get_image(client, token, url, **{"If-Modified-Since": first.headers["Last-Modified"]})
+    assert resp.status_code == 304
+
+def test_license_stale_etag(client, license_photo):
+    token, url = license_photo
+    resp = get_image(client, token, url, **{"If-None-Match": '"stale"'})
+    assert resp.status_code == 200
+
+def test_license_thumbnail(client, license_photo):
+    token, url = license_photo
+    original = get_image(client, token, url)
+    resp = get_image(client, token, f"{url}?size=thumb")
+    assert resp.status_code == 200
+    assert resp.mimetype == "image/jpeg"
+    assert resp.headers["ETag"] != original.headers["ETag"]
+    assert max(Image.open(io.BytesIO(resp.data)).size) <= 200
+
+    # Served from the stored rendition the second time
+    again = get_image(client, token, f"{url}?size=thumb", **{"If-None-Match": resp.headers["ETag"]})
+    assert again.status_code == 304
+
+def test_license_unknown_size(client, license_photo):
+    token, url = license_photo
+    resp = get_image(client, token, f"{url}?size=huge")
+    assert resp.status_code == 400
+
+def test_license_rendition_of_non_image(client):
+    content = f"%PDF-1.4 {uuid.uuid4().hex}".encode()
+    _, token = register_and_login(client, content, "pdf")
+
+    resp = get_image(client, token, f"/user/licenses/{get_license_image_id(client, token)}?size=thumb")
+    assert resp.status_code == 200
+    assert resp.data == content
+
+def test_same_image_stored_once(client):
+    content = uuid.uuid4().hex.encode()
+    first_user, first_token = register_and_login(client, content)
+    second_user, second_token = register_and_login(client, content)
+    first_id = get_license_image_id(client, first_token)
+    second_id = get_license_image_id(client, second_token)
+
+    assert first_id == second_id
+    assert sorted(get_license_owners(first_id)) == sorted([first_user, second_user])
+
+    resp = get_image(client, second_token, f"/user/licenses/{second_id}")
+    assert resp.status_code == 200
+    assert resp.data == content
+
+def test_duplicate_registration_keeps_shared_image(client):
+    content = uuid.uuid4().hex.encode()
+    username, token = register_and_login(client, content)
+    license_image_id = get_license_image_id(client, token)
+
+    # Same username again: rejected, and the image keeps its one reference
+    resp = client.post("/user/register", data={
+        "givennames": "Test",
+        "lastname": "User",
+        "username": username,
+        "password": "pass123",
+        "license_img": (io.BytesIO(content), f"{username}_license.jpg")
+    }, content_type="multipart/form-data")
+    assert resp.status_code == 400
+    assert get_license_owners(license_image_id) == [username]
+
+def test_license_indexes(client):
+    # Safe to run on every start
+    ensure_license_indexes()
+    ensure_license_indexes()
+
+    indexes = mongo_db[f"{MONGODB_LICENSE_BUCKET}.files"].index_information()
+    sha256_index = next(index for index in indexes.values() if index["key"] == [("metadata.sha256", 1)])
+    assert sha256_index.get("unique") is True
+    assert any(index["key"] == [("metadata.source_id", 1), ("metadata.size", 1)] for index in indexes.values())
+
+def store_unhashed_image(username, content):
+    # How images were stored before they were keyed by content
+    return str(license_bucket.upload_from_stream(
+        f"{username}_license.jpg", io.BytesIO(content), metadata={"username": username}
+    ))
+
+def set_license_image_id(username, license_image_id):
+    conn = get_cockroach_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE users SET license_image_id = %s WHERE username = %s", (license_image_id, username))
+    conn.commit()
+    release_cockroach_connection(conn)
+
+def test_unhashed_images_backfilled(client):
+    content = uuid.uuid4().hex.encode()
+    first_user, first_token = register_and_login(client, content)
+    first_id = get_license_image_id(client, first_token)
+
+    # A user whose copy of the same bytes predates hashing
+    second_user, second_token = register_and_login(client)
+    duplicate_id = store_unhashed_image(second_user, content)
+    set_license_image_id(second_user, duplicate_id)
+
+    # And one whose image is the only copy
+    third_user, _ = register_and_login(client)
+    unique_id = store_unhashed_image(third_user, uuid.uuid4().hex.encode())
+    set_license_image_id(third_user, unique_id)
+
+    ensure_license_indexes()
+
+    assert get_license_image_id(client, second_token) == first_id
+    assert sorted(get_license_owners(first_id)) == sorted([first_user, second_user])
+    assert get_license_owners(duplicate_id) is None
+
+    files = mongo_db[f"{MONGODB_LICENSE_BUCKET}.files"]
+    assert files.find_one({"_id": ObjectId(unique_id)})["metadata"]["sha256"]
+    assert get_license_owners(unique_id) == [third_user]
+
+def test_unreferenced_copy_not_shared(client):
+    content = uuid.uuid4().hex.encode()
+    first = f"ghost_{uuid.uuid4().hex[:12]}"
+    first_id, _ = store_license_image(first, FileStorage(io.BytesIO(content), f"{first}_license.jpg"))
+
+    # A copy whose last reference was just released but not yet deleted
+    files = mongo_db[f"{MONGODB_LICENSE_BUCKET}.files"]
+    files.update_one({"_id": ObjectId(first_id)}, {"$set": {"metadata.owners": [], "metadata.ref_count": 0}})
+
+    second = f"ghost_{uuid.uuid4().hex[:12]}"
+    second_id, added = store_license_image(second, FileStorage(io.BytesIO(content), f"{second}_license.jpg"))
+    assert added is True
+    assert second_id != first_id
+    assert get_license_owners(second_id) == [second]
+    assert get_license_owners(first_id) is None
+
+def test_orphan_image_kept_for_grace_period(client, monkeypatch):
+    # A registration that stored its image but has not committed its user yet
+    username = f"ghost_{uuid.uuid4().hex[:12]}"
+    license_image_id, _ = store_license_image(
+        username, FileStorage(io.BytesIO(uuid.uuid4().hex.encode()), f"{username}_license.jpg")
+    )
+
+    sweep_orphan_license_images()
+    assert get_license_owners(license_image_id) == [username]
+
+    monkeypatch.setattr("app.licenses.LICENSE_ORPHAN_GRACE_SECONDS", 0)
+    sweep_orphan_license_images()
+    assert get_license_owners(license_image_id) is None
+
+def test_sweeper_drops_owners_without_user(client, monkeypatch):
+    content = uuid.uuid4().hex.encode()
+    username, token = register_and_login(client, content)
+    license_image_id = get_license_image_id(client, token)
+    ghost = f"ghost_{uuid.uuid4().hex[:12]}"
+    store_license_image(ghost, FileStorage(io.BytesIO(content), f"{ghost}_license.jpg"))
+    assert sorted(get_license_owners(license_image_id)) == sorted([username, ghost])
+
+    # Within the grace period the pending owner stays
+    sweep_orphan_license_images()
+    assert sorted(get_license_owners(license_image_id)) == sorted([username, ghost])
+
+    monkeypatch.setattr("app.licenses.LICENSE_ORPHAN_GRACE_SECONDS", 0)
+    sweep_orphan_license_images()
+    assert get_license_owners(license_image_id) == [username]
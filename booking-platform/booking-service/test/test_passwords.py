@@ -0,0 +1,33 @@
+# booking-service/tests/test_passwords.py
+
+import pytest
+from app.passwords import hash_password, check_password, get_password_hashing_stats, PasswordHasherBusy
+
+def test_hash_and_check():
+    hashed = hash_password("secret")
+    assert check_password(hashed, "secret")
+    assert not check_password(hashed, "not-the-secret")
+
+def test_login_when_hasher_busy(client, token, monkeypatch):
+    monkeypatch.setattr("app.passwords.PASSWORD_HASH_MAX_QUEUE", 0)
+    before = get_password_hashing_stats()
+
+    resp = client.post("/user/login", data={"username": "testuser", "password": "testpassword"})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+
+    after = get_password_hashing_stats()
+    assert after["rejected"] == before["rejected"] + 1
+    assert after["completed"] == before["completed"]
+
+def test_hash_timeout_is_busy(monkeypatch):
+    monkeypatch.setattr("app.passwords.PASSWORD_HASH_TIMEOUT_SECONDS", 0)
+    before = get_password_hashing_stats()
+
+    with pytest.raises(PasswordHasherBusy):
+        hash_password("secret")
+
+    after = get_password_hashing_stats()
+    assert after["rejected"] == before["rejected"] + 1
+    assert after["completed"] == before["completed"]
+    assert after["pending"] == 0
@@ -0,0 +1,143 @@
+# booking-service/tests/test_roads.py
+
+from app.slots import materialize_booking_horizon
+from test.helpers import next_hour, book, slot_capacity
+
+def close_road(client, admin_token, road_id, start_time, end_time):
+    return client.post(
+        f"/admin/roads/{road_id}/cancel-bookings",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json={"start_time": start_time, "end_time": end_time, "close_slots": True}
+    )
+
+def test_close_and_reopen_road(client, token, admin_token, new_road_id):
+    start_time, end_time = next_hour(26), next_hour(27)
+    assert book(client, token, new_road_id, start_time, 2).status_code == 200
+
+    resp = close_road(client, admin_token, new_road_id, start_time, end_time)
+    assert resp.status_code == 200
+    assert resp.get_json()["bookings_cancelled"] == 1
+    assert slot_capacity(new_road_id, start_time) == (0, 0)
+    assert book(client, token, new_road_id, start_time).status_code == 400
+
+    resp = client.post(
+        f"/admin/roads/{new_road_id}/reopen-slots",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json={"start_time": start_time, "end_time": end_time}
+    )
+    assert resp.status_code == 200
+    assert resp.get_json()["slots_reopened"] == 1
+    assert slot_capacity(new_road_id, start_time) == (10, 10)
+    assert book(client, token, new_road_id, start_time).status_code == 200
+
+def test_closed_road_wins_over_hold(client, token, admin_token, new_road_id):
+    start_time, end_time = next_hour(28), next_hour(29)
+    resp = client.post(
+        "/booking/holds",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"bookings": [{"road_id": new_road_id, "slots": [{"start_time": start_time}], "quantity": 2}]}
+    )
+    hold_id = resp.get_json()["hold_id"]
+
+    assert close_road(client, admin_token, new_road_id, start_time, end_time).status_code == 200
+
+    confirm = client.post(f"/booking/holds/{hold_id}/confirm", headers={"Authorization": f"Bearer {token}"}, json={})
+    assert confirm.status_code == 409
+    # The released hold does not reopen the slot
+    assert slot_capacity(new_road_id, start_time) == (0, 0)
+
+def test_reopen_requires_admin(client, token, new_road_id):
+    resp = client.post(
+        f"/admin/roads/{new_road_id}/reopen-slots",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"start_time": next_hour(30), "end_time": next_hour(31)}
+    )
+    assert resp.status_code == 403
+
+def test_reopen_invalid_range(client, admin_token, new_road_id):
+    resp = client.post(
+        f"/admin/roads/{new_road_id}/reopen-slots",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json={"start_time": next_hour(31), "end_time": next_hour(30)}
+    )
+    assert resp.status_code == 400
+
+def test_admin_delete_booking(client, token, admin_token, new_road_id):
+    start_time = next_hour(32)
+    booking_id = book(client, token, new_road_id, start_time, 3).get_json()["booking_id"]
+    assert slot_capacity(new_road_id, start_time) == (10, 7)
+
+    resp = client.delete(f"/admin/bookings/{booking_id}", headers={"Authorization": f"Bearer {admin_token}"})
+    assert resp.status_code == 200
+    assert slot_capacity(new_road_id, start_time) == (10, 10)
+
+    again = client.delete(f"/admin/bookings/{booking_id}", headers={"Authorization": f"Bearer {admin_token}"})
+    assert again.status_code == 404
+
+def test_slots_created_after_closure_stay_closed(client, token, admin_token, new_road_id):
+    # Nothing is booked yet, so none of these slots exist when the road closes
+    start_time, end_time = next_hour(34), next_hour(36)
+    assert close_road(client, admin_token, new_road_id, start_time, end_time).status_code == 200
+
+    materialize_booking_horizon()
+    assert slot_capacity(new_road_id, start_time) == (0, 0)
+    assert slot_capacity(new_road_id, next_hour(36)) == (10, 10)
+    assert book(client, token, new_road_id, next_hour(35)).status_code == 400
+
+    # Reopening part of the range leaves the rest closed
+    resp = client.post(
+        f"/admin/roads/{new_road_id}/reopen-slots",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json={"start_time": start_time, "end_time": next_hour(35)}
+    )
+    assert resp.get_json()["slots_reopened"] == 1
+    assert book(client, token, new_road_id, start_time).status_code == 200
+    assert book(client, token, new_road_id, next_hour(35)).status_code == 400
+
+def set_capacity(client, admin_token, road_id, hourly_capacity, dry_run=False):
+    return client.post(
+        "/admin/roads/capacity",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json={"road_ids": [road_id], "hourly_capacity": hourly_capacity, "dry_run": dry_run}
+    )
+
+def test_capacity_raise_propagates(client, token, admin_token, new_road_id):
+    start_time = next_hour(33)
+    assert book(client, token, new_road_id, start_time, 4).status_code == 200
+
+    resp = set_capacity(client, admin_token, new_road_id, 20)
+    assert resp.status_code == 200
+    assert resp.get_json()["slots_updated"] == 1
+    assert resp.get_json()["slots_clamped"] == 0
+    assert slot_capacity(new_road_id, start_time) == (20, 16)
+
+def test_capacity_cut_keeps_bookings(client, token, admin_token, new_road_id):
+    start_time = next_hour(34)
+    assert book(client, token, new_road_id, start_time, 6).status_code == 200
+
+    resp = set_capacity(client, admin_token, new_road_id, 4)
+    assert resp.status_code == 200
+    assert resp.get_json()["slots_clamped"] == 1
+    # Booked above the new capacity: nothing is taken away, nothing is left
+    assert slot_capacity(new_road_id, start_time) == (6, 0)
+    assert book(client, token, new_road_id, start_time).status_code == 400
+
+def test_capacity_skips_closed_slots(client, token, admin_token, new_road_id):
+    start_time = next_hour(35)
+    assert book(client, token, new_road_id, start_time).status_code == 200
+    close_road(client, admin_token, new_road_id, start_time, next_hour(36))
+
+    assert set_capacity(client, admin_token, new_road_id, 15).status_code == 200
+    assert slot_capacity(new_road_id, start_time) == (0, 0)
+
+def test_capacity_dry_run(client, token, admin_token, new_road_id):
+    start_time = next_hour(37)
+    assert book(client, token, new_road_id, start_time, 2).status_code == 200
+
+    resp = set_capacity(client, admin_token, new_road_id, 5, dry_run=True)
+    assert resp.status_code == 200
+    assert resp.get_json()["dry_run"] is True
+    assert slot_capacity(new_road_id, start_time) == (10, 8)
+
+def test_capacity_invalid(client, admin_token, new_road_id):
+    assert set_capacity(client, admin_token, new_road_id, 0).status_code == 400
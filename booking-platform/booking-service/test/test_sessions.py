@@ -0,0 +1,70 @@
+# booking-service/tests/test_sessions.py
+
+import uuid
+from flask_jwt_extended import decode_token
+from app.sessions import validate_session, delete_session, save_session
+from test.helpers import register_and_login, login
+
+def test_logout_ends_session(client):
+    resp = client.post("/user/login", data={"username": "testuser", "password": "testpassword"})
+    token = resp.get_json()["access_token"]
+
+    assert client.get("/user/profile", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert client.post("/user/logout", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert client.get("/user/profile", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+
+def test_cached_session_dropped_on_revocation(client, token):
+    session = validate_session("testuser")
+    assert session
+    # Served from the in-process cache now
+    assert validate_session("testuser") == session
+
+    delete_session("testuser")
+    assert validate_session("testuser") is None
+
+    # Logging in again gives a fresh session
+    save_session("testuser", session)
+    assert validate_session("testuser") == session
+
+def test_unknown_session(client):
+    assert validate_session("nobody-logged-in") is None
+
+def test_token_claims(app, client):
+    _, token = register_and_login(client)
+    with app.app_context():
+        claims = decode_token(token)
+    assert claims["user_id"]
+    assert claims["is_admin"] is False
+
+def test_admin_routes_need_admin(client):
+    _, token = register_and_login(client)
+    resp = client.get("/admin/roads", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 403
+
+def test_role_change_needs_new_login(client, admin_token):
+    username, token = register_and_login(client)
+
+    resp = client.put(
+        f"/admin/users/{username}/role",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json={"is_admin": True}
+    )
+    assert resp.status_code == 200
+
+    # The token still claims the old role
+    assert client.get("/user/profile", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+
+    new_token = login(client, username)
+    assert client.get("/admin/roads", headers={"Authorization": f"Bearer {new_token}"}).status_code == 200
+
+def test_role_change_unknown_user(client, admin_token):
+    resp = client.put(
+        f"/admin/users/nobody_{uuid.uuid4().hex[:8]}/role",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json={"is_admin": True}
+    )
+    assert resp.status_code == 404
+
+def test_role_change_without_role(client, admin_token):
+    resp = client.put("/admin/users/testuser/role", headers={"Authorization": f"Bearer {admin_token}"}, json={})
+    assert resp.status_code == 400
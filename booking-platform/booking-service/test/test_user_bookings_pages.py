@@ -0,0 +1,77 @@
+# booking-service/tests/test_user_bookings_pages.py
+
+from app.db import get_cockroach_connection, release_cockroach_connection
+from app.booking_summary import upgrade_booking_summaries
+from test.helpers import next_hour, book, register_and_login
+
+def test_user_bookings_pages(client, new_road_id):
+    # A user of its own, so the pages hold only this test's bookings
+    _, token = register_and_login(client)
+    booking_ids = [book(client, token, new_road_id, next_hour(40 + offset)).get_json()["booking_id"] for offset in range(5)]
+
+    seen = []
+    cursor = None
+    for _ in range(3):
+        url = "/booking/user-bookings?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        resp = client.get(url, headers={"Authorization": f"Bearer {token}"})
+        assert resp.status_code == 200
+        seen += [booking["booking_id"] for booking in resp.get_json()]
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert cursor is None
+    # Newest first, each booking exactly once
+    assert seen == list(reversed(booking_ids))
+
+def test_user_bookings_without_summary(client, new_road_id):
+    _, token = register_and_login(client)
+    booking_id = book(client, token, new_road_id, next_hour(46)).get_json()["booking_id"]
+
+    # As left by a booking the backfill has not reached yet
+    conn = get_cockroach_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE bookings SET line_count = 0, road_count = 0, quantity = 0, start_time = NULL, end_time = NULL
+        WHERE booking_id = %s
+    """, (booking_id,))
+    conn.commit()
+    release_cockroach_connection(conn)
+
+    resp = client.get("/booking/user-bookings?upcoming=true", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 200
+    bookings = resp.get_json()
+    assert [booking["booking_id"] for booking in bookings] == [booking_id]
+    assert bookings[0]["booking_count"] == 1
+    assert bookings[0]["start_time"] == next_hour(46)
+
+def test_summary_backfill(client, new_road_id):
+    _, token = register_and_login(client)
+    booking_id = book(client, token, new_road_id, next_hour(47)).get_json()["booking_id"]
+
+    conn = get_cockroach_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE bookings SET line_count = 0, road_count = 0, quantity = 0, start_time = NULL, end_time = NULL
+        WHERE booking_id = %s
+    """, (booking_id,))
+    conn.commit()
+
+    # Safe to run on every start
+    assert upgrade_booking_summaries() >= 1
+    upgrade_booking_summaries()
+
+    cursor.execute("SELECT line_count, road_count, quantity, start_time FROM bookings WHERE booking_id = %s", (booking_id,))
+    line_count, road_count, quantity, start_time = cursor.fetchone()
+    conn.commit()
+    release_cockroach_connection(conn)
+    assert (line_count, road_count, quantity) == (1, 1, 1)
+    assert start_time.isoformat() == next_hour(47)
+
+def test_user_bookings_invalid_cursor(client, token):
+    resp = client.get("/booking/user-bookings?cursor=not-a-cursor", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 400
+
+def test_user_bookings_invalid_limit(client, token):
+    resp = client.get("/booking/user-bookings?limit=0", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 400
@@ -6,3 +6,12 @@ db.createCollection("user_licenses");
 
 // Ensure username is unique
 db.users.createIndex({ "username": 1 }, { unique: true });
+
+// Renditions of a license image are looked up by their original
+db.getCollection("license_images.files").createIndex({ "metadata.source_id": 1, "metadata.size": 1 });
+
+// License images are stored once per content hash
+db.getCollection("license_images.files").createIndex(
+    { "metadata.sha256": 1 },
+    { unique: true, partialFilterExpression: { "metadata.sha256": { $exists: true } } }
+);
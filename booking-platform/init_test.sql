@@ -70,13 +70,29 @@ CREATE TABLE IF NOT EXISTS road_booking_slots (
     CHECK (capacity >= available_capacity)
 );
 
+-- Closed time ranges of roads; slots created inside one start at zero capacity
+CREATE TABLE IF NOT EXISTS road_closures (
+    closure_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    road_id UUID NOT NULL REFERENCES roads(id),
+    start_time TIMESTAMP NOT NULL,
+    end_time TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CHECK (end_time > start_time)
+);
+
 -- Create bookings table
 CREATE TABLE IF NOT EXISTS bookings (
     booking_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     user_id UUID NOT NULL REFERENCES users(id),
     origin TEXT NOT NULL,
     destination TEXT NOT NULL,
-    booking_timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    booking_timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- Summary of the booking lines, written together with them
+    start_time TIMESTAMP,
+    end_time TIMESTAMP,
+    line_count INTEGER NOT NULL DEFAULT 0,
+    road_count INTEGER NOT NULL DEFAULT 0,
+    quantity INTEGER NOT NULL DEFAULT 0
 );
 
 -- Create booking_lines table (replacing booking_segments)
@@ -92,9 +108,14 @@ CREATE TABLE IF NOT EXISTS booking_lines (
 CREATE INDEX IF NOT EXISTS road_booking_slots_road_id_idx ON road_booking_slots(road_id);
 CREATE INDEX IF NOT EXISTS road_booking_slots_time_idx ON road_booking_slots(slot_time);
 CREATE INDEX IF NOT EXISTS road_booking_slots_availability_idx ON road_booking_slots(available_capacity);
+-- One slot per road and hour, also the lookup index for (road_id, slot_time)
+CREATE UNIQUE INDEX IF NOT EXISTS road_booking_slots_road_time_key ON road_booking_slots(road_id, slot_time);
+CREATE INDEX IF NOT EXISTS road_closures_road_time_idx ON road_closures(road_id, start_time);
 
 CREATE INDEX IF NOT EXISTS bookings_user_id_idx ON bookings(user_id);
 CREATE INDEX IF NOT EXISTS bookings_time_idx ON bookings(booking_timestamp);
+-- Keyset pagination of a user's bookings, newest first
+CREATE INDEX IF NOT EXISTS bookings_user_time_idx ON bookings(user_id, booking_timestamp DESC, booking_id DESC);
 
 CREATE INDEX IF NOT EXISTS booking_lines_booking_id_idx ON booking_lines(booking_id);
 CREATE INDEX IF NOT EXISTS booking_lines_slot_id_idx ON booking_lines(road_booking_slot_id);